@@ -1,13 +1,31 @@
 import os
+from collections import namedtuple
+from functools import partial
+import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
-from matplotlib.backends.backend_pdf import PdfPages
-from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-from reportlab.lib.styles import getSampleStyleSheet
-from reportlab.lib import colors
-import PyPDF2
+from visits import Runs, count_runs, mean_per_label, runs_from_codes, total_per_label
+from instrumentation import lap
+from rendering import render_to_bytes, write_pdf
+from downsampling import DEFAULT_POINT_BUDGET, categorical_indices, rasterize_layer
+
+# Every aggregate of the eye-tracking report, computed in one pass by aggregate_eye_tracking.
+# shelves/aois: label of each shelf and AOI code (pandas.Index). shelf_order/aoi_order: codes in the order the
+# labels first appear (value_counts order of ties). Matrices (shelf x AOI) and vectors (by AOI or shelf code):
+# samples, observation time (sum of the rounded time deltas), velocity sums and counts, fixation and saccade samples,
+# fixation durations and fixation events. Runs: visits to each AOI, shelf and (shelf, AOI) pair, and the visits of
+# the mean visit time, where every AOI visit is split by the shelves of its rows (starts/ends: first and last row
+# of each shelf in the AOI visit).
+EyeTrackingAggregates = namedtuple('EyeTrackingAggregates', [
+    'shelves', 'aois', 'shelf_order', 'aoi_order',
+    'samples', 'aoi_samples', 'shelf_samples',
+    'observation_time', 'aoi_observation_time', 'shelf_observation_time',
+    'velocity_sum', 'velocity_count', 'aoi_velocity_sum', 'aoi_velocity_count',
+    'fixation_samples', 'saccade_samples', 'total_fixation_time', 'total_saccade_time',
+    'duration_samples', 'fixation_duration_sum', 'fixation_duration_count',
+    'event_count', 'event_duration',
+    'aoi_runs', 'shelf_runs', 'pair_runs', 'aoi_shelf_visits',
+    'fixation_events', 'fixation_timeline',
+])
 
 def ensure_directory_exists(directory):
     """
@@ -19,65 +37,247 @@ def ensure_directory_exists(directory):
     if not os.path.exists(directory):
         os.makedirs(directory)
 
-def generate_graphs(df, graphics_pdf_path):
+def extract_fixation_events(df):
     """
-    Generates various graphs based on the provided DataFrame and saves them to a PDF.
+    Builds the fixation events table: one row per fixation, pairing each 'fixation_end' row with the last
+    'fixation_start' row before it, as the I-DT output is read sequentially.
 
     Parameters:
-    df (pandas.DataFrame): The DataFrame containing the data to plot.
-    graphics_pdf_path (str): The file path to save the generated PDF.
-    """
-
-    # Calculate time spent in each frame
-    df['Time_Delta'] = df['Timestamp'].diff().fillna(0)
+    df (pandas.DataFrame): The eye-tracking data with the 'fixation_start' and 'fixation_end' columns.
 
-    # Identify continuous blocks (visits) for AOI
-    df['AOI_Shifted'] = df['Product/AOI'].shift(1)
-    df['New_AOI_Visit'] = df['Product/AOI'] != df['AOI_Shifted']
-    df['AOI_Visit_ID'] = df['New_AOI_Visit'].cumsum()
-
-    # Identify continuous blocks (visits) for Shelf
-    df['Shelf_Shifted'] = df['Section/Shelf'].shift(1)
-    df['New_Shelf_Visit'] = df['Section/Shelf'] != df['Shelf_Shifted']
-    df['Shelf_Visit_ID'] = df['New_Shelf_Visit'].cumsum()
+    Returns:
+    pandas.DataFrame: Fixation events with start/end frame, start/end time, duration, AOI, shelf and
+    centroid of the gaze hits ('RCHit_x/y/z') between the start and the end of the fixation.
+    """
+    starts = np.flatnonzero(df['fixation_start'].to_numpy() == 1)
+    # A row flagged as start and end at the same time only opens a fixation
+    ends = np.flatnonzero((df['fixation_end'].to_numpy() == 1) & (df['fixation_start'].to_numpy() != 1))
+
+    # Each end closes the last start before it, and only once
+    opening = np.searchsorted(starts, ends, side='right') - 1
+    valid = opening >= 0
+    ends, opening = ends[valid], opening[valid]
+    first_close = np.unique(opening, return_index=True)[1]
+    starts, ends = starts[opening[first_close]], ends[first_close]
+
+    timestamps = df['Timestamp'].to_numpy()
+    frames = df['Frame'].to_numpy()
+    events = pd.DataFrame({
+        'Start_Frame': frames[starts],
+        'End_Frame': frames[ends],
+        'Start_Time': timestamps[starts],
+        'End_Time': timestamps[ends],
+        'fixation_duration': timestamps[ends] - timestamps[starts],
+        'Section/Shelf': df['Section/Shelf'].to_numpy()[starts],
+        'Product/AOI': df['Product/AOI'].to_numpy()[starts],
+    })
+
+    # Centroid of the gaze hits of every fixation, from cumulative sums of the coordinates
+    for axis in ['x', 'y', 'z']:
+        cumulative = np.concatenate([[0.0], np.cumsum(df[f'RCHit_{axis}'].to_numpy(dtype=float))])
+        events[f'Centroid_{axis}'] = (cumulative[ends + 1] - cumulative[starts]) / (ends - starts + 1)
+
+    return events
+
+def _encode_labels(column):
+    # Categorical columns keep all their categories, so that value_counts-like counts include the unobserved ones
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        labels = pd.Index(np.asarray(column.cat.categories), name=column.name)
+        return column.cat.codes.to_numpy().astype(np.int64), labels, np.arange(len(labels))
+    codes, uniques = pd.factorize(column, sort=True)
+    labels = pd.Index(np.asarray(uniques), name=column.name)
+    present = np.flatnonzero(np.bincount(codes[codes >= 0], minlength=len(labels)))
+    first_rows = np.full(len(labels), len(codes))
+    np.minimum.at(first_rows, codes[codes >= 0], np.flatnonzero(codes >= 0))
+    return codes.astype(np.int64), labels, present[np.argsort(first_rows[present], kind='stable')]
+
+def _freeze(array):
+    array.flags.writeable = False
+    return array
+
+def aggregate_eye_tracking(df, fixation_events=None):
+    """
+    Computes every count, dwell, visit, velocity and fixation aggregate of the eye-tracking report in one pass.
+    The Section/Shelf and Product/AOI labels are encoded as integer codes once, and every aggregate is a bincount
+    over the codes, so both the graphics and the statistics are built from the same result.
 
-    # Identify continuous blocks (visits) for AOI by Shelf
-    df['AOI_Shelf_Shifted'] = df['Product/AOI'] + df['Section/Shelf']
-    df['New_AOI_Shelf_Visit'] = df['AOI_Shelf_Shifted'].shift(1) != df['AOI_Shelf_Shifted']
-    df['AOI_Shelf_Visit_ID'] = df['New_AOI_Shelf_Visit'].cumsum()
+    Parameters:
+    df (pandas.DataFrame): The eye-tracking data with fixations.
+    fixation_events (pandas.DataFrame, optional): Fixation events table. Extracted from df if not given.
 
-    # Calculate the number of visits per AOI
-    aoi_counts = df.groupby('AOI_Visit_ID')['Product/AOI'].first().value_counts()
+    Returns:
+    EyeTrackingAggregates: The aggregates. The arrays are read-only.
+    """
+    if fixation_events is None:
+        fixation_events = extract_fixation_events(df)
+
+    shelf_codes, shelves, shelf_order = _encode_labels(df['Section/Shelf'])
+    aoi_codes, aois, aoi_order = _encode_labels(df['Product/AOI'])
+    n_shelves, n_aois = len(shelves), len(aois)
+
+    # (shelf, AOI) pair of every row, -1 if any of the labels is missing
+    paired = (shelf_codes >= 0) & (aoi_codes >= 0)
+    pair_codes = np.where(paired, shelf_codes * n_aois + aoi_codes, -1)
+    has_aoi = aoi_codes >= 0
+    has_shelf = shelf_codes >= 0
+
+    def per_pair(weights=None, mask=paired):
+        return np.bincount(pair_codes[mask], weights=None if weights is None else weights[mask],
+                           minlength=n_shelves * n_aois).reshape(n_shelves, n_aois)
+
+    def per_label(codes, n_labels, weights=None, mask=None):
+        return np.bincount(codes[mask], weights=None if weights is None else weights[mask], minlength=n_labels)
+
+    time_diff = df['Timestamp'].diff().fillna(0).round(2).to_numpy(dtype=float)
+    velocity = (((df['RCHit_x'].diff()**2 + df['RCHit_y'].diff()**2 + df['RCHit_z'].diff()**2)**0.5) / df['Timestamp'].diff()).to_numpy(dtype=float)
+    has_velocity = ~np.isnan(velocity)
+    fixation = df['fixation'].to_numpy()
+    is_fixation = fixation == 1
+    is_saccade = fixation == 0
+    duration = df['fixation_duration'].to_numpy(dtype=float)
+    with_duration = duration != 0
+    has_duration = with_duration & ~np.isnan(duration)
+
+    # Visits: runs of consecutive rows with the same AOI, shelf or (shelf, AOI) pair
+    present_pairs = np.unique(pair_codes[paired])
+    pair_labels = pd.MultiIndex.from_arrays([shelves[present_pairs // n_aois], aois[present_pairs % n_aois]],
+                                            names=['Section/Shelf', 'Product/AOI'])
+    pair_run_codes = np.full(len(df), -1, dtype=np.int64)
+    pair_run_codes[paired] = np.searchsorted(present_pairs, pair_codes[paired])
+    timestamps = df['Timestamp'].to_numpy(dtype=float)
+    aoi_runs = runs_from_codes(aoi_codes, aois, timestamps)
+
+    # AOI visits split by shelf, the rows of a shelf need not be consecutive within the visit
+    paired_rows = np.flatnonzero(paired)
+    visit_keys = np.repeat(np.arange(len(aoi_runs.starts)), aoi_runs.ends - aoi_runs.starts + 1)[paired_rows] * n_shelves + shelf_codes[paired_rows]
+    _, first_rows = np.unique(visit_keys, return_index=True)
+    _, last_rows = np.unique(visit_keys[::-1], return_index=True)
+    visit_starts, visit_ends = paired_rows[first_rows], paired_rows[len(paired_rows) - 1 - last_rows]
+    aoi_shelf_visits = Runs(visit_starts, visit_ends, pair_run_codes[visit_starts], pair_labels, timestamps[visit_ends] - timestamps[visit_starts],
+                            timestamps[visit_ends] - timestamps[np.maximum(visit_starts - 1, 0)])
+
+    event_pairs = shelves.get_indexer(fixation_events['Section/Shelf']) * n_aois + aois.get_indexer(fixation_events['Product/AOI'])
+    event_paired = (shelves.get_indexer(fixation_events['Section/Shelf']) >= 0) & (aois.get_indexer(fixation_events['Product/AOI']) >= 0)
+    event_durations = fixation_events['fixation_duration'].to_numpy(dtype=float)
+
+    return EyeTrackingAggregates(
+        shelves=shelves, aois=aois, shelf_order=_freeze(shelf_order), aoi_order=_freeze(aoi_order),
+        samples=_freeze(per_pair()),
+        aoi_samples=_freeze(per_label(aoi_codes, n_aois, mask=has_aoi)),
+        shelf_samples=_freeze(per_label(shelf_codes, n_shelves, mask=has_shelf)),
+        observation_time=_freeze(per_pair(time_diff)),
+        aoi_observation_time=_freeze(per_label(aoi_codes, n_aois, time_diff, has_aoi)),
+        shelf_observation_time=_freeze(per_label(shelf_codes, n_shelves, time_diff, has_shelf)),
+        velocity_sum=_freeze(per_pair(velocity, paired & has_velocity)),
+        velocity_count=_freeze(per_pair(mask=paired & has_velocity)),
+        aoi_velocity_sum=_freeze(per_label(aoi_codes, n_aois, velocity, has_aoi & has_velocity)),
+        aoi_velocity_count=_freeze(per_label(aoi_codes, n_aois, mask=has_aoi & has_velocity)),
+        fixation_samples=_freeze(per_pair(mask=paired & is_fixation)),
+        saccade_samples=_freeze(per_pair(mask=paired & is_saccade)),
+        total_fixation_time=float(time_diff[is_fixation].sum()),
+        total_saccade_time=float(time_diff[is_saccade].sum()),
+        duration_samples=_freeze(per_pair(mask=paired & with_duration)),
+        fixation_duration_sum=_freeze(per_pair(duration, paired & has_duration)),
+        fixation_duration_count=_freeze(per_pair(mask=paired & has_duration)),
+        event_count=_freeze(np.bincount(event_pairs[event_paired], minlength=n_shelves * n_aois).reshape(n_shelves, n_aois)),
+        event_duration=_freeze(np.bincount(event_pairs[event_paired], weights=event_durations[event_paired],
+                                           minlength=n_shelves * n_aois).reshape(n_shelves, n_aois)),
+        aoi_runs=aoi_runs,
+        shelf_runs=runs_from_codes(shelf_codes, shelves, timestamps),
+        pair_runs=runs_from_codes(pair_run_codes, pair_labels, timestamps),
+        aoi_shelf_visits=aoi_shelf_visits,
+        fixation_events=fixation_events,
+        fixation_timeline=df[['Timestamp', 'fixation']].reset_index(drop=True),
+    )
 
-    # Calculate the number of visits per Section/Shelf
-    section_counts = df.groupby('Shelf_Visit_ID')['Section/Shelf'].first().value_counts()
+def _pair_matrix(aggregates, values, present):
+    # As a groupby of the observed (shelf, AOI) pairs unstacked with zeros
+    rows, columns = present.any(axis=1), present.any(axis=0)
+    values = np.where(present, values, 0)
+    if values.dtype.kind == 'f':
+        values = np.nan_to_num(values, nan=0.0, posinf=np.inf, neginf=-np.inf)
+    return pd.DataFrame(values[rows][:, columns], index=aggregates.shelves[rows], columns=aggregates.aois[columns])
+
+def _mean(sums, counts):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return sums / counts
+
+def _value_counts(counts, labels, order, normalize=False):
+    # As value_counts: labels in the order they are first seen, then sorted by count
+    counts = pd.Series(counts[order], index=labels[order], name='proportion' if normalize else 'count')
+    if normalize:
+        counts = counts / counts.sum()
+    return counts.sort_values(ascending=False)
+
+def _per_label_series(labels, values, present, name):
+    return pd.Series(values[present], index=labels[present], name=name)
+
+def compute_graph_metrics(df, fixation_events=None, aggregates=None):
+    """
+    Computes the tables plotted in the graphics PDF, so that the rendering does not need the raw data.
 
-    # Calculate the number of visits per Section/Shelf for each AOI
-    aoi_section_counts = df.groupby(['Section/Shelf', 'Product/AOI'])['AOI_Shelf_Visit_ID'].nunique().unstack().fillna(0)
+    Parameters:
+    df (pandas.DataFrame): The eye-tracking data with fixations.
+    fixation_events (pandas.DataFrame, optional): Fixation events table. Extracted from df if not given.
+    aggregates (EyeTrackingAggregates, optional): The aggregates of df. Computed if not given.
 
-    # Calculate the total time spent per visit in each AOI
-    aoi_visit_time = df.groupby('AOI_Visit_ID')['Time_Delta'].sum().reset_index()
-    aoi_visit_time = aoi_visit_time.merge(df[['AOI_Visit_ID', 'Product/AOI']].drop_duplicates(), on='AOI_Visit_ID')
-    aoi_visit_time = aoi_visit_time.groupby('Product/AOI')['Time_Delta'].sum()
+    Returns:
+    dict: The tables plotted by render_graphs.
+    """
+    if aggregates is None:
+        aggregates = aggregate_eye_tracking(df, fixation_events)
+    mean_velocity = _mean(aggregates.velocity_sum, aggregates.velocity_count)
+
+    return {
+        # Number of visits per AOI, per Section/Shelf and per Section/Shelf for each AOI
+        'aoi_counts': count_runs(aggregates.aoi_runs).sort_values(ascending=False, kind='stable'),
+        'section_counts': count_runs(aggregates.shelf_runs).sort_values(ascending=False, kind='stable'),
+        'aoi_section_counts': count_runs(aggregates.pair_runs).unstack().fillna(0),
+        # Total time spent per visit in each AOI, Shelf and AOI by Shelf
+        'aoi_visit_time': total_per_label(aggregates.aoi_runs),
+        'shelf_visit_time': total_per_label(aggregates.shelf_runs),
+        'aoi_shelf_visit_time': total_per_label(aggregates.pair_runs).unstack().fillna(0),
+        # Mean velocity in AOI
+        'mean_velocity_aoi': _pair_matrix(aggregates, mean_velocity, aggregates.samples > 0).round(2),
+        'fixation_timeline': aggregates.fixation_timeline,
+        'fixation_events': aggregates.fixation_events[['Product/AOI', 'fixation_duration']],
+    }
+
+def generate_graphs(df, graphics_pdf_path, fixation_events=None):
+    """
+    Generates various graphs based on the provided DataFrame and saves them to a PDF.
 
-    # Calculate the total time spent per visit in each Shelf
-    shelf_visit_time = df.groupby('Shelf_Visit_ID')['Time_Delta'].sum().reset_index()
-    shelf_visit_time = shelf_visit_time.merge(df[['Shelf_Visit_ID', 'Section/Shelf']].drop_duplicates(), on='Shelf_Visit_ID')
-    shelf_visit_time = shelf_visit_time.groupby('Section/Shelf')['Time_Delta'].sum()
+    Parameters:
+    df (pandas.DataFrame): The DataFrame containing the data to plot.
+    graphics_pdf_path (str): The file path to save the generated PDF.
+    fixation_events (pandas.DataFrame, optional): Fixation events table. Extracted from df if not given.
+    """
+    render_graphs(compute_graph_metrics(df, fixation_events), graphics_pdf_path)
 
-    # Calculate the total time spent per visit in each AOI by Shelf
-    aoi_shelf_visit_time = df.groupby('AOI_Shelf_Visit_ID')['Time_Delta'].sum().reset_index()
-    aoi_shelf_visit_time = aoi_shelf_visit_time.merge(df[['AOI_Shelf_Visit_ID', 'Section/Shelf', 'Product/AOI']].drop_duplicates(), on='AOI_Shelf_Visit_ID')
-    aoi_shelf_visit_time = aoi_shelf_visit_time.groupby(['Section/Shelf', 'Product/AOI'])['Time_Delta'].sum().unstack().fillna(0)
+def render_graphs(metrics, graphics_pdf_path, point_budget=DEFAULT_POINT_BUDGET, rasterize=None):
+    """
+    Plots the tables computed by compute_graph_metrics and saves them to a PDF.
 
-    # Additional statistics for new requests
-    df.loc[:, 'Time_Diff'] = df['Timestamp'].diff().fillna(0)
-    total_observation_time = df.groupby('Product/AOI')['Time_Diff'].sum()
-    total_observation_time_by_section = df.groupby(['Section/Shelf', 'Product/AOI'])['Time_Diff'].sum().unstack(fill_value=0)
+    Parameters:
+    metrics (dict): The tables returned by compute_graph_metrics.
+    graphics_pdf_path (str or file object): The file path or binary file object to save the generated PDF.
+    point_budget (int, optional): Maximum number of points of the temporal graph of fixations, about one per fixation
+                                  state and time bucket, None to plot every sample.
+    rasterize (bool, optional): Whether to rasterize the points of the temporal graph, automatic if None.
+    """
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+    from matplotlib.backends.backend_pdf import PdfPages
     
-    # Mean velocity in AOI
-    df.loc[:, 'Velocity'] = ((df['RCHit_x'].diff()**2 + df['RCHit_y'].diff()**2 + df['RCHit_z'].diff()**2)**0.5) / df['Timestamp'].diff()
-    mean_velocity_aoi = df.groupby(['Section/Shelf', 'Product/AOI'])['Velocity'].mean().unstack(fill_value=0).fillna(0).round(2)
+    aoi_counts = metrics['aoi_counts']
+    section_counts = metrics['section_counts']
+    aoi_section_counts = metrics['aoi_section_counts']
+    aoi_visit_time = metrics['aoi_visit_time']
+    shelf_visit_time = metrics['shelf_visit_time']
+    aoi_shelf_visit_time = metrics['aoi_shelf_visit_time']
+    mean_velocity_aoi = metrics['mean_velocity_aoi']
+    fixation_timeline = metrics['fixation_timeline']
+    fixation_events = metrics['fixation_events']
 
     with PdfPages(graphics_pdf_path) as pdf:
 
@@ -93,6 +293,7 @@ def generate_graphs(df, graphics_pdf_path):
         plt.tight_layout()
         pdf.savefig()
         plt.close()
+        lap('Number of Visits per AOI')
 
         # Number of visits per Section/Shelf
         plt.figure(figsize=(10, 6))
@@ -106,6 +307,7 @@ def generate_graphs(df, graphics_pdf_path):
         plt.tight_layout()
         pdf.savefig()
         plt.close()
+        lap('Number of Visits per Section/Shelf')
 
         # Number of visits per Section/Shelf for each AOI
         fig, ax = plt.subplots(figsize=(12, 8))
@@ -119,6 +321,7 @@ def generate_graphs(df, graphics_pdf_path):
         plt.tight_layout()
         pdf.savefig()
         plt.close()
+        lap('Number of Visits per Section/Shelf for each AOI')
 
         # AOI visit time
         plt.figure(figsize=(10, 6))
@@ -130,6 +333,7 @@ def generate_graphs(df, graphics_pdf_path):
         plt.tight_layout()
         pdf.savefig()
         plt.close()
+        lap('Total Time Spent per AOI')
 
         # Plot the total time spent in each Section/Shelf
         plt.figure(figsize=(10, 6))
@@ -141,6 +345,7 @@ def generate_graphs(df, graphics_pdf_path):
         plt.tight_layout()
         pdf.savefig()
         plt.close()
+        lap('Total Time Spent per Section/Shelf')
 
         # Plot the total time spent per Section/Shelf for each AOI
         plt.figure(figsize=(12, 8))
@@ -152,6 +357,7 @@ def generate_graphs(df, graphics_pdf_path):
         plt.tight_layout()
         pdf.savefig()
         plt.close()
+        lap('Total Time Spent per Section/Shelf for each AOI')
 
         # Mean velocity per AOI by Section/Shelf
         plt.figure(figsize=(12, 8))
@@ -163,32 +369,144 @@ def generate_graphs(df, graphics_pdf_path):
         plt.tight_layout()
         pdf.savefig()
         plt.close()
+        lap('Mean Velocity per AOI by Section/Shelf')
 
         # Temporal graph of fixations over time
         plt.figure(figsize=(10, 6))
-        plt.plot(df['Timestamp'], df['fixation'], linestyle='None', marker='o', markersize=2)
+        fixation_timeline = fixation_timeline.iloc[categorical_indices(fixation_timeline['Timestamp'], fixation_timeline['fixation'], point_budget)]
+        plt.plot(fixation_timeline['Timestamp'], fixation_timeline['fixation'], linestyle='None', marker='o', markersize=2,
+                 rasterized=rasterize_layer(len(fixation_timeline), rasterize))
         plt.title('Temporal Graph of Fixations')
         plt.xlabel('Timestamp')
         plt.ylabel('Fixation (1=True, 0=False)')
         plt.tight_layout()
         pdf.savefig()
         plt.close()
+        lap('Temporal Graph of Fixations')
+
+        # Duration of the fixations in each AOI
+        plt.figure(figsize=(10, 6))
+        sns.boxplot(data=fixation_events, x='Product/AOI', y='fixation_duration')
+        plt.title('Fixation Duration per AOI')
+        plt.xlabel('AOI')
+        plt.ylabel('Fixation Duration (seconds)')
+        plt.xticks(rotation=45, ha='right')
+        plt.tight_layout()
+        pdf.savefig()
+        plt.close()
+        lap('Fixation Duration per AOI')
 
-def create_statistics_pdf(df, aoi_counts, aoi_section_counts, aoi_percentages, section_counts, total_observation_time, total_observation_time_by_section, total_observation_time_by_section_agg, mean_visit_time, mean_velocity_aoi, 
-                          mean_velocity_type, fixation_counts, saccade_counts, total_fixation_time, total_saccade_time, fixation_percentage, 
-                          saccade_percentage, mean_fixation_duration, statistics_pdf_path):
+def compute_statistics_metrics(df, fixation_events=None, aggregates=None):
     """
-    Creates a PDF document containing various statistics tables.
+    Computes the statistics tables of the report, so that the rendering does not need the raw data.
 
     Parameters:
-    df (pandas.DataFrame): The DataFrame containing the data.
-    aoi_counts, aoi_section_counts, aoi_percentages, section_counts, total_observation_time, total_observation_time_by_section, 
-    total_observation_time_by_section_agg, mean_visit_time, mean_velocity_aoi, mean_velocity_type, fixation_counts, 
-    saccade_counts, total_fixation_time, total_saccade_time, fixation_percentage, saccade_percentage, mean_fixation_duration: Statistics data obtained from collected VR data.
-    statistics_pdf_path (str): The file path to save the generated PDF.
+    df (pandas.DataFrame): The eye-tracking data with fixations.
+    fixation_events (pandas.DataFrame, optional): Fixation events table. Extracted from df if not given.
+    aggregates (EyeTrackingAggregates, optional): The aggregates of df. Computed if not given.
+
+    Returns:
+    dict: The statistics tables rendered by create_statistics_pdf.
     """
-    
-    ensure_directory_exists(os.path.dirname(statistics_pdf_path))
+    if aggregates is None:
+        aggregates = aggregate_eye_tracking(df, fixation_events)
+    shelves, aois = aggregates.shelves, aggregates.aois
+    observed = aggregates.samples > 0
+
+    # Mean visit time calculation, a visit being a block of consecutive rows with the same AOI, split by Section/Shelf
+    visit_runs = aggregates.aoi_shelf_visits._replace(durations=aggregates.aoi_shelf_visits.durations.round(2))
+
+    # Fixation and saccade statistics
+    total_fixation_time = aggregates.total_fixation_time
+    total_saccade_time = aggregates.total_saccade_time
+    total_time = total_fixation_time + total_saccade_time
+
+    # Count and observation time of each Section/Shelf and AOI, including the pairs never observed
+    aoi_section_counts = _pair_matrix(aggregates, aggregates.samples, observed).stack()
+    observation_time_by_section = _pair_matrix(aggregates, aggregates.observation_time, observed).stack()
+    section_table = aoi_section_counts.reset_index(name='Count')
+    section_table['Total Observation Time (s)'] = observation_time_by_section.to_numpy()
+
+    # Number of fixations and their total duration, for the pairs with fixations
+    event_pairs = np.flatnonzero(aggregates.event_count.ravel())
+    fixation_table = pd.DataFrame({
+        'Section/Shelf': shelves[event_pairs // len(aois)],
+        'Product/AOI': aois[event_pairs % len(aois)],
+        'Total Fixation Duration': aggregates.event_duration.ravel()[event_pairs].round(2),
+        'Fixation Times': aggregates.event_count.ravel()[event_pairs],
+    })
+
+    aoi_present = aggregates.aoi_samples > 0
+    shelf_present = aggregates.shelf_samples > 0
+    return {
+        'aoi_counts': _value_counts(aggregates.aoi_samples, aois, aggregates.aoi_order),
+        'aoi_percentages': _value_counts(aggregates.aoi_samples, aois, aggregates.aoi_order, normalize=True).round(2) * 100,
+        'section_counts': _value_counts(aggregates.shelf_samples, shelves, aggregates.shelf_order),
+        'aoi_section_counts': aoi_section_counts.round(2),
+        'total_observation_time': _per_label_series(aois, aggregates.aoi_observation_time, aoi_present, 'Timestamp').round(2),
+        'total_observation_time_by_section': observation_time_by_section.unstack(fill_value=0).round(2),
+        'total_observation_time_by_section_agg': _per_label_series(shelves, aggregates.shelf_observation_time, shelf_present, 'Timestamp').round(2),
+        'section_table': section_table,
+        'mean_visit_time': mean_per_label(visit_runs).fillna(0).round(2),
+        'mean_velocity_aoi': _pair_matrix(aggregates, _mean(aggregates.velocity_sum, aggregates.velocity_count), observed).round(2),
+        'mean_velocity_type': _per_label_series(aois, np.nan_to_num(_mean(aggregates.aoi_velocity_sum, aggregates.aoi_velocity_count), nan=0.0, posinf=np.inf),
+                                                aoi_present, None).round(2),
+        'fixation_counts': _pair_matrix(aggregates, aggregates.fixation_samples, aggregates.fixation_samples > 0),
+        'saccade_counts': _pair_matrix(aggregates, aggregates.saccade_samples, aggregates.saccade_samples > 0),
+        'total_fixation_time': total_fixation_time,
+        'total_saccade_time': total_saccade_time,
+        'fixation_percentage': (total_fixation_time / total_time) * 100,
+        'saccade_percentage': (total_saccade_time / total_time) * 100,
+        'mean_fixation_duration': _pair_matrix(aggregates, _mean(aggregates.fixation_duration_sum, aggregates.fixation_duration_count),
+                                               aggregates.duration_samples > 0).round(2),
+        'fixation_table': fixation_table,
+    }
+
+# Style commands shared by every statistics table: grey header and beige body with a grid
+STATISTICS_TABLE_STYLE = [
+    ('BACKGROUND', (0, 0), (-1, 0), 'grey'),
+    ('TEXTCOLOR', (0, 0), (-1, 0), 'whitesmoke'),
+    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+    ('BACKGROUND', (0, 1), (-1, -1), 'beige'),
+    ('GRID', (0, 0), (-1, -1), 1, 'black'),
+]
+
+# Height of the body rows: the default 10 pt font with 12 pt leading and 3 pt padding above and below
+STATISTICS_ROW_HEIGHT = 18
+
+def _statistics_table(header, rows, width, header_style, table_style):
+    from reportlab.platypus import LongTable, Paragraph
+
+    # Only the header is wrapped, the body cells are single-line strings drawn with the table font. The columns and
+    # body rows have a fixed size and the header is repeated on every page, so splitting a table with thousands of
+    # rows across pages does not measure its cells again for every page.
+    data = [[Paragraph(label, header_style) for label in header]]
+    data.extend([str(cell) for cell in row] for row in rows)
+    table = LongTable(data, colWidths=[width / len(header)] * len(header), rowHeights=[None] + [STATISTICS_ROW_HEIGHT] * (len(data) - 1),
+                      repeatRows=1)
+    table.setStyle(table_style)
+    return table
+
+def create_statistics_pdf(metrics, statistics_pdf_path):
+    """
+    Creates a PDF document containing various statistics tables. The tables are split across pages, so
+    the Section/Shelf x AOI tables of large stores can be rendered.
+
+    Parameters:
+    metrics (dict): The statistics tables returned by compute_statistics_metrics.
+    statistics_pdf_path (str or file object): The file path or binary file object to save the generated PDF.
+    """
+    from reportlab.lib.pagesizes import letter
+    from reportlab.platypus import SimpleDocTemplate, TableStyle, Paragraph, Spacer
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.lib import colors
+    from reportlab.lib.enums import TA_CENTER
+
+    if isinstance(statistics_pdf_path, str) and os.path.dirname(statistics_pdf_path):
+        ensure_directory_exists(os.path.dirname(statistics_pdf_path))
     
     doc = SimpleDocTemplate(statistics_pdf_path, pagesize=letter)
     elements = []
@@ -198,230 +516,108 @@ def create_statistics_pdf(df, aoi_counts, aoi_section_counts, aoi_percentages, s
     elements.append(title)
     elements.append(Spacer(1, 12))
 
-    total_observation_time = total_observation_time.fillna(0).round(2)
-    total_observation_time_by_section = total_observation_time_by_section.fillna(0).round(2)
-    section_counts = section_counts.fillna(0).round(2)
-    aoi_counts = aoi_counts.fillna(0).round(2)
-    aoi_percentages = aoi_percentages.fillna(0).round(2)
+    # Built once and shared by every table
+    header_style = ParagraphStyle('StatisticsHeader', parent=styles['Normal'], fontName='Helvetica-Bold',
+                                  textColor=colors.whitesmoke, alignment=TA_CENTER)
+    table_style = TableStyle(STATISTICS_TABLE_STYLE)
+    def add_table(header, rows):
+        elements.append(_statistics_table(header, rows, doc.width, header_style, table_style))
+        elements.append(Spacer(1, 24))
+
+    total_observation_time = metrics['total_observation_time'].fillna(0).round(2)
+    aoi_counts = metrics['aoi_counts'].fillna(0).round(2)
+    aoi_percentages = metrics['aoi_percentages'].fillna(0).round(2)
 
     # AOI statistics table
-    aoi_data = [["AOI", "Count", "Percentage", "Total Observation Time (s)"]] + list(pd.concat([aoi_counts, aoi_percentages, total_observation_time], axis=1).reset_index().values)
-    aoi_data = [[Paragraph(str(cell), styles['Normal']) for cell in row] for row in aoi_data]
-    aoi_table = Table(aoi_data)
-    aoi_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black),
-    ]))
-    elements.append(aoi_table)
-    elements.append(Spacer(1, 24))
+    add_table(["AOI", "Count", "Percentage", "Total Observation Time (s)"],
+              pd.concat([aoi_counts, aoi_percentages, total_observation_time], axis=1).reset_index().values)
 
     # Section/Shelf statistics table
-    aoi_section_counts_new = df.groupby(['Section/Shelf', 'Product/AOI']).size().unstack(fill_value=0).stack().reset_index(name='Count')
-    total_observation_time_by_section = df.groupby(['Section/Shelf', 'Product/AOI'])['Time_Diff'].sum().unstack(fill_value=0).stack().reset_index(name='Total Observation Time (s)')
-    combined_data = pd.merge(aoi_section_counts_new, total_observation_time_by_section, on=['Section/Shelf', 'Product/AOI'], how='outer').fillna(0)
-
-    section_data = [["Section/Shelf", "Product/AOI", "Count", "Total Observation Time (s)"]] + list(combined_data.values)
-    section_data = [[Paragraph(str(cell), styles['Normal']) for cell in row] for row in section_data]
-    section_table = Table(section_data)
-    section_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black),
-    ]))
-    elements.append(section_table)
-    elements.append(Spacer(1, 24))
+    add_table(["Section/Shelf", "Product/AOI", "Count", "Total Observation Time (s)"], metrics['section_table'].values)
 
     # Mean visit time statistics table
-    mean_visit_time = mean_visit_time.fillna(0).round(2)
-    mean_visit_data = [["Section/Shelf", "AOI", "Mean Visit Time (s)"]] + list(mean_visit_time.reset_index().values)
-    mean_visit_data = [[Paragraph(str(cell), styles['Normal']) for cell in row] for row in mean_visit_data]
-    mean_visit_table = Table(mean_visit_data)
-    mean_visit_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black),
-    ]))
-    elements.append(mean_visit_table)
-    elements.append(Spacer(1, 24))
+    mean_visit_time = metrics['mean_visit_time'].fillna(0).round(2)
+    add_table(["Section/Shelf", "AOI", "Mean Visit Time (s)"], mean_visit_time.reset_index().values)
 
     # Mean velocity statistics table
-    mean_velocity_data = [["Section/Shelf", "AOI", "Mean Velocity"]] + list(mean_velocity_aoi.stack().reset_index().values)
-    mean_velocity_data = [[Paragraph(str(cell), styles['Normal']) for cell in row] for row in mean_velocity_data]
-    mean_velocity_table = Table(mean_velocity_data)
-    mean_velocity_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black),
-    ]))
-    elements.append(mean_velocity_table)
-    elements.append(Spacer(1, 24))
+    add_table(["Section/Shelf", "AOI", "Mean Velocity"], metrics['mean_velocity_aoi'].stack().reset_index().values)
 
     # Fixation and saccade statistics table
-    fixation_saccade_data = [
-        ["Metric", "Value"],
-        ["Total Fixation Time (s)", round(total_fixation_time, 2)],
-        ["Total Saccade Time (s)", round(total_saccade_time, 2)],
-        ["Fixation Percentage (%)", round(fixation_percentage, 2)],
-        ["Saccade Percentage (%)", round(saccade_percentage, 2)],
-        ["Mean Fixation Duration (s)", round(mean_fixation_duration.mean() if not mean_fixation_duration.empty else 0, 2)]
-    ]
-    fixation_saccade_data = [[Paragraph(str(cell), styles['Normal']) for cell in row] for row in fixation_saccade_data]
-    fixation_saccade_table = Table(fixation_saccade_data)
-    fixation_saccade_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black),
-    ]))
-    elements.append(fixation_saccade_table)
-    elements.append(Spacer(1, 24))
-
-    fixations = []
-    current_fixation = None
-
-    for _, row in df.iterrows():
-        if row['fixation_start'] == 1:
-            current_fixation = row
-        elif row['fixation_end'] == 1 and current_fixation is not None:
-            fixation_duration = row['Timestamp'] - current_fixation['Timestamp']
-            fixations.append({
-                'Section/Shelf': current_fixation['Section/Shelf'],
-                'Product/AOI': current_fixation['Product/AOI'],
-                'fixation_duration': fixation_duration
-            })
-            current_fixation = None
-
-    fixations_df = pd.DataFrame(fixations)
-
-    # Calcular el número de fijaciones y la duración total
-    total_fixation_duration = fixations_df.groupby(['Section/Shelf', 'Product/AOI'])['fixation_duration'].sum().reset_index(name='Total Fixation Duration').round(2)
-    fixation_times = fixations_df.groupby(['Section/Shelf', 'Product/AOI']).size().reset_index(name='Fixation Times')
-    fixation_data = pd.merge(total_fixation_duration, fixation_times, on=['Section/Shelf', 'Product/AOI'], how='outer').fillna(0)
-
-    fixation_table_data = [["Section/Shelf", "AOI", "Total Fixation Duration (s)", "Fixation Times"]] + list(fixation_data.values)
-    fixation_table_data = [[Paragraph(str(cell), styles['Normal']) for cell in row] for row in fixation_table_data]
-    fixation_table = Table(fixation_table_data)
-    fixation_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black),
-    ]))
-    elements.append(fixation_table)
-    elements.append(Spacer(1, 24))
+    add_table(["Metric", "Value"], [
+        ["Total Fixation Time (s)", round(metrics['total_fixation_time'], 2)],
+        ["Total Saccade Time (s)", round(metrics['total_saccade_time'], 2)],
+        ["Fixation Percentage (%)", round(metrics['fixation_percentage'], 2)],
+        ["Saccade Percentage (%)", round(metrics['saccade_percentage'], 2)],
+        ["Mean Fixation Duration (s)", round(metrics['mean_fixation_duration'].mean() if not metrics['mean_fixation_duration'].empty else 0, 2)]
+    ])
+
+    add_table(["Section/Shelf", "AOI", "Total Fixation Duration (s)", "Fixation Times"], metrics['fixation_table'].values)
 
     doc.build(elements)
+    lap('Statistics tables')
 
 def combine_pdfs(graphics_pdf_path, statistics_pdf_path, final_pdf_path):
     """
     Combines two PDF files into one.
 
     Parameters:
-    graphics_pdf_path (str): The file path of the graphics PDF.
-    statistics_pdf_path (str): The file path of the statistics PDF.
-    final_pdf_path (str): The file path to save the combined PDF.
+    graphics_pdf_path (str, bytes or file object): The graphics PDF.
+    statistics_pdf_path (str, bytes or file object): The statistics PDF.
+    final_pdf_path (str or file object): The file path or binary file object to save the combined PDF.
+    """
+    write_pdf([graphics_pdf_path, statistics_pdf_path], final_pdf_path)
+
+def compute_report_metrics(df, fixation_events_path=None):
+    """
+    Computes every table of the eye-tracking report. The fixation events table is extracted once and shared
+    by the graphs, the statistics and the export.
+
+    Parameters:
+    df (pandas.DataFrame): The eye-tracking data with fixations.
+    fixation_events_path (str, optional): If given, the fixation events table is exported to this CSV file.
+
+    Returns:
+    dict: The graph metrics ('graphs') and the statistics metrics ('statistics').
     """
-    merger = PyPDF2.PdfMerger()
+    # Labels only seen in dropped duplicate frames must not be counted as observed zero times
+    df = df.copy(deep=False)
+    for column in df.select_dtypes(include='category').columns:
+        df[column] = df[column].cat.remove_unused_categories()
 
-    for pdf in [graphics_pdf_path, statistics_pdf_path]:
-        merger.append(pdf)
+    fixation_events = extract_fixation_events(df)
+    if fixation_events_path is not None:
+        fixation_events.to_csv(fixation_events_path, index=False)
 
-    merger.write(final_pdf_path)
-    merger.close()
+    aggregates = aggregate_eye_tracking(df, fixation_events)
+    return {'graphs': compute_graph_metrics(df, aggregates=aggregates), 'statistics': compute_statistics_metrics(df, aggregates=aggregates)}
 
-def generate_statistics_report_ET(df, final_pdf_path):
+def report_parts(metrics, point_budget=DEFAULT_POINT_BUDGET, rasterize=None):
     """
-    Generates a comprehensive statistics report PDF from the provided DataFrame.
+    Lists the independent render jobs of the eye-tracking report, in the order of its pages.
 
     Parameters:
-    df (pandas.DataFrame): The DataFrame containing the data to analyze.
-    final_pdf_path (str): The file path to save the final combined PDF.
+    metrics (dict): The tables returned by compute_report_metrics.
+    point_budget (int, optional): Point budget of the time-series graphs, None to plot every sample.
+    rasterize (bool, optional): Whether to rasterize the dense layers of the graphs, automatic if None.
+
+    Returns:
+    list: (render function, metrics) pairs. Each function is called as function(metrics, pdf_file).
     """
-    graphics_pdf_path = './reports/VR_SI_Graphics.pdf'
-    statistics_pdf_path = './reports/VR_SI_Statistics.pdf'
-
-    # Generate graphs and statistics PDFs
-    generate_graphs(df, graphics_pdf_path)
-    aoi_counts = df['Product/AOI'].value_counts()
-    aoi_percentages = df['Product/AOI'].value_counts(normalize=True).round(2) * 100
-    section_counts = df['Section/Shelf'].value_counts()
-    aoi_section_counts = df.groupby(['Section/Shelf', 'Product/AOI']).size().unstack(fill_value=0).stack().fillna(0).round(2)
-    
-    df.loc[:, 'Time_Diff'] = df['Timestamp'].diff().fillna(0).round(2)
-    total_observation_time = df.groupby('Product/AOI')['Time_Diff'].sum().fillna(0).round(2)
-    total_observation_time_by_section = df.groupby(['Section/Shelf', 'Product/AOI'])['Time_Diff'].sum().unstack(fill_value=0).fillna(0).round(2)
-    total_observation_time_by_section_agg = df.groupby(['Section/Shelf'])['Time_Diff'].sum().fillna(0).round(2)
-
-    # Mean visit time calculation
-    df.loc[:, 'Previous_AOI'] = df['Product/AOI'].shift(1)
-    df.loc[:, 'New_Visit'] = df['Product/AOI'] != df['Previous_AOI']
-    df.loc[:, 'Visit_ID'] = df['New_Visit'].cumsum()
-    visit_times = df.groupby(['Visit_ID', 'Product/AOI', 'Section/Shelf'])['Timestamp'].agg(['first', 'last'])
-    visit_times['Visit_Duration'] = (visit_times['last'] - visit_times['first']).fillna(0).round(2)
-    mean_visit_time = visit_times.groupby(['Section/Shelf', 'Product/AOI'])['Visit_Duration'].mean().fillna(0).round(2)
-
-    # Mean velocity calculation
-    df.loc[:, 'Velocity'] = ((df['RCHit_x'].diff()**2 + df['RCHit_y'].diff()**2 + df['RCHit_z'].diff()**2)**0.5) / df['Timestamp'].diff()
-    mean_velocity_aoi = df.groupby(['Section/Shelf', 'Product/AOI'])['Velocity'].mean().unstack(fill_value=0).fillna(0).round(2)
-    mean_velocity_type = df.groupby('Product/AOI')['Velocity'].mean().fillna(0).round(2)
+    return [(partial(render_graphs, point_budget=point_budget, rasterize=rasterize), metrics['graphs']),
+            (create_statistics_pdf, metrics['statistics'])]
 
-    # Fixation and saccade statistics
-    fixation_counts = df[df['fixation'] == 1].groupby(['Section/Shelf', 'Product/AOI']).size().unstack(fill_value=0).fillna(0)
-    saccade_counts = df[df['fixation'] == 0].groupby(['Section/Shelf', 'Product/AOI']).size().unstack(fill_value=0).fillna(0)
-    total_fixation_time = df[df['fixation'] == 1]['Time_Diff'].sum()
-    total_saccade_time = df[df['fixation'] == 0]['Time_Diff'].sum()
-    total_time = total_fixation_time + total_saccade_time
-    fixation_percentage = (total_fixation_time / total_time) * 100
-    saccade_percentage = (total_saccade_time / total_time) * 100
-    mean_fixation_duration = df[df['fixation_duration'] != 0].groupby(['Section/Shelf', 'Product/AOI'])['fixation_duration'].mean().unstack(fill_value=0).fillna(0).round(2)
-
-    # Create statistics PDF
-    create_statistics_pdf(df,
-        aoi_counts,
-        aoi_section_counts,
-        aoi_percentages,
-        section_counts,
-        total_observation_time,
-        total_observation_time_by_section,
-        total_observation_time_by_section_agg,
-        mean_visit_time,
-        mean_velocity_aoi,
-        mean_velocity_type,
-        fixation_counts,
-        saccade_counts,
-        total_fixation_time,
-        total_saccade_time,
-        fixation_percentage,
-        saccade_percentage,
-        mean_fixation_duration,
-        statistics_pdf_path
-    )
+def generate_statistics_report_ET(df, final_pdf_path, fixation_events_path=None):
+    """
+    Generates a comprehensive statistics report PDF from the provided DataFrame. The graphs and the tables are
+    rendered in memory and the final document is written once, so several reports can be generated at the same time.
 
-    # Combine PDFs
-    combine_pdfs(graphics_pdf_path, statistics_pdf_path, final_pdf_path)
+    Parameters:
+    df (pandas.DataFrame): The DataFrame containing the data to analyze.
+    final_pdf_path (str or file object): The file path or binary file object to save the final combined PDF.
+    fixation_events_path (str, optional): If given, the fixation events table is exported to this CSV file.
+    """
+    metrics = compute_report_metrics(df, fixation_events_path)
+    write_pdf([render_to_bytes(render_function, part_metrics) for render_function, part_metrics in report_parts(metrics)], final_pdf_path)
 
 def sanitize_dataframe(df):
     """
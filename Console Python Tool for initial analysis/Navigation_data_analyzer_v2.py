@@ -1,9 +1,10 @@
 import pandas as pd
-import matplotlib.pyplot as plt
-from mpl_toolkits.mplot3d import Axes3D
-import seaborn as sns
 import numpy as np
-from matplotlib.backends.backend_pdf import PdfPages
+from zones import parse_was_tp
+from csv_cache import strip_string_cells
+from visits import count_runs, run_lengths
+from instrumentation import lap
+from downsampling import DEFAULT_POINT_BUDGET, categorical_indices, minmax_indices, rasterize_layer
 
 #TODO: redondear a 2 decimales todos los valores de tabla
 
@@ -33,13 +34,9 @@ def count_stops_and_moves(data):
     Returns:
     tuple: A tuple containing the counts of 'Stop' and 'Move' events.
     """
-    data['Shift_Status'] = data['Status'].shift(1)
-    data['New_Group'] = data['Status'] != data['Shift_Status']
-    data['Group_ID'] = data['New_Group'].cumsum()
-
-    group_counts = data.groupby(['Group_ID', 'Status']).size().reset_index(name='Count')
-    stop_counts = group_counts[group_counts['Status'] == 'Stop'].shape[0]
-    move_counts = group_counts[group_counts['Status'] == 'Move'].shape[0]
+    group_counts = count_runs(run_lengths(data['Status']))
+    stop_counts = int(group_counts.get('Stop', 0))
+    move_counts = int(group_counts.get('Move', 0))
 
     return stop_counts, move_counts
 
@@ -63,7 +60,7 @@ def calculate_mean_velocity(head_hands_data):
     # Remove outliers
     head_hands_data = remove_outliers(head_hands_data, 'Velocity')
     
-    mean_std_velocity_by_zone = head_hands_data.groupby('Zone')['Velocity'].agg(['mean', 'std']).reset_index()
+    mean_std_velocity_by_zone = head_hands_data.groupby('Zone', observed=True)['Velocity'].agg(['mean', 'std']).reset_index()
     mean_std_velocity_by_zone.columns = ['Zone', 'Mean_Velocity', 'Std_Velocity']
     
     return mean_std_velocity_by_zone
@@ -78,23 +75,51 @@ def label_sections(teleport_data, valid_sections):
     valid_sections (list): List of valid sections.
 
     Returns:
-    pandas.DataFrame: The DataFrame with sections labeled and current section determined.
+    pandas.DataFrame: A new DataFrame with sections labeled and current section determined.
     """
+    # Shallow copy, the new columns must not leak to the caller's frame, which may be shared
+    teleport_data = teleport_data.copy(deep=False)
     teleport_data['Section'] = teleport_data['TPHotspot'].str.extract(r'TP_([A-Za-z]+)', expand=False)
     teleport_data['Section'] = teleport_data['Section'].str.replace(r'\d+', '', regex=True)
-    teleport_data['Section'] = teleport_data['Section'].apply(lambda x: x if x in valid_sections else 'NIAS')
-    teleport_data['WasTP'] = teleport_data['WasTP'].apply(lambda x: True if x == 'True' else False)
+    teleport_data['Section'] = teleport_data['Section'].where(teleport_data['Section'].isin(valid_sections), 'NIAS')
+    teleport_data['WasTP'] = parse_was_tp(teleport_data['WasTP'])
 
-    teleport_data['Current_Section'] = 'NIAS'
-    current_section = 'NIAS'
-    
-    for i, row in teleport_data.iterrows():
-        if row['WasTP']:
-            current_section = row['Section']
-        teleport_data.at[i, 'Current_Section'] = current_section
+    # The current section only changes on successful teleports
+    teleport_data['Current_Section'] = teleport_data['Section'].where(teleport_data['WasTP']).ffill().fillna('NIAS')
 
     return teleport_data
 
+def attribute_sections(events, teleport_data, section_column='Section'):
+    """
+    Attributes to every event the section the user was in at that moment, i.e. the 'Current_Section'
+    of the last teleport row whose timestamp is lower or equal than the event one (as-of join).
+    Events before the first teleport row are attributed to 'NIAS'.
+    It works for any stream with a 'Timestamp' column: head and hands, shopping cart, product interactions...
+
+    Parameters:
+    events (pandas.DataFrame): The DataFrame containing the events to attribute.
+    teleport_data (pandas.DataFrame): The teleport data, already labeled with label_sections.
+    section_column (str): Name of the column where the section is stored.
+
+    Returns:
+    pandas.DataFrame: A new events DataFrame with the section column.
+    """
+    event_times = events['Timestamp'].to_numpy(dtype=float)
+    teleport_times = teleport_data['Timestamp'].to_numpy(dtype=float)
+    teleport_sections = teleport_data['Current_Section'].to_numpy()
+
+    # Teleport rows are recorded in time order, but keep the last row for equal timestamps as tail(1) did
+    order = np.argsort(teleport_times, kind='stable')
+    positions = np.searchsorted(teleport_times[order], event_times, side='right') - 1
+
+    sections = np.full(len(events), 'NIAS', dtype=object)
+    found = positions >= 0
+    sections[found] = teleport_sections[order][positions[found]]
+    events = events.copy(deep=False)
+    events[section_column] = sections
+
+    return events
+
 def update_head_hands_data_sections(head_hands_data, teleport_data):
     """
     Updates the head and hands data with section labels based on teleport data.
@@ -106,18 +131,28 @@ def update_head_hands_data_sections(head_hands_data, teleport_data):
     Returns:
     pandas.DataFrame: The updated head and hands data with section labels.
     """
-    head_hands_data['Section'] = 'NIAS'
-    current_section = 'NIAS'
-    
-    for i, row in head_hands_data.iterrows():
-        relevant_teleport = teleport_data[teleport_data['Timestamp'] <= row['Timestamp']].tail(1)
-        if not relevant_teleport.empty:
-            current_section = relevant_teleport.iloc[0]['Current_Section']
-        head_hands_data.at[i, 'Section'] = current_section
+    return attribute_sections(head_hands_data, teleport_data)
+
+def prepare_sections(head_hands_data, teleport_data, valid_sections):
+    """
+    Labels the teleport data and attributes the sections to the head and hands data if not done yet,
+    so that every plot and metric of a report shares the same attribution.
+
+    Parameters:
+    head_hands_data (pandas.DataFrame): The DataFrame containing head and hands tracking data.
+    teleport_data (pandas.DataFrame): The DataFrame containing teleport data.
+    valid_sections (list): List of valid sections.
 
-    return head_hands_data
+    Returns:
+    tuple: The head and hands data and the teleport data with their sections.
+    """
+    if 'Current_Section' not in teleport_data.columns:
+        teleport_data = label_sections(teleport_data, valid_sections)
+    if 'Section' not in head_hands_data.columns:
+        head_hands_data = update_head_hands_data_sections(head_hands_data, teleport_data)
+    return head_hands_data, teleport_data
 
-def plot_user_presence_with_sections(head_hands_data, teleport_data, valid_sections, pdf):
+def plot_user_presence_with_sections(head_hands_data, teleport_data, valid_sections, pdf, point_budget=DEFAULT_POINT_BUDGET, rasterize=None):
     """
     Plots user presence over time with section changes and teleport events.
 
@@ -126,18 +161,24 @@ def plot_user_presence_with_sections(head_hands_data, teleport_data, valid_secti
     teleport_data (pandas.DataFrame): The DataFrame containing teleport data.
     valid_sections (list): List of valid sections.
     pdf (PdfPages): The PDF object to save the plot.
+    point_budget (int, optional): Maximum number of points, about one per section and time bucket, None to plot every frame.
+    rasterize (bool, optional): Whether to rasterize the points, automatic if None.
     """
-    teleport_data = label_sections(teleport_data, valid_sections)
-    head_hands_data = update_head_hands_data_sections(head_hands_data, teleport_data)
+    import matplotlib.pyplot as plt
+    
+    head_hands_data, teleport_data = prepare_sections(head_hands_data, teleport_data, valid_sections)
+    head_hands_data = head_hands_data.iloc[categorical_indices(head_hands_data['Timestamp'], head_hands_data['Section'], point_budget)]
+    rasterized = rasterize_layer(len(head_hands_data), rasterize)
 
     plt.figure(figsize=(14, 7))
     unique_sections = ['NIAS'] + valid_sections
     section_y_positions = {section: i for i, section in enumerate(unique_sections)}
-    head_hands_data['Y_Position'] = head_hands_data['Section'].map(section_y_positions)
+    y_positions = head_hands_data['Section'].map(section_y_positions)
 
     for section in unique_sections:
-        section_data = head_hands_data[head_hands_data['Section'] == section]
-        plt.scatter(section_data['Timestamp'], section_data['Y_Position'], s=10, label=section, color=plt.cm.tab20(section_y_positions[section]))
+        in_section = head_hands_data['Section'] == section
+        plt.scatter(head_hands_data.loc[in_section, 'Timestamp'], y_positions[in_section], s=10, label=section, color=plt.cm.tab20(section_y_positions[section]),
+                    rasterized=rasterized)
 
     teleport_events = teleport_data[teleport_data['WasTP'] == True]
     for _, row in teleport_events.iterrows():
@@ -150,8 +191,9 @@ def plot_user_presence_with_sections(head_hands_data, teleport_data, valid_secti
     plt.legend(loc='upper right', title="Sections")
     pdf.savefig()
     plt.close()
+    lap('User Presence Over Time with Section Changes and Teleport Events')
 
-def plot_bubble_plot(head_hands_data, teleport_data, valid_sections, pdf):
+def plot_bubble_plot(head_hands_data, teleport_data, valid_sections, pdf, point_budget=DEFAULT_POINT_BUDGET, rasterize=None):
     """
     Plots a bubble plot showing user presence in sections over time with zone sizes.
 
@@ -160,19 +202,24 @@ def plot_bubble_plot(head_hands_data, teleport_data, valid_sections, pdf):
     teleport_data (pandas.DataFrame): The DataFrame containing teleport data.
     valid_sections (list): List of valid sections.
     pdf (PdfPages): The PDF object to save the plot.
+    point_budget (int, optional): Maximum number of bubbles, about one per section, zone and time bucket, None to plot every frame.
+    rasterize (bool, optional): Whether to rasterize the bubbles, automatic if None.
     """
-    teleport_data = label_sections(teleport_data, valid_sections)
-    head_hands_data = update_head_hands_data_sections(head_hands_data, teleport_data)
+    import matplotlib.pyplot as plt
+    
+    head_hands_data, teleport_data = prepare_sections(head_hands_data, teleport_data, valid_sections)
 
-    head_hands_data['Time_Delta'] = head_hands_data['Timestamp'].diff().fillna(0)
-    head_hands_data['Zone'] = head_hands_data['Zone'].astype(str)
-    zone_sizes = head_hands_data['Zone'].map({'Far': 1, 'Shelf': 2, 'Adjacent': 3, 'Near': 4})
-    zone_colors = head_hands_data['Zone'].map({'Far': 'blue', 'Shelf': 'green', 'Adjacent': 'orange', 'Near': 'red'})
+    zones = head_hands_data['Zone'].astype(str)
+    kept = categorical_indices(head_hands_data['Timestamp'], [head_hands_data['Section'], zones], point_budget)
+    head_hands_data, zones = head_hands_data.iloc[kept], zones.iloc[kept]
+    rasterized = rasterize_layer(len(head_hands_data), rasterize)
+    zone_sizes = zones.map({'Far': 1, 'Shelf': 2, 'Adjacent': 3, 'Near': 4})
 
     plt.figure(figsize=(14, 7))
     for zone, color in {'Far': 'blue', 'Shelf': 'green', 'Adjacent': 'orange', 'Near': 'red'}.items():
-        zone_data = head_hands_data[head_hands_data['Zone'] == zone]
-        plt.scatter(zone_data['Timestamp'], zone_data['Section'], s=zone_sizes[zone_data.index]*100, color=color, alpha=0.6, edgecolors='w', linewidth=0.5, label=zone)
+        in_zone = zones == zone
+        plt.scatter(head_hands_data.loc[in_zone, 'Timestamp'], head_hands_data.loc[in_zone, 'Section'], s=zone_sizes[in_zone]*100, color=color, alpha=0.6, edgecolors='w', linewidth=0.5, label=zone,
+                    rasterized=rasterized)
 
     teleport_events = teleport_data[teleport_data['WasTP'] == True]
     for _, row in teleport_events.iterrows():
@@ -187,6 +234,76 @@ def plot_bubble_plot(head_hands_data, teleport_data, valid_sections, pdf):
     plt.title('User Presence in Sections Over Time with Zone Sizes')
     pdf.savefig()
     plt.close()
+    lap('User Presence in Sections Over Time with Zone Sizes')
+
+def teleport_segments(teleport_data):
+    """
+    Groups the teleport attempts into segments that end with a successful teleport. The aim duration of every
+    attempt is added to the segment, so that the duration of a segment is the time the user spent aiming until teleporting.
+    Attempts after the last successful teleport do not belong to any segment.
+
+    Parameters:
+    teleport_data (pandas.DataFrame): The teleport data, with the 'WasTP' column as booleans.
+
+    Returns:
+    pandas.DataFrame: One row per successful teleport with its 'Frame', 'Timestamp', 'TPHotspot', number of 'Attempts',
+                      aim 'Duration' and 'Failed_Aim_Time' (the duration of the failed attempts).
+    """
+    was_tp = teleport_data['WasTP'].to_numpy(dtype=bool)
+    durations = teleport_data['Duration'].to_numpy(dtype=float)
+    # A successful attempt closes its segment, the next attempt opens a new one
+    segment_ids = np.cumsum(was_tp) - was_tp
+    n_segments = int(was_tp.sum())
+    in_segment = segment_ids < n_segments
+
+    successes = teleport_data.loc[was_tp, ['Frame', 'Timestamp', 'TPHotspot']].reset_index(drop=True)
+    successes['Attempts'] = np.bincount(segment_ids[in_segment], minlength=n_segments)
+    successes['Duration'] = np.bincount(segment_ids[in_segment], weights=durations[in_segment], minlength=n_segments)
+    successes['Failed_Aim_Time'] = successes['Duration'] - durations[was_tp]
+    return successes
+
+def teleport_attempt_statistics(teleport_data):
+    """
+    Computes how many attempts the user needed to teleport and the success rate of every teleport hotspot.
+
+    Parameters:
+    teleport_data (pandas.DataFrame): The teleport data, with the 'WasTP' column as booleans.
+
+    Returns:
+    tuple: A dictionary with the total 'Attempts', 'Successes', 'Attempts_per_Success' and 'Failed_Aim_Time', and a DataFrame
+           with the 'Attempts', 'Successes' and 'Success_Rate' (%) of every hotspot.
+    """
+    was_tp = teleport_data['WasTP'].astype(bool)
+    attempts = len(teleport_data)
+    successes = int(was_tp.sum())
+    statistics = {
+        'Attempts': attempts,
+        'Successes': successes,
+        'Attempts_per_Success': attempts / successes if successes else np.nan,
+        'Failed_Aim_Time': float(teleport_data.loc[~was_tp, 'Duration'].sum()),
+    }
+
+    by_hotspot = was_tp.groupby(teleport_data['TPHotspot'], observed=True).agg(['size', 'sum'])
+    by_hotspot.columns = ['Attempts', 'Successes']
+    by_hotspot['Success_Rate'] = by_hotspot['Successes'] / by_hotspot['Attempts'] * 100
+    return statistics, by_hotspot.rename_axis('TPHotspot')
+
+def distance_between_teleports(head_hands_data, teleport_frames):
+    """
+    Adds up the horizontal distance walked between successful teleports. The displacement of the teleport frames is not walked.
+
+    Parameters:
+    head_hands_data (pandas.DataFrame): The head and hands data with the 'Distance_Traveled' of every frame.
+    teleport_frames (array-like): Frames of the successful teleports.
+
+    Returns:
+    pandas.Series: The distance walked before the first teleport and after every teleport, by segment number.
+    """
+    is_teleport = head_hands_data['Frame'].isin(teleport_frames).to_numpy()
+    segment_ids = np.cumsum(is_teleport)
+    distances = head_hands_data['Distance_Traveled'].to_numpy(dtype=float)
+    walked = np.bincount(segment_ids[~is_teleport], weights=distances[~is_teleport], minlength=segment_ids[-1] + 1 if len(segment_ids) else 0)
+    return pd.Series(walked, name='Distance_Traveled').rename_axis('Segment')
 
 def save_metrics_table_to_pdf(metrics_df, pdf):
     """
@@ -196,6 +313,8 @@ def save_metrics_table_to_pdf(metrics_df, pdf):
     metrics_df (pandas.DataFrame): The DataFrame containing the metrics.
     pdf (PdfPages): The PDF object to save the table.
     """
+    import matplotlib.pyplot as plt
+    
     fig, ax = plt.subplots(figsize=(12, 4))
     ax.axis('tight')
     ax.axis('off')
@@ -205,99 +324,83 @@ def save_metrics_table_to_pdf(metrics_df, pdf):
     table.auto_set_column_width(col=list(range(len(metrics_df.columns))))
     pdf.savefig(fig, bbox_inches='tight')
     plt.close()
+    lap('Metrics table', metrics_df)
 
-def generate_report(output_path, head_hands_data, teleport_data, valid_sections):
+def compute_report_metrics(head_hands_data, teleport_data, valid_sections):
     """
-    Generates a comprehensive report with plots and metrics saved to a PDF.
+    Computes the metrics and the tables plotted in the navigation report, so that the rendering does not need the raw data.
 
     Parameters:
-    output_path (str): The file path to save the final PDF report.
     head_hands_data (pandas.DataFrame): The dataframe of the head and hands data CSV.
     teleport_data (pandas.DataFrame): The dataframe path of the teleport data CSV.
     valid_sections (list): List of valid sections conceived in your Unity scene.
-    """
-
-    head_hands_data = head_hands_data.applymap(lambda x: x.strip() if isinstance(x, str) else x)
-    teleport_data = teleport_data.applymap(lambda x: x.strip() if isinstance(x, str) else x)
-    head_hands_data.columns = head_hands_data.columns.str.strip()
-    teleport_data.columns = teleport_data.columns.str.strip()
 
-    with PdfPages(output_path) as pdf:
-        plot_user_presence_with_sections(head_hands_data.copy(), teleport_data.copy(), valid_sections, pdf)
-        plot_bubble_plot(head_hands_data.copy(), teleport_data.copy(), valid_sections, pdf)
-
-        teleport_durations = []
-        current_duration = 0
+    Returns:
+    dict: The tables rendered by render_report.
+    """
 
-        for _, row in teleport_data.iterrows():
-            current_duration += row['Duration']
-            if row['WasTP']:
-                teleport_durations.append(current_duration)
-                current_duration = 0
+    # Shallow copies, the sections and the metrics below add columns that must not leak to the caller's frames,
+    # which may be shared with other stages
+    head_hands_data = strip_string_cells(head_hands_data).copy(deep=False)
+    teleport_data = strip_string_cells(teleport_data).copy(deep=False)
 
-        average_successful_teleport_duration = sum(teleport_durations) / len(teleport_durations) if teleport_durations else 0
+    # Attribute the sections once, every plot and metric of the report shares them
+    head_hands_data, teleport_data = prepare_sections(head_hands_data, teleport_data, valid_sections)
 
-        head_hands_data['Time_Delta'] = head_hands_data['Timestamp'].diff().fillna(0)
-        time_in_zones = head_hands_data.groupby('Zone')['Time_Delta'].sum()
-        stop_move_counts = head_hands_data['Status'].value_counts()
-        stop_move_percentages = head_hands_data['Status'].value_counts(normalize=True) * 100
+    successful_teleports = teleport_segments(teleport_data)
+    average_successful_teleport_duration = successful_teleports['Duration'].mean() if len(successful_teleports) else 0
+    teleport_statistics, teleport_hotspots = teleport_attempt_statistics(teleport_data)
 
-        # METRIC: Calculate the velocity magnitude for each hand
-        head_hands_data['Velocity_HandR_Magnitude'] = np.sqrt(
-            head_hands_data['Velocity_HandR_x']**2 + 
-            head_hands_data['Velocity_HandR_y']**2 + 
-            head_hands_data['Velocity_HandR_z']**2
-        )
+    head_hands_data['Time_Delta'] = head_hands_data['Timestamp'].diff().fillna(0)
+    time_in_zones = head_hands_data.groupby('Zone', observed=True)['Time_Delta'].sum()
+    time_in_sections = head_hands_data.groupby('Section')['Time_Delta'].sum()
+    stop_move_counts = head_hands_data['Status'].value_counts()
+    stop_move_percentages = head_hands_data['Status'].value_counts(normalize=True) * 100
 
-        head_hands_data['Velocity_HandL_Magnitude'] = np.sqrt(
-            head_hands_data['Velocity_HandL_x']**2 + 
-            head_hands_data['Velocity_HandL_y']**2 + 
-            head_hands_data['Velocity_HandL_z']**2
-        )
+    # METRIC: Calculate the velocity magnitude for each hand
+    head_hands_data['Velocity_HandR_Magnitude'] = np.sqrt(
+        head_hands_data['Velocity_HandR_x']**2 + 
+        head_hands_data['Velocity_HandR_y']**2 + 
+        head_hands_data['Velocity_HandR_z']**2
+    )
 
-        head_hands_data_clean = remove_outliers(head_hands_data, 'Velocity_HandR_Magnitude')
-        head_hands_data_clean = remove_outliers(head_hands_data_clean, 'Velocity_HandL_Magnitude')
+    head_hands_data['Velocity_HandL_Magnitude'] = np.sqrt(
+        head_hands_data['Velocity_HandL_x']**2 + 
+        head_hands_data['Velocity_HandL_y']**2 + 
+        head_hands_data['Velocity_HandL_z']**2
+    )
 
-        # METRIC: Calculate the number of visits per zone
-        head_hands_data_clean['Zone_Shifted'] = head_hands_data_clean['Zone'].shift(1)
-        head_hands_data_clean['New_Visit'] = head_hands_data_clean['Zone'] != head_hands_data_clean['Zone_Shifted']
-        visit_counts = head_hands_data_clean[head_hands_data_clean['New_Visit']].groupby('Zone').size()
+    head_hands_data_clean = remove_outliers(head_hands_data, 'Velocity_HandR_Magnitude')
+    head_hands_data_clean = remove_outliers(head_hands_data_clean, 'Velocity_HandL_Magnitude')
 
-        # Prepare visits data for metrics_df
-        visit_counts_str = ", ".join([f"{zone}: {count}" for zone, count in visit_counts.items()])
+    # METRIC: Calculate the number of visits per zone
+    visit_counts = count_runs(run_lengths(head_hands_data_clean['Zone']))
 
-        # METRIC: Calculate the acceleration for each hand
-        average_velocity_magnitude_handR = head_hands_data_clean['Velocity_HandR_Magnitude'].mean()
-        std_velocity_magnitude_handR = head_hands_data_clean['Velocity_HandR_Magnitude'].std()
+    # Prepare visits data for metrics_df
+    visit_counts_str = ", ".join([f"{zone}: {count}" for zone, count in visit_counts.items()])
 
-        average_velocity_magnitude_handL = head_hands_data_clean['Velocity_HandL_Magnitude'].mean()
-        std_velocity_magnitude_handL = head_hands_data_clean['Velocity_HandL_Magnitude'].std()
+    # METRIC: Calculate the acceleration for each hand
+    average_velocity_magnitude_handR = head_hands_data_clean['Velocity_HandR_Magnitude'].mean()
+    std_velocity_magnitude_handR = head_hands_data_clean['Velocity_HandR_Magnitude'].std()
 
-        head_hands_data_clean['Acceleration_HandR'] = head_hands_data_clean['Velocity_HandR_Magnitude'].diff().fillna(0) / head_hands_data_clean['Time_Delta']
-        head_hands_data_clean['Acceleration_HandL'] = head_hands_data_clean['Velocity_HandL_Magnitude'].diff().fillna(0) / head_hands_data_clean['Time_Delta']
+    average_velocity_magnitude_handL = head_hands_data_clean['Velocity_HandL_Magnitude'].mean()
+    std_velocity_magnitude_handL = head_hands_data_clean['Velocity_HandL_Magnitude'].std()
 
-        mean_acceleration_handR = head_hands_data_clean['Acceleration_HandR'].mean()
-        std_acceleration_handR = head_hands_data_clean['Acceleration_HandR'].std()
+    head_hands_data_clean['Acceleration_HandR'] = head_hands_data_clean['Velocity_HandR_Magnitude'].diff().fillna(0) / head_hands_data_clean['Time_Delta']
+    head_hands_data_clean['Acceleration_HandL'] = head_hands_data_clean['Velocity_HandL_Magnitude'].diff().fillna(0) / head_hands_data_clean['Time_Delta']
 
-        mean_acceleration_handL = head_hands_data_clean['Acceleration_HandL'].mean()
-        std_acceleration_handL = head_hands_data_clean['Acceleration_HandL'].std()
+    mean_acceleration_handR = head_hands_data_clean['Acceleration_HandR'].mean()
+    std_acceleration_handR = head_hands_data_clean['Acceleration_HandR'].std()
 
-        plt.figure(figsize=(14, 7))
-        plt.plot(head_hands_data_clean['Timestamp'], head_hands_data_clean['Velocity_HandR_Magnitude'], label='Right Hand Velocity', color='blue')
-        plt.plot(head_hands_data_clean['Timestamp'], head_hands_data_clean['Velocity_HandL_Magnitude'], label='Left Hand Velocity', color='green')
-        plt.xlabel('Timestamp')
-        plt.ylabel('Velocity Magnitude (m/s)')
-        plt.title('Hand Velocity Magnitude Over Time')
-        plt.legend()
-        pdf.savefig()
-        plt.close()
+    mean_acceleration_handL = head_hands_data_clean['Acceleration_HandL'].mean()
+    std_acceleration_handL = head_hands_data_clean['Acceleration_HandL'].std()
 
-        # METRIC: Calculate the number of stops and moves and percentages
-        stop_counts, move_counts = count_stops_and_moves(head_hands_data)
-        stop_percentage = (stop_counts) / (stop_counts + move_counts) * 100
-        move_percentage = (move_counts) / (stop_counts + move_counts) * 100
+    # METRIC: Calculate the number of stops and moves and percentages
+    stop_counts, move_counts = count_stops_and_moves(head_hands_data)
+    stop_percentage = (stop_counts) / (stop_counts + move_counts) * 100
+    move_percentage = (move_counts) / (stop_counts + move_counts) * 100
 
-        metrics = {
+    metrics = {
         'Metric': [
             'Stop Count', 'Move Count', 'Stop Percentage', 'Move Percentage', 
             'Average Duration for Successful Teleport', 'Average Velocity HandR_x', 
@@ -320,41 +423,96 @@ def generate_report(output_path, head_hands_data, teleport_data, valid_sections)
         ]
     }
 
-        teleport_frames = teleport_data[teleport_data['WasTP'] == True]['Frame']
+    teleport_frames = teleport_data.loc[teleport_data['WasTP'] == True, 'Frame']
 
-        head_hands_data['Is_Teleport'] = head_hands_data['Frame'].isin(teleport_frames)
+    head_hands_data['Distance_Traveled'] = np.sqrt(
+        (head_hands_data['HMD_x'].diff().fillna(0))**2 +
+        (head_hands_data['HMD_z'].diff().fillna(0))**2
+    )
 
-        head_hands_data['Distance_Traveled'] = np.sqrt(
-            (head_hands_data['HMD_x'].diff().fillna(0))**2 +
-            (head_hands_data['HMD_z'].diff().fillna(0))**2
-        )
+    # METRIC: Distance traveled without considering teleportations
+    walked_distances = distance_between_teleports(head_hands_data, teleport_frames)
+    total_distance_traveled = walked_distances.sum()
 
-        # METRIC: Distance traveled without considering teleportations
-        total_distance_traveled = 0
-        current_distance = 0
+    metrics['Metric'].append('Total Distance Traveled (without teleports)')
+    metrics['Value'].append(total_distance_traveled)
 
-        # Iterate over the dataframe and sum distances until teleportation is detected
-        for idx, row in head_hands_data.iterrows():
-            if row['Is_Teleport']:
-                total_distance_traveled += current_distance
-                current_distance = 0
-            else:
-                current_distance += row['Distance_Traveled']
+    # METRIC: Teleport attempts
+    metrics['Metric'] += ['Teleport Attempts', 'Teleport Attempts per Success', 'Failed Aim Time (s)']
+    metrics['Value'] += [teleport_statistics['Attempts'], teleport_statistics['Attempts_per_Success'], teleport_statistics['Failed_Aim_Time']]
+    
+    # METRIC: Time spent in each section, from the shared section attribution
+    metrics['Metric'].append('Time Spent per Section (s)')
+    metrics['Value'].append(", ".join([f"{section}: {time:.2f}" for section, time in time_in_sections.items()]))
+
+    mean_std_velocity_by_zone = calculate_mean_velocity(head_hands_data)
+
+    # METRIC: Add mean and standard deviation of velocity by zone to metrics_df
+    for _, row in mean_std_velocity_by_zone.iterrows():
+        metrics['Metric'].append(f'Mean Velocity in Zone {row["Zone"]}')
+        metrics['Value'].append(f'{row["Mean_Velocity"]:.6f} ± {row["Std_Velocity"]:.6f}')
+
+    metrics_df = pd.DataFrame(metrics)
+
+    return {
+        'presence': head_hands_data[['Timestamp', 'Section', 'Zone']].reset_index(drop=True),
+        'teleports': teleport_data.loc[teleport_data['WasTP'] == True, ['Timestamp', 'WasTP', 'Current_Section']].reset_index(drop=True),
+        'valid_sections': list(valid_sections),
+        'hand_velocity': head_hands_data_clean[['Timestamp', 'Velocity_HandR_Magnitude', 'Velocity_HandL_Magnitude']].reset_index(drop=True),
+        'stop_counts': stop_counts,
+        'move_counts': move_counts,
+        'stop_percentage': stop_percentage,
+        'move_percentage': move_percentage,
+        'time_in_zones': time_in_zones,
+        'visit_counts': visit_counts,
+        'teleport_hotspot_counts': teleport_data['TPHotspot'].value_counts(),
+        'successful_teleports': successful_teleports,
+        'teleport_statistics': teleport_statistics,
+        'teleport_hotspots': teleport_hotspots,
+        'walked_distances': walked_distances,
+        'metrics_table': metrics_df,
+    }
 
-        total_distance_traveled += current_distance
+def render_report(metrics, output_path, point_budget=DEFAULT_POINT_BUDGET, rasterize=None):
+    """
+    Plots the tables computed by compute_report_metrics and saves them, with the metrics table, to a PDF.
+    The time series are downsampled to point_budget points per figure, so the size of the report does not grow
+    with the length of the session.
 
-        metrics['Metric'].append('Total Distance Traveled (without teleports)')
-        metrics['Value'].append(total_distance_traveled)
-        
-        mean_std_velocity_by_zone = calculate_mean_velocity(head_hands_data)
+    Parameters:
+    metrics (dict): The tables returned by compute_report_metrics.
+    output_path (str): The file path to save the final PDF report.
+    point_budget (int, optional): Maximum number of points of each time-series figure, None to plot every frame.
+    rasterize (bool, optional): Whether to rasterize the dense layers, automatic if None.
+    """
+    import matplotlib.pyplot as plt
+    from matplotlib.backends.backend_pdf import PdfPages
+    
+    stop_counts = metrics['stop_counts']
+    move_counts = metrics['move_counts']
+    stop_percentage = metrics['stop_percentage']
+    move_percentage = metrics['move_percentage']
+    time_in_zones = metrics['time_in_zones']
+    visit_counts = metrics['visit_counts']
+    hand_velocity = metrics['hand_velocity']
+
+    with PdfPages(output_path) as pdf:
+        plot_user_presence_with_sections(metrics['presence'], metrics['teleports'], metrics['valid_sections'], pdf, point_budget, rasterize)
+        plot_bubble_plot(metrics['presence'], metrics['teleports'], metrics['valid_sections'], pdf, point_budget, rasterize)
 
-        # METRIC: Add mean and standard deviation of velocity by zone to metrics_df
-        for _, row in mean_std_velocity_by_zone.iterrows():
-            metrics['Metric'].append(f'Mean Velocity in Zone {row["Zone"]}')
-            metrics['Value'].append(f'{row["Mean_Velocity"]:.6f} ± {row["Std_Velocity"]:.6f}')
+        plt.figure(figsize=(14, 7))
+        # Half of the budget for each hand, keeping the peaks of every bucket
+        for column, label, color in [('Velocity_HandR_Magnitude', 'Right Hand Velocity', 'blue'), ('Velocity_HandL_Magnitude', 'Left Hand Velocity', 'green')]:
+            velocity = hand_velocity.iloc[minmax_indices(hand_velocity['Timestamp'], hand_velocity[column], point_budget and point_budget // 2)]
+            plt.plot(velocity['Timestamp'], velocity[column], label=label, color=color, rasterized=rasterize_layer(len(velocity), rasterize))
+        plt.xlabel('Timestamp')
+        plt.ylabel('Velocity Magnitude (m/s)')
+        plt.title('Hand Velocity Magnitude Over Time')
+        plt.legend()
+        pdf.savefig()
+        plt.close()
+        lap('Hand Velocity Magnitude Over Time')
 
-        metrics_df = pd.DataFrame(metrics)
-        
         fig, ax = plt.subplots(1, 2, figsize=(14, 6))
 
         # GRAPH: Bar chart for stop and move counts
@@ -380,6 +538,7 @@ def generate_report(output_path, head_hands_data, teleport_data, valid_sections)
 
         pdf.savefig(fig)
         plt.close()
+        lap('Stop and Move Counts and Percentages')
 
         fig, ax = plt.subplots(1, 2, figsize=(14, 6))
         time_in_zones.plot(kind='bar', ax=ax[0], color='lightgreen')
@@ -398,8 +557,9 @@ def generate_report(output_path, head_hands_data, teleport_data, valid_sections)
 
         pdf.savefig(fig)
         plt.close()
+        lap('Time Spent in Each Zone')
 
-        teleport_hotspot_counts = teleport_data['TPHotspot'].value_counts()
+        teleport_hotspot_counts = metrics['teleport_hotspot_counts']
         fig, ax = plt.subplots(figsize=(10, 6))
         teleport_hotspot_counts.plot(kind='bar', ax=ax, color='orchid')
         ax.set_title('Visits to Each Teleport Hotspot')
@@ -409,5 +569,32 @@ def generate_report(output_path, head_hands_data, teleport_data, valid_sections)
 
         pdf.savefig(fig)
         plt.close()
+        lap('Visits to Each Teleport Hotspot')
+
+        teleport_hotspots = metrics['teleport_hotspots']
+        if not teleport_hotspots.empty:
+            fig, ax = plt.subplots(figsize=(10, 6))
+            teleport_hotspots['Success_Rate'].plot(kind='bar', ax=ax, color='steelblue')
+            ax.set_title('Teleport Success Rate per Hotspot')
+            ax.set_xlabel('Teleport Hotspot')
+            ax.set_ylabel('Successful Attempts (%)')
+            ax.set_ylim(0, 100)
+            ax.tick_params(axis='x', rotation=45)
+
+            pdf.savefig(fig)
+            plt.close()
+            lap('Teleport Success Rate per Hotspot')
 
-        save_metrics_table_to_pdf(metrics_df, pdf)
\ No newline at end of file
+        save_metrics_table_to_pdf(metrics['metrics_table'], pdf)
+
+def generate_report(output_path, head_hands_data, teleport_data, valid_sections):
+    """
+    Generates a comprehensive report with plots and metrics saved to a PDF.
+
+    Parameters:
+    output_path (str): The file path to save the final PDF report.
+    head_hands_data (pandas.DataFrame): The dataframe of the head and hands data CSV.
+    teleport_data (pandas.DataFrame): The dataframe path of the teleport data CSV.
+    valid_sections (list): List of valid sections conceived in your Unity scene.
+    """
+    render_report(compute_report_metrics(head_hands_data, teleport_data, valid_sections), output_path)
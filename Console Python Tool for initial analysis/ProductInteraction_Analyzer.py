@@ -1,96 +1,120 @@
 import pandas as pd
-import seaborn as sns
 import numpy as np
-import matplotlib.pyplot as plt
-from reportlab.lib.pagesizes import letter
-from reportlab.pdfgen import canvas
-from reportlab.lib.utils import ImageReader
-from matplotlib.backends.backend_pdf import PdfPages
+from csv_cache import strip_string_cells
+from instrumentation import lap
 
-def count_interactions(data):
+# Hands that can hold a product, in the order they are plotted
+HAND_LABELS = ['Right Hand', 'Left Hand', 'Both Hands']
+
+EPISODE_COLUMNS = ['Object', 'Section', 'Hand', 'Start_Frame', 'End_Frame', 'Start_Time', 'End_Time', 'Duration']
+
+def _any_in_range(flags, starts, ends):
+    counts = np.concatenate([[0], np.cumsum(flags)])
+    return counts[ends + 1] - counts[starts] > 0
+
+def extract_interaction_episodes(data):
+    """
+    Extracts the product interactions from the interaction data, one row per interaction. An interaction is the block of
+    consecutive rows of a product that ends when its interactable state stops being 'Select' (it is released).
+    The next interaction starts after that row or when another product is interacted with.
+
+    Parameters:
+    data (pandas.DataFrame): DataFrame containing the interaction data with 'Frame', 'Timestamp', 'Object', 'Section', 'State',
+                             'RightHand_State' and 'LeftHand_State' columns.
+
+    Returns:
+    pandas.DataFrame: The interactions in the order they end, with the product, its section, the hand that selected it
+                      ('Right Hand', 'Left Hand', 'Both Hands' or None), the start and end frame and timestamp and the duration.
+    """
+    n_rows = len(data)
+    if n_rows == 0:
+        return pd.DataFrame(columns=EPISODE_COLUMNS)
+
+    object_codes, _ = pd.factorize(data['Object'])
+    released = (data['State'] != 'Select').to_numpy()
+
+    # Every row that follows a release or changes of product opens a new block of rows
+    new_block = np.ones(n_rows, dtype=bool)
+    new_block[1:] = (object_codes[1:] != object_codes[:-1]) | released[:-1]
+    block_starts = np.flatnonzero(new_block)
+    block_ids = np.cumsum(new_block) - 1
+
+    ends = np.flatnonzero(released)
+    starts = block_starts[block_ids[ends]]
+
+    right = (data['RightHand_State'] == 'Select').to_numpy()
+    left = (data['LeftHand_State'] == 'Select').to_numpy()
+    hand = np.select([_any_in_range(right & left, starts, ends), _any_in_range(right, starts, ends), _any_in_range(left, starts, ends)],
+                     ['Both Hands', 'Right Hand', 'Left Hand'], default=None)
+
+    timestamps = data['Timestamp'].to_numpy(dtype=float)
+    frames = data['Frame'].to_numpy()
+    return pd.DataFrame({
+        'Object': np.asarray(data['Object'])[ends],
+        'Section': np.asarray(data['Section'])[ends],
+        'Hand': hand,
+        'Start_Frame': frames[starts],
+        'End_Frame': frames[ends],
+        'Start_Time': timestamps[starts],
+        'End_Time': timestamps[ends],
+        'Duration': timestamps[ends] - timestamps[starts],
+    })
+
+def count_interactions(data, episodes=None):
     """
     Counts the interactions per product based on the data provided. An interaction is counted as the time a product is started to be interacted with until it is released.
     For interactions other than grab, the interaction starts when its interactable state is 'Select' until that states changes.
 
     Parameters:
     data (pandas.DataFrame): DataFrame containing the interaction data with 'Object' and 'State' columns.
+    episodes (pandas.DataFrame, optional): The interactions already extracted by extract_interaction_episodes.
 
     Returns:
     dict: A dictionary with products as keys and interaction counts as values.
     """
-    interactions = {}
-    current_object = None
-    state = None
-
-    for index, row in data.iterrows():
-        obj = row['Object']
-        state = row['State'].strip()
-
-        if obj != current_object and (state != 'Select'):
-            if current_object is not None:
-                if current_object in interactions:
-                    interactions[current_object] += 1
-                else:
-                    interactions[current_object] = 1
-            current_object = obj
-        else:
-            if state != 'Select':
-                if current_object in interactions:
-                    interactions[current_object] += 1
-                else:
-                    interactions[current_object] = 1
-
-    # Add the last interaction
-    if current_object is not None:
-        if current_object in interactions:
-            interactions[current_object] += 1
-        else:
-            interactions[current_object] = 1
-
-    return interactions
-
-def count_interactions_by_hand(data):
+    if episodes is None:
+        episodes = extract_interaction_episodes(data)
+    return {obj: int(count) for obj, count in episodes.groupby('Object', sort=False).size().items()}
+
+def count_interactions_by_hand(data, episodes=None):
     """
     Counts the interactions by hand (Right Hand, Left Hand, Both Hands) based on the data provided.
 
     Parameters:
     data (pandas.DataFrame): DataFrame containing the interaction data with 'Object', 'RightHand_State', and 'LeftHand_State' columns.
+    episodes (pandas.DataFrame, optional): The interactions already extracted by extract_interaction_episodes.
 
     Returns:
     dict: A dictionary with hand types as keys and interaction counts as values.
     """
-    interactions = {'Right Hand': 0, 'Left Hand': 0, 'Both Hands': 0}
-    current_object = None
-    current_rh_state = None
-    current_lh_state = None
-
-    for index, row in data.iterrows():
-        obj = row['Object']
-        rh_state = row['RightHand_State'].strip()
-        lh_state = row['LeftHand_State'].strip()
-        
-        if obj != current_object or rh_state != current_rh_state or lh_state != current_lh_state:
-            if current_object is not None:
-                if current_rh_state == 'Select' and current_lh_state == 'Select':
-                    interactions['Both Hands'] += 1
-                elif current_rh_state == 'Select':
-                    interactions['Right Hand'] += 1
-                elif current_lh_state == 'Select':
-                    interactions['Left Hand'] += 1
-            current_object = obj
-            current_rh_state = rh_state
-            current_lh_state = lh_state
-
-    # Add the last interaction
-    if current_object is not None:
-        if current_rh_state == 'Select' and current_lh_state == 'Select':
-            interactions['Both Hands'] += 1
-        elif current_rh_state == 'Select':
-            interactions['Right Hand'] += 1
-        elif current_lh_state == 'Select':
-            interactions['Left Hand'] += 1
-
-    return interactions
+    if episodes is None:
+        episodes = extract_interaction_episodes(data)
+    counts = episodes['Hand'].value_counts().reindex(HAND_LABELS, fill_value=0)
+    return {hand: int(count) for hand, count in counts.items()}
+
+def pair_cart_actions(cart):
+    """
+    Pairs every product added to the shopping cart with the first time it is removed afterwards, joining the
+    additions and the removals of each item sorted by time.
+
+    Parameters:
+    cart (pandas.DataFrame): DataFrame containing the shopping cart data with 'Timestamp', 'Item' and 'Action' columns.
+
+    Returns:
+    pandas.DataFrame: One row per addition that was removed later, in the order of the additions, with the item,
+                      the 'Add_Time', the 'Remove_Time' and the time in the cart ('Time_Difference').
+    """
+    actions = cart[['Timestamp', 'Item', 'Action']].astype({'Timestamp': float})
+    additions = actions[actions['Action'] == 'ADD'].rename(columns={'Timestamp': 'Add_Time'})
+    removals = actions[actions['Action'] == 'REMOVE'].rename(columns={'Timestamp': 'Remove_Time'})
+    additions = additions.drop(columns='Action').reset_index().sort_values('Add_Time', kind='stable')
+    removals = removals.drop(columns='Action').sort_values('Remove_Time', kind='stable')
+
+    pairs = pd.merge_asof(additions, removals, left_on='Add_Time', right_on='Remove_Time', by='Item',
+                          direction='forward', allow_exact_matches=False)
+    pairs = pairs.dropna(subset=['Remove_Time']).sort_values('index', kind='stable').drop(columns='index').reset_index(drop=True)
+    pairs['Time_Difference'] = pairs['Remove_Time'] - pairs['Add_Time']
+    return pairs
 
 def calculate_average_durations(data):
     """
@@ -103,22 +127,23 @@ def calculate_average_durations(data):
     pandas.DataFrame: DataFrame with products and their average interaction durations.
     """
     data = data[~data['Object'].isin(['HandGrabInteractable', 'HandGrabInteractable_mirror'])]
-    average_durations = data.groupby('Object')['DurationUntilRelease'].mean()
+    average_durations = data.groupby('Object', observed=True)['DurationUntilRelease'].mean()
     average_durations_df = average_durations.reset_index()
     average_durations_df.columns = ['Product', 'AverageDuration']
     return average_durations_df
 
-def generate_pdf_report(productInteractionDataFrame=None, shoppingCartDataFrame=None, productReleasesDataFrame=None):
+def compute_report_metrics(productInteractionDataFrame=None, shoppingCartDataFrame=None, productReleasesDataFrame=None):
     """
-    Generates a PDF report with various interaction statistics and graphs.
+    Computes the interaction statistics and the tables plotted in the report, so that the rendering does not need the raw data.
 
     Parameters:
     productInteractionDataFrame (pandas.DataFrame, optional): DataFrame with product interaction data.
     shoppingCartDataFrame (pandas.DataFrame, optional): DataFrame with shopping cart data.
     productReleasesDataFrame (pandas.DataFrame, optional): DataFrame with product release data.
+
+    Returns:
+    dict: The tables rendered by render_report.
     """
-    
-    # --- GRAPHS ---
     if productInteractionDataFrame is None:
         productInteractionDataFrame = pd.read_csv('./sample_data/ProductInteractionDataBigEnvironment.csv') 
     if shoppingCartDataFrame is None:
@@ -127,65 +152,84 @@ def generate_pdf_report(productInteractionDataFrame=None, shoppingCartDataFrame=
         productReleasesDataFrame = pd.read_csv('./sample_data/ProductReleasesBigEnvironment.csv')
 
     # Sanytize data
-    shoppingCartDataFrame = shoppingCartDataFrame.applymap(lambda x: x.strip() if isinstance(x, str) else x)
-    productInteractionDataFrame = productInteractionDataFrame.applymap(lambda x: x.strip() if isinstance(x, str) else x)
-    productReleasesDataFrame = productReleasesDataFrame.applymap(lambda x: x.strip() if isinstance(x, str) else x)
-    productInteractionDataFrame.columns = productInteractionDataFrame.columns.str.strip()
-    shoppingCartDataFrame.columns = shoppingCartDataFrame.columns.str.strip()
-    productReleasesDataFrame.columns = productReleasesDataFrame.columns.str.strip()
+    shoppingCartDataFrame = strip_string_cells(shoppingCartDataFrame)
+    productInteractionDataFrame = strip_string_cells(productInteractionDataFrame)
+    productReleasesDataFrame = strip_string_cells(productReleasesDataFrame)
 
     average_durations_df = calculate_average_durations(productReleasesDataFrame)
 
-    interactions = count_interactions(productInteractionDataFrame)
+    episodes = extract_interaction_episodes(productInteractionDataFrame)
+    interactions = count_interactions(productInteractionDataFrame, episodes)
     interactions_df = pd.DataFrame(list(interactions.items()), columns=['Product', 'InteractionCount'])
 
-    hand_interactions = count_interactions_by_hand(productInteractionDataFrame)
-    labels = list(hand_interactions.keys())
-    sizes = list(hand_interactions.values())
-    colors = ['skyblue', 'lightgreen', 'lightcoral']
+    hand_interactions = count_interactions_by_hand(productInteractionDataFrame, episodes)
 
-    section_counts = (productInteractionDataFrame['Section'].value_counts(normalize=True) * 100).round(2)
-    sections = section_counts.index
-    percentages = section_counts.values
-    angles = np.linspace(0, 2 * np.pi, len(sections), endpoint=False).tolist()
-    angles += angles[:1]
-    percentages = np.append(percentages, percentages[0])
+    section_counts = (episodes['Section'].value_counts(normalize=True) * 100).round(2)
 
-    grouped = shoppingCartDataFrame.groupby(['Item', 'Action']).size().unstack(fill_value=0)
-    objects = [obj for obj in interactions.keys() if obj in grouped.index and (grouped.loc[obj, 'ADD'] != 0 or grouped.loc[obj, 'REMOVE'] != 0)]
+    grouped = shoppingCartDataFrame.groupby(['Item', 'Action'], observed=True).size().unstack(fill_value=0)
+    grouped = grouped.reindex(index=list(interactions), columns=['ADD', 'REMOVE'], fill_value=0)
+    grouped = grouped[(grouped['ADD'] != 0) | (grouped['REMOVE'] != 0)]
+    objects = grouped.index.tolist()
     interaction_values = [interactions[obj] for obj in objects]
-    add_values = [grouped.loc[obj, 'ADD'] if obj in grouped.index else 0 for obj in objects]
-    remove_values = [grouped.loc[obj, 'REMOVE'] if obj in grouped.index else 0 for obj in objects]
-    x = range(len(objects))
-    x = np.arange(len(objects))
-    width = 0.3
+    add_values = grouped['ADD'].tolist()
+    remove_values = grouped['REMOVE'].tolist()
 
     # Compute conversion rate
-    total_interactions = sum(interactions.values())
-    total_additions = shoppingCartDataFrame[shoppingCartDataFrame['Action'] == 'ADD'].shape[0]
-    conversion_ratio = total_additions / total_interactions
-
-    add_actions = shoppingCartDataFrame[shoppingCartDataFrame['Action'] == 'ADD']
-    remove_actions = shoppingCartDataFrame[shoppingCartDataFrame['Action'] == 'REMOVE']
-    time_differences = {}
+    total_interactions = len(episodes)
+    total_additions = int((shoppingCartDataFrame['Action'] == 'ADD').sum())
+    conversion_ratio = total_additions / total_interactions if total_interactions else 0.0
+
+    cart_pairs = pair_cart_actions(shoppingCartDataFrame)
+    average_time_differences = cart_pairs.groupby('Item', sort=False, observed=True)['Time_Difference'].mean().to_dict()
+
+    return {
+        'interactions': interactions_df,
+        'average_durations': average_durations_df,
+        'hand_interactions': hand_interactions,
+        'section_percentages': section_counts,
+        'objects': objects,
+        'interaction_values': interaction_values,
+        'add_values': add_values,
+        'remove_values': remove_values,
+        'total_interactions': total_interactions,
+        'total_additions': total_additions,
+        'conversion_ratio': conversion_ratio,
+        'average_time_differences': average_time_differences,
+        'episodes': episodes,
+        'cart_pairs': cart_pairs,
+    }
+
+def render_report(metrics, output_path):
+    """
+    Plots the tables computed by compute_report_metrics and saves them to a PDF.
 
-    for index, add_row in add_actions.iterrows():
-        product = add_row['Item']
-        add_time = add_row['Timestamp']
-        remove_row = remove_actions[(remove_actions['Item'] == product) & (remove_actions['Timestamp'] > add_time)].head(1)
+    Parameters:
+    metrics (dict): The tables returned by compute_report_metrics.
+    output_path (str): The file path to save the PDF report.
+    """
+    import matplotlib.pyplot as plt
+    from matplotlib.backends.backend_pdf import PdfPages
+    
+    interactions_df = metrics['interactions']
+    average_durations_df = metrics['average_durations']
+    labels = list(metrics['hand_interactions'].keys())
+    sizes = list(metrics['hand_interactions'].values())
+    colors = ['skyblue', 'lightgreen', 'lightcoral']
 
-        if not remove_row.empty:
-            remove_time = remove_row['Timestamp'].values[0]
-            time_diff = remove_time - add_time
+    objects = metrics['objects']
+    interaction_values = metrics['interaction_values']
+    add_values = metrics['add_values']
+    remove_values = metrics['remove_values']
+    x = np.arange(len(objects))
+    width = 0.3
 
-            if product in time_differences:
-                time_differences[product].append(time_diff)
-            else:
-                time_differences[product] = [time_diff]
+    total_interactions = metrics['total_interactions']
+    total_additions = metrics['total_additions']
+    conversion_ratio = metrics['conversion_ratio']
+    average_time_differences = metrics['average_time_differences']
 
-    average_time_differences = {product: sum(times) / len(times) for product, times in time_differences.items()}
-    
-    with PdfPages('./reports/VRSI_ProductInteraction_report.pdf') as pdf:
+    # --- GRAPHS ---
+    with PdfPages(output_path) as pdf:
 
         # 1) Number of interactions per product
         plt.figure(figsize=(12, 8))
@@ -194,6 +238,7 @@ def generate_pdf_report(productInteractionDataFrame=None, shoppingCartDataFrame=
         plt.title('Number of interactions per product')
         pdf.savefig()
         plt.close()
+        lap('Number of interactions per product')
 
         # 2) Average interaction per product
         plt.figure(figsize=(12, 8))
@@ -204,30 +249,42 @@ def generate_pdf_report(productInteractionDataFrame=None, shoppingCartDataFrame=
         plt.title('Average interaction per product')
         pdf.savefig()
         plt.close()
+        lap('Average interaction per product')
 
-        # 3) Pie Chart for hand states
-        plt.figure(figsize=(8, 8))
-        plt.pie(sizes, labels=labels, colors=colors, autopct='%1.1f%%', startangle=140)
-        plt.title('Percentage of Interactions by Hand')
-        pdf.savefig()
-        plt.close()
+        # 3) Pie Chart for hand states, only if a hand selected a product
+        if sum(sizes):
+            plt.figure(figsize=(8, 8))
+            plt.pie(sizes, labels=labels, colors=colors, autopct='%1.1f%%', startangle=140)
+            plt.title('Percentage of Interactions by Hand')
+            pdf.savefig()
+            plt.close()
+            lap('Percentage of Interactions by Hand')
 
         # --- STATISTICS ---
-        fig, ax = plt.subplots(figsize=(10, 10), subplot_kw=dict(polar=True))
-        ax.fill(angles, percentages, color='red', alpha=0.25)
-        ax.plot(angles, percentages, color='red', linewidth=2)
-        ax.set_yticklabels([])
-        ax.set_xticks(angles[:-1])
-        ax.set_xticklabels(sections, size=15)
-
-        for i in range(len(sections)):
-            angle = angles[i]
-            percent = percentages[i]
-            ax.text(angle + 0.15, percent + 2, f'{percent:.1f}%', horizontalalignment='center', size=12, color='black', weight='semibold')
-
-        plt.title('Percentage of Interactions by Section', size=20, color='black', y=1.1)
-        pdf.savefig()
-        plt.close()
+        # Sessions without any completed interaction have no sections to show
+        if not metrics['section_percentages'].empty:
+            sections = metrics['section_percentages'].index
+            percentages = metrics['section_percentages'].values
+            angles = np.linspace(0, 2 * np.pi, len(sections), endpoint=False).tolist()
+            angles += angles[:1]
+            percentages = np.append(percentages, percentages[0])
+
+            fig, ax = plt.subplots(figsize=(10, 10), subplot_kw=dict(polar=True))
+            ax.fill(angles, percentages, color='red', alpha=0.25)
+            ax.plot(angles, percentages, color='red', linewidth=2)
+            ax.set_yticklabels([])
+            ax.set_xticks(angles[:-1])
+            ax.set_xticklabels(sections, size=15)
+
+            for i in range(len(sections)):
+                angle = angles[i]
+                percent = percentages[i]
+                ax.text(angle + 0.15, percent + 2, f'{percent:.1f}%', horizontalalignment='center', size=12, color='black', weight='semibold')
+
+            plt.title('Percentage of Interactions by Section', size=20, color='black', y=1.1)
+            pdf.savefig()
+            plt.close()
+            lap('Percentage of Interactions by Section')
 
         # 5) Bar Chart of interactions vs Additions vs Removals
         fig, ax = plt.subplots()
@@ -245,6 +302,7 @@ def generate_pdf_report(productInteractionDataFrame=None, shoppingCartDataFrame=
         fig.tight_layout()
         pdf.savefig()
         plt.close()
+        lap('Counts by interaction, add and remove actions')
 
         data = {
             'Statistic': ['Total Interactions', 'Total additions', 'Conversion rate' ],
@@ -260,10 +318,30 @@ def generate_pdf_report(productInteractionDataFrame=None, shoppingCartDataFrame=
         c = df.shape[1]
         ax.table(cellText=df.values, colLabels=df.columns, bbox=[0,0,1,1], )
         pdf.savefig()
+        plt.close()
+        lap('Statistics table')
+
+        # Sessions without any product removed after being added have no time differences to show
+        if not df_average_time_differences.empty:
+            fig = plt.figure(figsize=(9,2))
+            ax = plt.subplot(111)
+            ax.axis('off')
+            cell_text = df_average_time_differences.values
+            ax.table(cellText=cell_text, colLabels=df_average_time_differences.columns, bbox=[0,0,1,1])
+            pdf.savefig()
+            plt.close()
+            lap('Average time in the cart table')
+
+def generate_pdf_report(productInteractionDataFrame=None, shoppingCartDataFrame=None, productReleasesDataFrame=None,
+                        output_path='./reports/VRSI_ProductInteraction_report.pdf'):
+    """
+    Generates a PDF report with various interaction statistics and graphs.
+
+    Parameters:
+    productInteractionDataFrame (pandas.DataFrame, optional): DataFrame with product interaction data.
+    shoppingCartDataFrame (pandas.DataFrame, optional): DataFrame with shopping cart data.
+    productReleasesDataFrame (pandas.DataFrame, optional): DataFrame with product release data.
+    output_path (str): The file path to save the PDF report.
+    """
+    render_report(compute_report_metrics(productInteractionDataFrame, shoppingCartDataFrame, productReleasesDataFrame), output_path)
 
-        fig = plt.figure(figsize=(9,2))
-        ax = plt.subplot(111)
-        ax.axis('off')
-        cell_text = df_average_time_differences.values
-        ax.table(cellText=cell_text, colLabels=df_average_time_differences.columns, bbox=[0,0,1,1])
-        pdf.savefig()
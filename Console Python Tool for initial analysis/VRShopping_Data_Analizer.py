@@ -1,13 +1,8 @@
-import pandas as pd
-import numpy as np
 import os
 import sys
 
-from vr_idt.vr_idt import classify_fixations
-from Eye_Tracking_Analyzer import generate_statistics_report_ET
-from ProductInteraction_Analyzer import generate_pdf_report
-from Navigation_data_analyzer_v2 import generate_report
-from distances import compute_movement
+from csv_cache import read_csv_cached
+from zones import classify_zones, first_teleport_frame, make_zone_bands
 
 VALID_SECTIONS = ["Food", "Technology", "Decoration", "Toys", "Fashion"]
 
@@ -16,86 +11,49 @@ def sanitize_dataframe(df):
     sanitized_df = df.drop_duplicates(subset=['Frame'])
     return sanitized_df
 
-def find_most_recent_subdirectory(directory):
-    
-	subdirs = [os.path.join(directory, d) for d in os.listdir(directory) if os.path.isdir(os.path.join(directory, d))]
-	if not subdirs:
-		return None
-	recent_subdirectory = max(subdirs, key=os.path.getmtime)
-	return os.path.basename(recent_subdirectory)
-
 def get_all_subdirectories(directory):
     return [name for name in os.listdir(directory) if os.path.isdir(os.path.join(directory, name))]
 
-def load_every_csv_in_directory_in_dictionary(directory):
+def load_every_csv_in_directory_in_dictionary(directory, use_cache=True):
+	# Cleaned frames are cached in a columnar format next to the CSVs and only reparsed when a CSV changes
 	dataframes = {}
 	for item in os.listdir(directory):
 		item_path = os.path.join(directory, item)
 		if os.path.isfile(item_path) and item.endswith(".csv"):
-			dataframes[item] = pd.read_csv(item_path)
-			dataframes[item].columns = dataframes[item].columns.str.strip()
+			dataframes[item] = read_csv_cached(item_path, use_cache)
 			dataframes[item].Name = item
 	return dataframes
 
-def generate_csv_with_fixations(dataframes_dict, subdir_containing_csvs, df, name, min_duration, max_angle, min_freq, **col_name_map):
-	
-	df = classify_fixations(df, min_duration, max_angle, min_freq, **col_name_map)
-	head_and_hands_df = dataframes_dict["HeadHandsDataBigEnvironment.csv"]
-	merged_by_zone = pd.merge(df, head_and_hands_df[['Frame', 'Zone']], on='Frame', how='left')
-	final_df = merged_by_zone.copy()
-	final_df.to_csv('./{0}_withFixations.csv'.format(name), index=False)
-	return df
-
-def segment_in_zones(dataframes_dict, answer='N', shelf_limit=0.15, adjacent_limit=0.325, near_limit=0.55):
-    tp_df = dataframes_dict["TeleportDataBigEnvironment.csv"]
-    
-    first_tp_frame = tp_df[tp_df['WasTP'] == True]['Frame'].min()
+def segment_in_zones(dataframes_dict, answer='N', shelf_limit=0.15, adjacent_limit=0.325, near_limit=0.55, bands=None, overwrite=False):
+    """
+    Segments the head and hands data in zones of interest based on the distance of the player to the shelves.
 
+    Parameters:
+    dataframes_dict (dict): Dictionary with the session dataframes.
+    shelf_limit, adjacent_limit, near_limit (float): Distance limits of the default Shelf/Adjacent/Near/Far zones.
+    bands (sequence, optional): Ordered (name, upper limit) pairs overriding the default limits.
+    overwrite (bool): Whether to segment again data that already has a 'Zone' column.
+
+    Returns:
+    pandas.DataFrame: The head and hands data with a categorical 'Zone' column.
+    """
+    tp_df = dataframes_dict["TeleportDataBigEnvironment.csv"]
     df = dataframes_dict["HeadHandsDataBigEnvironment.csv"]
-    
-    if 'Zone' in df.columns:
+
+    if 'Zone' in df.columns and not overwrite:
         print('CSV file is already segmented in ZOIs.')
-        sys.exit()
-    
-    df['Zone'] = ''
-    
-    df.loc[df['Frame'] < first_tp_frame, 'Zone'] = 'Start'
-    
-    for i, row in df.iterrows():
-        if row['Frame'] < first_tp_frame:
-            continue
-        if row['Distance'] <= shelf_limit:
-            df.at[i, 'Zone'] = 'Shelf'
-        elif shelf_limit < row['Distance'] <= adjacent_limit:
-            df.at[i, 'Zone'] = 'Adjacent'
-        elif adjacent_limit < row['Distance'] <= near_limit:
-            df.at[i, 'Zone'] = 'Near'
-        else:
-            df.at[i, 'Zone'] = 'Far'
-    
+        return df
+
+    if bands is None:
+        bands = make_zone_bands(shelf_limit, adjacent_limit, near_limit)
+
+    df['Zone'] = classify_zones(df['Distance'], df['Frame'], first_teleport_frame(tp_df), bands)
+
     return df
       
 def main():
 	
-	FILENAMES = ["EyeTrackerData-ProductsBigEnvironment.csv", "EyeTrackerData-AOIBigEnvironment.csv", "HeadHandsDataBigEnvironment.csv", 
-			 "ProductInteractionDataBigEnvironment.csv", "ShelvesDataManager.csv", "ShoppingCartDataBigEnvironment.csv", 
-			 "TeleportDataBigEnvironment.csv", "TurningsBigEnvironment.csv"]
-
-	col_name_map = {
-		"time": "Timestamp",
-		"gaze_world_x": "RCHit_x",
-		"gaze_world_y": "RCHit_y",
-		"gaze_world_z": "RCHit_z",
-		"head_pos_x": "HMD_x",
-		"head_pos_y": "HMD_y",
-		"head_pos_z": "HMD_z"
-	}
-
 	directory = None
-	recent_subdirectory = None
-	subdir_containing_csvs = None
-	dataframes_dict = None
-	df = None
 
 	# time_th=0.25, disp_th=1, freq_th=30
 	min_duration = 0.15
@@ -121,8 +79,6 @@ def main():
        |___/
 	   """
 	print(ascii_art)
-	if(not os.path.exists(os.path.join(directory, "reports"))):
-		os.mkdir(os.path.join(directory, "reports"))
                                                                                                                                                                                           
 	directory = input("Please, provide the directory of the execution you want to analyse: ")
 	is_segment_selected = ""
@@ -132,61 +88,51 @@ def main():
 	choice = input("Do you want to analyze a single session or a user's history? (S/H): ").strip().lower()
 
 	if choice == 's':
-
-		dataframes_dict = load_every_csv_in_directory_in_dictionary(directory)
-		print(f"Data loaded from the most recent session: {directory}")
-		for key, value in dataframes_dict.items():
-			print(f"{key}: {len(value)} rows")
+		# The answers are turned into the configuration of the non-interactive runner
+		from pipeline import load_config, run_pipeline  # Imported here, pipeline.py depends on this module
+		config = load_config(sessions=[directory], output_directory=os.path.join(directory, "reports"))
 	elif choice == 'h' or choice == 'n' or choice == 'no':
-		# Analyzing user's history
-		# all_subdirectories = get_all_subdirectories(directory)
-		# print("All subdirectories (user's history):")
-		# print(all_subdirectories)
-		print("Work in progress feature. Please, analyze a single session.")
-		exit()
-	else:
-		print("Invalid input. Please enter 'S' for single session or 'H' for user's history.")
+		# Analyzing user's history: every session subdirectory is analyzed in parallel
+		from history import analyze_user_history  # Imported here, history.py depends on this module
 
-	if(is_segment_selected.upper() == 'Y'):	
-		is_default_values_selected = ""
-	while is_default_values_selected.upper() not in ['Y', 'N']:
-		is_default_values_selected = input("Do you want to use the default values for the distance limits? (Y/N): ")
-	if (is_default_values_selected.upper() == 'N'):
-		shelf_limit = input("Enter the shelf distance limit in meters: ")
-		adjacent_limit = input("Enter the adjacent distance limit in meters: ")
-		near_limit = input("Enter the near distance limit in meters: ")
+		workers = input("Number of worker processes (press Enter to use all the CPUs): ").strip()
 		try:
-			shelf_limit = float(shelf_limit)
-			adjacent_limit = float(adjacent_limit)
-			near_limit = float(near_limit)
+			workers = int(workers) if workers else None
 		except ValueError:
-			print("Invalid input. Distance limits must be numeric values.")
+			print("Invalid input. The number of workers must be an integer.")
 			sys.exit()
-		df = segment_in_zones(dataframes_dict, shelf_limit=shelf_limit, adjacent_limit=adjacent_limit, near_limit=near_limit)
+		history, failures = analyze_user_history(directory, workers=workers, output_directory=os.path.join(directory, "reports"))
+		for table_name, table in history.items():
+			print(f"{table_name}: {len(table)} rows")
+		sys.exit(1 if failures else 0)
 	else:
-		df = segment_in_zones(dataframes_dict)
-	
-	df_segmented_and_movement = compute_movement(df, 0.01)
-	df_segmented_and_movement.to_csv('./HeadHandsDataBigEnvironment_segmented.csv', index=False)
-	dataframes_dict["HeadHandsDataBigEnvironment_segmented.csv"] = df_segmented_and_movement
+		print("Invalid input. Please enter 'S' for single session or 'H' for user's history.")
+		sys.exit()
 
-	
-	generate_csv_with_fixations(dataframes_dict, subdir_containing_csvs, dataframes_dict["EyeTrackerData-ProductsBigEnvironment.csv"], "EyeTrackerData-ProductsBigEnvironment",
-								min_duration, max_angle, min_freq, **col_name_map)
-	generate_csv_with_fixations(dataframes_dict, subdir_containing_csvs, dataframes_dict["EyeTrackerData-AOIBigEnvironment.csv"], "EyeTrackerData-AOIBigEnvironment", 
-								min_duration, max_angle, min_freq, **col_name_map)
-
-	# Generate the PDF report of ET data
-	dataframes_dict["EyeTrackerData-AOIBigEnvironment_withFixations.csv"] = pd.read_csv('./EyeTrackerData-AOIBigEnvironment_withFixations.csv')
-	eye_tracking_data_aoi_df = sanitize_dataframe(dataframes_dict["EyeTrackerData-AOIBigEnvironment_withFixations.csv"])
-	generate_statistics_report_ET(eye_tracking_data_aoi_df, "./reports/VRSI_EyeTrackingAOIs_Report.pdf")
-
-	# Generate the PDF report of Product Interaction data
-	generate_pdf_report()
-	
-	# Generate the PDF report of Navigation data
-	generate_report('./reports/VRSI_Navigation_Report.pdf', dataframes_dict["HeadHandsDataBigEnvironment_segmented.csv"], 
-				 dataframes_dict["TeleportDataBigEnvironment"], VALID_SECTIONS)
+	if(is_segment_selected.upper() == 'Y'):	
+		is_default_values_selected = ""
+		while is_default_values_selected.upper() not in ['Y', 'N']:
+			is_default_values_selected = input("Do you want to use the default values for the distance limits? (Y/N): ")
+		if (is_default_values_selected.upper() == 'N'):
+			shelf_limit = input("Enter the shelf distance limit in meters: ")
+			adjacent_limit = input("Enter the adjacent distance limit in meters: ")
+			near_limit = input("Enter the near distance limit in meters: ")
+			try:
+				config['zone_limits'] = {'shelf': float(shelf_limit), 'adjacent': float(adjacent_limit), 'near': float(near_limit)}
+			except ValueError:
+				print("Invalid input. Distance limits must be numeric values.")
+				sys.exit()
+
+	is_fixations_csv_selected = ""
+	while is_fixations_csv_selected.upper() not in ['Y', 'N']:
+		is_fixations_csv_selected = input("Do you want to save the eye-tracking CSV files with fixations? (Y/N): ")
+	config['save_csvs'] = is_fixations_csv_selected.upper() == 'Y'
+	config['fixations'] = {'min_duration': min_duration, 'max_angle': max_angle, 'min_freq': min_freq}
+
+	# Stages run as a dependency graph, the reports that are up to date are not built again
+	_, failures = run_pipeline(config)
+	if failures:
+		sys.exit(1)
 
 if __name__ == "__main__":
 	main()
\ No newline at end of file
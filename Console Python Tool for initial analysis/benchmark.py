@@ -0,0 +1,141 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import tempfile
+import time
+from datetime import datetime
+
+import matplotlib
+matplotlib.use("Agg")
+
+import numpy as np
+import pandas as pd
+
+import Eye_Tracking_Analyzer
+import Navigation_data_analyzer_v2
+import ProductInteraction_Analyzer
+import fixations
+from VRShopping_Data_Analizer import VALID_SECTIONS, load_every_csv_in_directory_in_dictionary, sanitize_dataframe, segment_in_zones
+from distances import compute_movement
+from history import analyze_user_history
+from synthetic_sessions import SAMPLE_DURATION, SAMPLE_RATE, generate_session, generate_user_history
+
+# Session sizes, as multiples of the sample session
+DEFAULT_SCALES = (1, 10, 100)
+HISTORY_SESSIONS = 3
+
+def _timed(results, scale, stage, function, *args, **kwargs):
+    start = time.perf_counter()
+    value = function(*args, **kwargs)
+    seconds = time.perf_counter() - start
+    results.append({'scale': scale, 'stage': stage, 'seconds': round(seconds, 4)})
+    print(f"{scale:>5}x  {stage:<28} {seconds:10.3f} s")
+    return value
+
+def _render_parts(parts, output_directory, name):
+    for index, (render_function, metrics) in enumerate(parts):
+        render_function(metrics, os.path.join(output_directory, f"{name}_{index}.pdf"))
+
+def benchmark_scale(scale, work_directory, seed=0, min_duration=0.15, max_angle=1.5, min_freq=30, history=True):
+    """
+    Times every stage of the analysis pipeline on a synthetic session 'scale' times as long as the sample one.
+
+    Parameters:
+    scale (float): Size of the session as a multiple of the sample session.
+    work_directory (str): Directory where the synthetic sessions and the reports are written.
+    seed (int): Seed of the synthetic session generator.
+    min_duration, max_angle, min_freq (float): I-DT parameters.
+    history (bool): Whether to time the history aggregation of several sessions of that size.
+
+    Returns:
+    list: One result per stage: scale, stage, seconds and number of head and hands frames.
+    """
+    results = []
+    session_directory = os.path.join(work_directory, f"session_{scale}x")
+    reports_directory = os.path.join(work_directory, f"reports_{scale}x")
+    os.makedirs(reports_directory, exist_ok=True)
+
+    rows = _timed(results, scale, 'generate', generate_session, session_directory, SAMPLE_DURATION * scale, SAMPLE_RATE, seed=seed)
+    dataframes_dict = _timed(results, scale, 'load', load_every_csv_in_directory_in_dictionary, session_directory, use_cache=False)
+    head_hands_data = _timed(results, scale, 'segmentation', segment_in_zones, dataframes_dict)
+    head_hands_data = _timed(results, scale, 'movement', compute_movement, head_hands_data, 0.01)
+
+    # The memo would hide the cost of I-DT
+    fixations._fixations_memo.clear()
+    streams = _timed(results, scale, 'fixations', fixations.classify_session_fixations, {
+        "EyeTrackerData-ProductsBigEnvironment": dataframes_dict["EyeTrackerData-ProductsBigEnvironment.csv"],
+        "EyeTrackerData-AOIBigEnvironment": dataframes_dict["EyeTrackerData-AOIBigEnvironment.csv"]},
+        min_duration, max_angle, min_freq, head_and_hands_df=head_hands_data)
+
+    eye_tracking_data = sanitize_dataframe(streams["EyeTrackerData-AOIBigEnvironment"])
+    metrics = _timed(results, scale, 'eye_tracking_metrics', Eye_Tracking_Analyzer.compute_report_metrics, eye_tracking_data)
+    _timed(results, scale, 'eye_tracking_render', _render_parts, Eye_Tracking_Analyzer.report_parts(metrics), reports_directory, 'eye_tracking')
+
+    metrics = _timed(results, scale, 'product_metrics', ProductInteraction_Analyzer.compute_report_metrics,
+                     dataframes_dict["ProductInteractionDataBigEnvironment.csv"], dataframes_dict["ShoppingCartDataBigEnvironment.csv"],
+                     dataframes_dict["ProductReleasesBigEnvironment.csv"])
+    _timed(results, scale, 'product_render', ProductInteraction_Analyzer.render_report, metrics, os.path.join(reports_directory, 'product.pdf'))
+
+    metrics = _timed(results, scale, 'navigation_metrics', Navigation_data_analyzer_v2.compute_report_metrics,
+                     head_hands_data, dataframes_dict["TeleportDataBigEnvironment.csv"], VALID_SECTIONS)
+    _timed(results, scale, 'navigation_render', Navigation_data_analyzer_v2.render_report, metrics, os.path.join(reports_directory, 'navigation.pdf'))
+
+    if history:
+        user_directory = os.path.join(work_directory, f"user_{scale}x")
+        generate_user_history(user_directory, HISTORY_SESSIONS, SAMPLE_DURATION * scale, SAMPLE_RATE, seed=seed)
+        _timed(results, scale, 'history', analyze_user_history, user_directory)
+
+    for result in results:
+        result['frames'] = rows["HeadHandsDataBigEnvironment.csv"]
+    return results
+
+def run_benchmarks(scales=DEFAULT_SCALES, output_path=None, work_directory=None, seed=0, history=True):
+    """
+    Runs the pipeline benchmark at several scales and saves the timings as JSON.
+
+    Parameters:
+    scales (sequence): Session sizes as multiples of the sample session.
+    output_path (str, optional): JSON file where the results are written.
+    work_directory (str, optional): Directory for the synthetic sessions. A temporary one is used and removed if not given.
+    seed (int): Seed of the synthetic session generator.
+    history (bool): Whether to time the history aggregation.
+
+    Returns:
+    dict: The environment and the results of every stage.
+    """
+    temporary = work_directory is None
+    work_directory = work_directory or tempfile.mkdtemp(prefix="vrsi_benchmark_")
+    try:
+        results = []
+        for scale in scales:
+            results.extend(benchmark_scale(scale, work_directory, seed=seed, history=history))
+    finally:
+        if temporary:
+            shutil.rmtree(work_directory, ignore_errors=True)
+
+    report = {
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'environment': {'python': platform.python_version(), 'platform': platform.platform(), 'cpus': os.cpu_count(),
+                        'numpy': np.__version__, 'pandas': pd.__version__, 'matplotlib': matplotlib.__version__},
+        'sample': {'duration': SAMPLE_DURATION, 'sample_rate': SAMPLE_RATE},
+        'results': results,
+    }
+    if output_path is not None:
+        with open(output_path, 'w') as file:
+            json.dump(report, file, indent=2)
+        print(f"Results saved to {output_path}")
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Times every stage of the analysis pipeline on synthetic sessions.")
+    parser.add_argument("--scales", type=float, nargs="+", default=list(DEFAULT_SCALES), help="Session sizes as multiples of the sample session.")
+    parser.add_argument("--output", default="benchmark_results.json", help="JSON file where the results are written.")
+    parser.add_argument("--work-directory", default=None, help="Directory for the synthetic sessions (kept after the run).")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the synthetic session generator.")
+    parser.add_argument("--no-history", action="store_true", help="Skip the history aggregation benchmark.")
+    args = parser.parse_args()
+
+    scales = [int(scale) if float(scale).is_integer() else scale for scale in args.scales]
+    run_benchmarks(scales, args.output, args.work_directory, args.seed, history=not args.no_history)
@@ -0,0 +1,152 @@
+import hashlib
+import json
+import os
+
+import pandas as pd
+
+from schemas import read_stream_csv, schema_for
+
+try:
+    import pyarrow  # noqa: F401 (required by pandas to read and write parquet files)
+    PARQUET_AVAILABLE = True
+except ImportError:
+    PARQUET_AVAILABLE = False
+
+# The cache is stored next to the CSV files of each session
+CACHE_DIRECTORY_NAME = ".vrsi_cache"
+# Increase it whenever the cleaning of the frames changes, so that old caches are rebuilt
+CACHE_FORMAT_VERSION = 2
+HASH_BLOCK_SIZE = 1 << 20
+
+def strip_string_cells(df):
+    """
+    Strips the header and the string cells of a DataFrame read from the VRSI CSV files.
+    Frames that were already cleaned (e.g. loaded from the cache) are returned as they are.
+
+    Parameters:
+    df (pandas.DataFrame): The DataFrame to clean.
+
+    Returns:
+    pandas.DataFrame: The cleaned DataFrame. The given DataFrame is not modified.
+    """
+    if df.attrs.get('cleaned'):
+        return df
+
+    df = df.copy(deep=False)
+    df.columns = df.columns.str.strip()
+    for column in df.select_dtypes(include='object').columns:
+        df[column] = df[column].str.strip()
+    df.attrs['cleaned'] = True
+    return df
+
+def clean_csv_frame(df):
+    """
+    Strips the header and the string cells and converts the 'True'/'False' columns (e.g. WasTP) to booleans.
+
+    Parameters:
+    df (pandas.DataFrame): The DataFrame as read by pd.read_csv.
+
+    Returns:
+    pandas.DataFrame: The cleaned DataFrame.
+    """
+    df = strip_string_cells(df)
+    for column in df.select_dtypes(include='object').columns:
+        values = df[column].dropna().unique()
+        if len(values) and set(values) <= {'True', 'False'}:
+            df[column] = df[column] == 'True'
+    return df
+
+def parse_csv(csv_path):
+    """
+    Parses a session CSV file. The streams with a declared schema are typed while parsing (integer frames,
+    float32 coordinates, booleans and categorical labels), the rest are only cleaned.
+
+    Parameters:
+    csv_path (str): The path of the CSV file.
+
+    Returns:
+    pandas.DataFrame: The cleaned DataFrame.
+    """
+    if schema_for(csv_path) is None:
+        return clean_csv_frame(pd.read_csv(csv_path))
+    df = read_stream_csv(csv_path)
+    df.attrs['cleaned'] = True
+    return df
+
+def file_digest(path):
+    """
+    Computes the content hash of a file.
+
+    Parameters:
+    path (str): The path of the file.
+
+    Returns:
+    str: Hexadecimal BLAKE2b digest of the file content.
+    """
+    digest = hashlib.blake2b(digest_size=20)
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(HASH_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _cache_paths(csv_path):
+    directory, name = os.path.split(csv_path)
+    cache_directory = os.path.join(directory, CACHE_DIRECTORY_NAME)
+    return cache_directory, os.path.join(cache_directory, name + ".parquet"), os.path.join(cache_directory, name + ".json")
+
+def _read_cache_key(key_path):
+    try:
+        with open(key_path) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+def _write_cache_key(key_path, key):
+    with open(key_path, 'w') as file:
+        json.dump(key, file)
+
+def read_csv_cached(csv_path, use_cache=True):
+    """
+    Reads and cleans a session CSV file, storing the cleaned frame in a parquet cache next to it.
+    The cache is keyed by the size, modification time and content hash of the CSV and it is only rebuilt
+    when the CSV changes. If only the modification time changed, the content hash is checked before reparsing.
+
+    Parameters:
+    csv_path (str): The path of the CSV file.
+    use_cache (bool): Whether to use the cache. It is ignored if pyarrow is not installed.
+
+    Returns:
+    pandas.DataFrame: The cleaned DataFrame.
+    """
+    if not (use_cache and PARQUET_AVAILABLE):
+        return parse_csv(csv_path)
+
+    cache_directory, parquet_path, key_path = _cache_paths(csv_path)
+    stat = os.stat(csv_path)
+    key = {'version': CACHE_FORMAT_VERSION, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+    cached_key = _read_cache_key(key_path)
+
+    if cached_key is not None and os.path.exists(parquet_path) and cached_key.get('version') == CACHE_FORMAT_VERSION \
+            and cached_key.get('size') == stat.st_size:
+        if cached_key.get('mtime_ns') != stat.st_mtime_ns:
+            # The file was touched, only reuse the cache if its content did not change
+            key['digest'] = file_digest(csv_path)
+            if cached_key.get('digest') != key['digest']:
+                cached_key = None
+            else:
+                _write_cache_key(key_path, key)
+        if cached_key is not None:
+            df = pd.read_parquet(parquet_path)
+            df.attrs['cleaned'] = True
+            return df
+
+    df = parse_csv(csv_path)
+    key['digest'] = key.get('digest') or file_digest(csv_path)
+    try:
+        os.makedirs(cache_directory, exist_ok=True)
+        df.to_parquet(parquet_path, index=False)
+        _write_cache_key(key_path, key)
+    except OSError as error:
+        # A read-only session directory must not prevent the analysis
+        print(f"Could not cache {csv_path}: {error}")
+    return df
@@ -1,6 +1,7 @@
 import pandas as pd
 import numpy as np
-from warnings import filterwarnings
+
+POSITION_COLUMNS = ['HMD_x', 'HMD_y', 'HMD_z']
 
 def euclidean_distance(point1, point2):
     """
@@ -15,40 +16,194 @@ def euclidean_distance(point1, point2):
     """
     return np.sqrt((point1[0] - point2[0])**2 + (point1[1] - point2[1])**2 + (point1[2] - point2[2])**2)
 
-def compute_movement(df, threshold=None):
+def frame_displacements(positions, previous_position=None):
+    """
+    Computes the Euclidean distance between each point and the previous one.
+
+    Parameters:
+    positions (numpy.ndarray): (N, 3) array with the 3D coordinates of each frame.
+    previous_position (numpy.ndarray, optional): Last point of the previous chunk. If not given, the first displacement is 0.
+
+    Returns:
+    numpy.ndarray: Displacement of each frame.
+    """
+    if len(positions) == 0:
+        return np.zeros(0)
+    first = positions[:1] if previous_position is None else np.asarray(previous_position).reshape(1, -1)
+    deltas = np.diff(positions, axis=0, prepend=first)
+    return np.sqrt((deltas**2).sum(axis=1))
+
+def _apply_hysteresis(displacements, threshold, release_threshold, previous_moving):
+    """
+    Returns True for 'Move' frames. A frame starts a movement when its displacement reaches 'threshold'
+    and the movement only ends when the displacement drops below 'release_threshold'.
+    Frames in between keep the state of the previous frame.
+    """
+    decided = np.full(len(displacements), -1, dtype=np.int8)
+    decided[displacements >= threshold] = 1
+    decided[displacements < release_threshold] = 0
+
+    # Forward fill undecided frames with the index of the last decided one
+    last_decided = np.where(decided >= 0, np.arange(len(decided)), -1)
+    np.maximum.accumulate(last_decided, out=last_decided)
+
+    moving = np.full(len(decided), previous_moving, dtype=bool)
+    has_previous = last_decided >= 0
+    moving[has_previous] = decided[last_decided[has_previous]] == 1
+    return moving
+
+def _apply_min_dwell(moving, min_dwell, previous_moving):
+    """
+    Absorbs the runs shorter than 'min_dwell' frames into the state that preceded them.
+    """
+    if len(moving) == 0:
+        return moving
+
+    run_starts = np.flatnonzero(np.diff(moving.astype(np.int8), prepend=np.int8(not moving[0])))
+    run_lengths = np.diff(np.append(run_starts, len(moving)))
+    run_states = moving[run_starts]
+
+    keep = run_lengths >= min_dwell
+    # Short runs take the state of the last long run, or the carried state at the beginning
+    last_long = np.where(keep, np.arange(len(run_starts)), -1)
+    np.maximum.accumulate(last_long, out=last_long)
+    smoothed_states = np.where(last_long >= 0, run_states[np.maximum(last_long, 0)], previous_moving)
+
+    return np.repeat(smoothed_states, run_lengths)
+
+def classify_movement(displacements, threshold=0.01, release_threshold=None, min_dwell=None, previous_moving=False):
+    """
+    Classifies each frame as moving or stopped from its displacement.
+
+    Parameters:
+    displacements (numpy.ndarray): Displacement of each frame.
+    threshold (float): Displacement from which a frame is considered a movement.
+    release_threshold (float, optional): Displacement below which a movement ends (hysteresis). Defaults to 'threshold'.
+    min_dwell (int, optional): Minimum number of frames of a Stop/Move run. Shorter runs are merged into the previous state.
+    previous_moving (bool): State of the frame preceding the first one.
+
+    Returns:
+    numpy.ndarray: Boolean array, True for 'Move' frames.
+    """
+    if release_threshold is None or release_threshold >= threshold:
+        moving = displacements >= threshold
+    else:
+        moving = _apply_hysteresis(displacements, threshold, release_threshold, previous_moving)
+
+    if min_dwell is not None and min_dwell > 1:
+        moving = _apply_min_dwell(moving, min_dwell, previous_moving)
+
+    return moving
+
+def _movement_columns(df, threshold, release_threshold, min_dwell, carry):
+    """
+    Computes the displacement, speed and status of a chunk, continuing from the state in 'carry'.
+    Returns the updated carry state.
+    """
+    positions = df[POSITION_COLUMNS].to_numpy(dtype=float)
+    timestamps = df['Timestamp'].to_numpy(dtype=float)
+
+    displacements = frame_displacements(positions, carry.get('position'))
+    previous_timestamp = carry.get('timestamp')
+    time_deltas = np.diff(timestamps, prepend=timestamps[:1] if previous_timestamp is None else previous_timestamp)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        speeds = np.where(time_deltas > 0, displacements / time_deltas, 0.0)
+
+    moving = classify_movement(displacements, threshold, release_threshold, min_dwell, carry.get('moving', False))
+
+    df['Displacement'] = displacements
+    df['Speed'] = speeds
+    df['Status'] = np.where(moving, 'Move', 'Stop')
+
+    if len(df):
+        carry = {'position': positions[-1], 'timestamp': timestamps[-1], 'moving': bool(moving[-1])}
+    return carry
+
+def compute_movement(df, threshold=None, release_threshold=None, min_dwell=None):
     """
     Computes movement status based on the Euclidean distance between consecutive points.
 
     Parameters:
-    df (pandas.DataFrame): DataFrame containing 'HMD_x', 'HMD_y', 'HMD_z' columns for 3D coordinates.
+    df (pandas.DataFrame): DataFrame containing 'Timestamp', 'HMD_x', 'HMD_y', 'HMD_z' columns for 3D coordinates.
     threshold (float, optional): Threshold distance to determine if movement occurred. Defaults to 0.01.
+    release_threshold (float, optional): Lower threshold to end a movement (hysteresis). Defaults to 'threshold'.
+    min_dwell (int, optional): Minimum number of frames of a Stop/Move run. Shorter runs are merged into the previous state.
+
+    Returns:
+    pandas.DataFrame: DataFrame with additional 'Displacement', 'Speed' and 'Status' ('Stop' or 'Move') columns.
+    """
+    if threshold is None:
+        threshold = 0.01
+
+    # The first row is always "Stop", as there is no previous point to compare with
+    _movement_columns(df, threshold, release_threshold, min_dwell, {})
+
+    return df
+
+def continue_movement(df, carry=None, threshold=None, release_threshold=None):
+    """
+    Computes the movement status of the next rows of a recording that is still growing (e.g. a session being recorded),
+    continuing from the state of the rows processed before.
+
+    Parameters:
+    df (pandas.DataFrame): The new rows, with 'Timestamp', 'HMD_x', 'HMD_y', 'HMD_z' columns.
+    carry (dict, optional): The state returned for the previous rows. Empty for the first rows of the recording.
+    threshold, release_threshold: See compute_movement.
 
     Returns:
-    pandas.DataFrame: DataFrame with an additional 'Status' column indicating 'Stop' or 'Move'.
+    dict: The state to pass with the next rows. 'Displacement', 'Speed' and 'Status' are added to 'df'.
     """
-    distances = []
+    if threshold is None:
+        threshold = 0.01
+    return _movement_columns(df, threshold, release_threshold, None, carry or {})
 
-    filterwarnings("ignore")
+def compute_movement_in_chunks(chunks, threshold=None, release_threshold=None, min_dwell=None):
+    """
+    Computes the movement status of a recording read in chunks (e.g. pd.read_csv(..., chunksize=N)),
+    carrying the last position, timestamp and state over chunk boundaries.
+    With 'min_dwell', the last run of each chunk is held back until it is known whether it is long enough.
 
-    for i in range(1, len(df)):
-        current_point = df.loc[i, ['HMD_x', 'HMD_y', 'HMD_z']]
-        previous_point = df.loc[i-1, ['HMD_x', 'HMD_y', 'HMD_z']]
-        distance = euclidean_distance(current_point, previous_point)
-        distances.append(distance)
+    Parameters:
+    chunks (iterable): Iterable of consecutive DataFrames of the same recording.
+    threshold, release_threshold, min_dwell: See compute_movement.
 
+    Yields:
+    pandas.DataFrame: Each chunk with the 'Displacement', 'Speed' and 'Status' columns.
+    """
     if threshold is None:
         threshold = 0.01
 
-    states = []
+    carry = {}
+    pending = None
+    pending_carry = {}
 
-    # Calculate the Euclidean distance between each row and the previous one and determine the state
-    for i in range(1, len(df)):
-        current_point = df.loc[i, ['HMD_x', 'HMD_y', 'HMD_z']]
-        previous_point = df.loc[i-1, ['HMD_x', 'HMD_y', 'HMD_z']]
-        distance = euclidean_distance(current_point, previous_point)
-        state = "Stop" if distance < threshold else "Move"
-        states.append(state)
+    for chunk in chunks:
+        if min_dwell is None or min_dwell <= 1:
+            carry = _movement_columns(chunk, threshold, release_threshold, min_dwell, carry)
+            yield chunk
+            continue
 
-    df['Status'] = ['Stop'] + states  # Assume the first row is "Stop"
+        if pending is not None:
+            chunk = pd.concat([pending, chunk])
+        # Classify again the held back run together with the new rows, from the state before it
+        _movement_columns(chunk, threshold, release_threshold, min_dwell, pending_carry)
 
-    return df
+        moving = chunk['Status'].to_numpy() == 'Move'
+        raw_moving = classify_movement(chunk['Displacement'].to_numpy(), threshold, release_threshold, None, pending_carry.get('moving', False))
+        # Hold back the trailing raw run, its length may still grow with the next chunk
+        changes = np.flatnonzero(raw_moving[1:] != raw_moving[:-1])
+        split = changes[-1] + 1 if len(changes) else 0
+        if split == 0:
+            pending = chunk
+            continue
+
+        pending = chunk.iloc[split:].copy()
+        ready = chunk.iloc[:split].copy()
+        last = ready.iloc[-1]
+        pending_carry = {'position': last[POSITION_COLUMNS].to_numpy(dtype=float), 'timestamp': last['Timestamp'], 'moving': bool(moving[split - 1])}
+        yield ready
+
+    if pending is not None and len(pending):
+        _movement_columns(pending, threshold, release_threshold, min_dwell, pending_carry)
+        yield pending
@@ -0,0 +1,95 @@
+import numpy as np
+import pandas as pd
+
+# Maximum number of points drawn in each time-series figure, roughly the horizontal resolution of a printed page.
+# None draws every point.
+DEFAULT_POINT_BUDGET = 4000
+# Layers that still have more points than this are rasterized when rasterization is automatic
+RASTERIZE_THRESHOLD = 10000
+
+def _buckets(x, n_buckets):
+    x = np.asarray(x, dtype=float)
+    finite = np.isfinite(x)
+    if not finite.any():
+        return np.zeros(len(x), dtype=np.intp)
+    start, end = x[finite].min(), x[finite].max()
+    width = (end - start) / n_buckets if end > start else 1.0
+    buckets = np.floor((np.where(finite, x, start) - start) / width).astype(np.intp)
+    return np.clip(buckets, 0, n_buckets - 1)
+
+def minmax_indices(x, y, budget):
+    """
+    Selects the points of a line that keep its shape: the minimum and the maximum of every one of budget / 2
+    equal buckets of the x range, plus the first and last points. Spikes are never dropped.
+
+    Parameters:
+    x (array-like): The x values (e.g. timestamps), sorted.
+    y (array-like): The y values.
+    budget (int): Maximum number of points, or None to keep every point.
+
+    Returns:
+    numpy.ndarray: The indices of the selected points, sorted.
+    """
+    n = len(x)
+    if budget is None or n <= budget:
+        return np.arange(n)
+    y = np.asarray(y, dtype=float)
+    # x is sorted, so every bucket is a contiguous block
+    buckets = _buckets(x, max(budget // 2 - 1, 1))
+    starts = np.flatnonzero(np.diff(buckets, prepend=-1))
+    lengths = np.diff(np.append(starts, n))
+    selected = [[0, n - 1]]
+    for reduce in [np.fmin, np.fmax]:
+        # First point of each bucket equal to its extreme, buckets with only NaN values keep their first point
+        extremes = np.repeat(reduce.reduceat(y, starts), lengths)
+        candidates = (y == extremes) | np.isnan(extremes)
+        selected.append(np.flatnonzero(candidates)[np.unique(buckets[candidates], return_index=True)[1]])
+    return np.unique(np.concatenate(selected))
+
+def categorical_indices(x, categories, budget):
+    """
+    Selects the points of a scatter plot of categories over time (e.g. the section the user is in): at most one
+    point per category in each of a number of equal buckets of the x range. Every bucket where a category is
+    present keeps a point, so the plot looks the same. The buckets are made wider when the categories change so
+    often that more than budget points would be kept.
+
+    Parameters:
+    x (array-like): The x values (e.g. timestamps).
+    categories (array-like or list of array-likes): The category of every point. Several arrays are combined,
+                                                   e.g. the section and the zone.
+    budget (int): Maximum number of points, approximately, or None to keep every point.
+
+    Returns:
+    numpy.ndarray: The indices of the selected points, sorted.
+    """
+    n = len(x)
+    if budget is None or n <= budget:
+        return np.arange(n)
+    if not isinstance(categories, list):
+        categories = [categories]
+    codes = np.zeros(n, dtype=np.int64)
+    for values in categories:
+        values_codes, uniques = pd.factorize(pd.Series(np.asarray(values)), use_na_sentinel=False)
+        codes = codes * len(uniques) + values_codes
+    n_codes = int(codes.max()) + 1
+
+    def first_per_bucket(n_buckets):
+        return np.unique(_buckets(x, n_buckets).astype(np.int64) * n_codes + codes, return_index=True)[1]
+    selected = first_per_bucket(budget)
+    if len(selected) > budget:
+        selected = first_per_bucket(max(budget * budget // len(selected), 1))
+    return np.sort(selected)
+
+def rasterize_layer(n_points, rasterize=None):
+    """
+    Decides whether a layer of a figure is rasterized in the PDF instead of drawn as vector markers.
+
+    Parameters:
+    n_points (int): Number of points of the layer.
+    rasterize (bool, optional): True or False to force it. If None, only layers with more than RASTERIZE_THRESHOLD
+                                points are rasterized.
+
+    Returns:
+    bool: Whether to rasterize the layer.
+    """
+    return n_points > RASTERIZE_THRESHOLD if rasterize is None else bool(rasterize)
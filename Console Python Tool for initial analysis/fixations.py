@@ -0,0 +1,128 @@
+import hashlib
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+from vr_idt.vr_idt import classify_fixations
+
+from csv_cache import PARQUET_AVAILABLE
+
+# Mapping between the columns expected by vr_idt and the columns of the VRSI eye-tracking CSV files
+COL_NAME_MAP = {
+    "time": "Timestamp",
+    "gaze_world_x": "RCHit_x",
+    "gaze_world_y": "RCHit_y",
+    "gaze_world_z": "RCHit_z",
+    "head_pos_x": "HMD_x",
+    "head_pos_y": "HMD_y",
+    "head_pos_z": "HMD_z"
+}
+
+FIXATION_COLUMNS = ["fixation", "fixation_start", "fixation_end", "fixation_duration"]
+
+# In-process memo of the classified fixation columns, by cache key
+_fixations_memo = {}
+
+def fixation_cache_key(df, min_duration, max_angle, min_freq, col_name_map=COL_NAME_MAP):
+    """
+    Computes the memoization key of a fixation classification: a digest of the columns used by I-DT plus its parameters.
+
+    Parameters:
+    df (pandas.DataFrame): The eye-tracking data.
+    min_duration, max_angle, min_freq (float): I-DT parameters.
+    col_name_map (dict): Mapping between the vr_idt column names and the DataFrame columns.
+
+    Returns:
+    str: Hexadecimal key.
+    """
+    columns = list(col_name_map.values())
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update(pd.util.hash_pandas_object(df[columns], index=False).to_numpy().tobytes())
+    digest.update(repr((float(min_duration), float(max_angle), float(min_freq), columns)).encode())
+    return digest.hexdigest()
+
+def _load_memoized(key, cache_directory):
+    if key in _fixations_memo:
+        return _fixations_memo[key]
+    if cache_directory is not None and PARQUET_AVAILABLE:
+        path = os.path.join(cache_directory, f"fixations_{key}.parquet")
+        if os.path.exists(path):
+            _fixations_memo[key] = pd.read_parquet(path)
+            return _fixations_memo[key]
+    return None
+
+def _store_memoized(key, fixations_df, cache_directory):
+    _fixations_memo[key] = fixations_df
+    if cache_directory is not None and PARQUET_AVAILABLE:
+        try:
+            os.makedirs(cache_directory, exist_ok=True)
+            fixations_df.to_parquet(os.path.join(cache_directory, f"fixations_{key}.parquet"), index=False)
+        except OSError as error:
+            print(f"Could not cache the fixations: {error}")
+
+def _classify_fixation_columns(df, min_duration, max_angle, min_freq, col_name_map):
+    """
+    Runs I-DT on the columns it needs only, so that little data is sent to the worker processes.
+    """
+    fixation_df = classify_fixations(df, min_duration, max_angle, min_freq, **col_name_map)
+    return fixation_df[FIXATION_COLUMNS]
+
+def add_zones(df, head_and_hands_df):
+    """
+    Adds the zone of interest of each frame, taken from the segmented head and hands data.
+
+    Parameters:
+    df (pandas.DataFrame): The eye-tracking data.
+    head_and_hands_df (pandas.DataFrame): The head and hands data with a 'Zone' column.
+
+    Returns:
+    pandas.DataFrame: The eye-tracking data with the 'Zone' column.
+    """
+    if head_and_hands_df is None or 'Zone' not in head_and_hands_df.columns:
+        return df
+    return pd.merge(df.drop(columns='Zone', errors='ignore'), head_and_hands_df[['Frame', 'Zone']], on='Frame', how='left')
+
+def classify_session_fixations(streams, min_duration, max_angle, min_freq, head_and_hands_df=None, workers=None,
+                               cache_directory=None, output_directory=None, col_name_map=COL_NAME_MAP):
+    """
+    Classifies the fixations of several eye-tracking streams concurrently, in a pool of worker processes.
+    The workers are spawned rather than forked, so that the function can be called from a thread (as the pipeline
+    stages are run) while other threads hold locks in pandas or numpy.
+    Results are memoized on (input digest, min_duration, max_angle, min_freq), in memory and, if 'cache_directory'
+    is given, on disk, so regenerating the reports does not run I-DT again.
+
+    Parameters:
+    streams (dict): Eye-tracking DataFrames by name (e.g. "EyeTrackerData-AOIBigEnvironment").
+    min_duration, max_angle, min_freq (float): I-DT parameters.
+    head_and_hands_df (pandas.DataFrame, optional): Segmented head and hands data to add the 'Zone' of each frame.
+    workers (int, optional): Number of worker processes. Defaults to the number of streams to classify.
+    cache_directory (str, optional): Directory where the classified fixations are memoized.
+    output_directory (str, optional): If given, each result is also written as <name>_withFixations.csv.
+
+    Returns:
+    dict: The DataFrames with the fixation columns (and 'Zone'), by name.
+    """
+    streams = {name: df.reset_index(drop=True) for name, df in streams.items()}
+    keys = {name: fixation_cache_key(df, min_duration, max_angle, min_freq, col_name_map) for name, df in streams.items()}
+    fixations = {name: _load_memoized(key, cache_directory) for name, key in keys.items()}
+
+    pending = [name for name, fixation_df in fixations.items() if fixation_df is None]
+    if len(pending) == 1:
+        name = pending[0]
+        fixations[name] = _classify_fixation_columns(streams[name][list(col_name_map.values())], min_duration, max_angle, min_freq, col_name_map)
+    elif pending:
+        with ProcessPoolExecutor(max_workers=workers or len(pending), mp_context=multiprocessing.get_context("spawn")) as executor:
+            futures = {name: executor.submit(_classify_fixation_columns, streams[name][list(col_name_map.values())],
+                                             min_duration, max_angle, min_freq, col_name_map) for name in pending}
+            for name, future in futures.items():
+                fixations[name] = future.result()
+    for name in pending:
+        _store_memoized(keys[name], fixations[name], cache_directory)
+
+    results = {}
+    for name, df in streams.items():
+        results[name] = add_zones(df.drop(columns=FIXATION_COLUMNS, errors='ignore').join(fixations[name]), head_and_hands_df)
+        if output_directory is not None:
+            results[name].to_csv(os.path.join(output_directory, '{0}_withFixations.csv'.format(name)), index=False)
+    return results
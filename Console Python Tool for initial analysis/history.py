@@ -0,0 +1,272 @@
+import os
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+import pandas as pd
+
+from VRShopping_Data_Analizer import get_all_subdirectories, load_every_csv_in_directory_in_dictionary, segment_in_zones
+from csv_cache import read_csv_cached
+from distances import compute_movement
+from zones import parse_was_tp
+from Navigation_data_analyzer_v2 import count_stops_and_moves, teleport_attempt_statistics
+from Eye_Tracking_Analyzer import extract_fixation_events
+from ProductInteraction_Analyzer import count_interactions
+from visits import count_runs, run_lengths, total_per_label
+from streaming import HEAD_HANDS_FILE, stream_session_metrics
+from instrumentation import activate, new_run_log, stage, write_run_log
+from occupancy import POINT_FILE_PREFIXES, save_grid, sessions_grid
+from shelf_gaze import SHELF_GAZE_FILES, save_session_shelf_grids, save_shelf_grids, shelf_gaze_grids, sum_session_shelf_grids
+from warehouse import open_warehouse, session_layout, store_session
+
+# Session directories are created by the Unity DirectoryManager as <user>/SESSION_yyyy-MM-dd_HH-mm-ss
+SESSION_PREFIX = "SESSION_"
+SESSION_TIME_FORMAT = "%Y-%m-%d_%H-%M-%S"
+
+def find_sessions(user_directory, exclude=None):
+    """
+    Finds every session directory of a user, sorted from the oldest to the most recent one.
+    Only SESSION_* directories and directories with the head and hands recording are sessions, so that e.g. the
+    reports directory, which also holds CSV files, is not analyzed.
+
+    Parameters:
+    user_directory (str): The directory of the user, containing one subdirectory per session.
+    exclude (str, optional): A directory that is never a session, e.g. the output directory of the analysis.
+
+    Returns:
+    list: Paths of the session directories.
+    """
+    excluded = os.path.realpath(exclude) if exclude is not None else None
+    sessions = [os.path.join(user_directory, name) for name in get_all_subdirectories(user_directory)]
+    sessions = [session for session in sessions if os.path.realpath(session) != excluded and
+                (os.path.basename(session).startswith(SESSION_PREFIX) or os.path.isfile(os.path.join(session, HEAD_HANDS_FILE)))]
+    return sorted(sessions, key=lambda session: (session_start_time(session) or datetime.max, session))
+
+def session_start_time(session_directory):
+    """
+    Parses the start time of a session from its directory name.
+
+    Parameters:
+    session_directory (str): The path of the session directory.
+
+    Returns:
+    datetime: The start time of the session, or None if the name does not follow the DirectoryManager format.
+    """
+    name = os.path.basename(os.path.normpath(session_directory))
+    try:
+        return datetime.strptime(name[len(SESSION_PREFIX):], SESSION_TIME_FORMAT)
+    except ValueError:
+        return None
+
+def analyze_session(session_directory, movement_threshold=0.01, chunksize=None):
+    """
+    Computes the metrics of a single session without generating any report. The gaze density grids of its shelves
+    are saved in the cache of the session.
+
+    Parameters:
+    session_directory (str): The path of the session directory.
+    movement_threshold (float): Threshold distance to determine if movement occurred.
+    chunksize (int, optional): If given, the head and hands and eye-tracking streams are read in chunks of this
+                               many rows, so that memory does not grow with the length of the session.
+
+    Returns:
+    dict: Metric tables of the session: 'sessions' (one row summary), 'zones', 'products' and 'aois'.
+    """
+    if chunksize is not None:
+        return _analyze_session_in_chunks(session_directory, movement_threshold, chunksize)
+
+    with stage('load') as record:
+        dataframes_dict = load_every_csv_in_directory_in_dictionary(session_directory)
+        record['rows'] = sum(len(value) for value in dataframes_dict.values())
+
+    with stage('segment_in_zones', dataframes_dict["HeadHandsDataBigEnvironment.csv"]):
+        head_hands_data = segment_in_zones(dataframes_dict)
+    with stage('compute_movement', head_hands_data):
+        head_hands_data = compute_movement(head_hands_data, movement_threshold)
+    eye_tracking_data = dataframes_dict["EyeTrackerData-AOIBigEnvironment.csv"]
+    save_session_shelf_grids(session_directory, shelf_gaze_grids(eye_tracking_data))
+
+    return session_metric_tables(head_hands_data, eye_tracking_data, dataframes_dict["TeleportDataBigEnvironment.csv"],
+                                 dataframes_dict["ProductInteractionDataBigEnvironment.csv"], dataframes_dict["ShoppingCartDataBigEnvironment.csv"])
+
+def session_metric_tables(head_hands_data, eye_tracking_data, teleport_data, interaction_data, cart_data, fixation_data=None):
+    """
+    Computes the metric tables of a session from its loaded data. The frames are not modified.
+
+    Parameters:
+    head_hands_data (pandas.DataFrame): The head and hands data, segmented in zones and with the movement status.
+    eye_tracking_data (pandas.DataFrame): The eye-tracking data on the AOIs.
+    teleport_data (pandas.DataFrame): The teleport data.
+    interaction_data (pandas.DataFrame): The product interaction data.
+    cart_data (pandas.DataFrame): The shopping cart data.
+    fixation_data (pandas.DataFrame, optional): The eye-tracking data on the AOIs with the I-DT fixation columns. If given,
+                                                the number and time of the fixations are added to the AOIs table.
+
+    Returns:
+    dict: Metric tables of the session: 'sessions' (one row summary), 'zones', 'products' and 'aois'.
+    """
+    # Zones
+    zone_runs = run_lengths(head_hands_data['Zone'].astype(str), head_hands_data['Timestamp'])
+    zones_df = pd.concat([total_per_label(zone_runs).rename('Time'), count_runs(zone_runs).rename('Visits')], axis=1)
+    zones_df = zones_df.rename_axis('Zone').reset_index()
+
+    # Eye tracking
+    eye_tracking_data = eye_tracking_data.assign(Time_Delta=eye_tracking_data['Timestamp'].diff().fillna(0))
+    aois_df = eye_tracking_data.groupby(['Section/Shelf', 'Product/AOI'], observed=True)['Time_Delta'].agg(['count', 'sum']).reset_index()
+    aois_df.columns = ['Section/Shelf', 'Product/AOI', 'Samples', 'Observation_Time']
+    if fixation_data is not None:
+        aois_df = _add_fixations(aois_df, extract_fixation_events(fixation_data))
+
+    stop_counts, move_counts = count_stops_and_moves(head_hands_data)
+    summary = {
+        'Duration': head_hands_data['Timestamp'].max() - head_hands_data['Timestamp'].min(),
+        'Stop_Count': stop_counts,
+        'Move_Count': move_counts,
+        'Move_Percentage': (head_hands_data['Status'] == 'Move').mean() * 100,
+    }
+
+    return _session_tables(summary, zones_df, aois_df, teleport_data, interaction_data, cart_data)
+
+def _add_fixations(aois_df, fixation_events):
+    keys = ['Section/Shelf', 'Product/AOI']
+    fixations = fixation_events.groupby(keys, observed=True)['fixation_duration'].agg(['count', 'sum'])
+    fixations.columns = ['Fixations', 'Fixation_Time']
+    # The labels of both tables may be categoricals with different categories
+    aois_df = aois_df.astype({key: object for key in keys}).merge(fixations.reset_index().astype({key: object for key in keys}), on=keys, how='left')
+    return aois_df.fillna({'Fixations': 0, 'Fixation_Time': 0.0}).astype({'Fixations': int})
+
+def _analyze_session_in_chunks(session_directory, movement_threshold, chunksize):
+    with stage('stream_session_metrics') as record:
+        metrics = stream_session_metrics(session_directory, chunksize, movement_threshold)
+        record['rows'] = metrics['summary']['Frames']
+    zones_df = metrics['zones'][['Time', 'Visits']].reset_index()
+    aois_df = metrics['aois'][['Section/Shelf', 'Product/AOI', 'Samples', 'Observation_Time']]
+    summary = {name: metrics['summary'][name] for name in ['Duration', 'Stop_Count', 'Move_Count', 'Move_Percentage']}
+    save_session_shelf_grids(session_directory, metrics['shelf_gaze'])
+
+    teleport_data, interaction_data, cart_data = [read_csv_cached(os.path.join(session_directory, name)) for name in
+                                                  ["TeleportDataBigEnvironment.csv", "ProductInteractionDataBigEnvironment.csv", "ShoppingCartDataBigEnvironment.csv"]]
+    return _session_tables(summary, zones_df, aois_df, teleport_data, interaction_data, cart_data)
+
+def _session_tables(summary, zones_df, aois_df, teleport_data, interaction_data, cart_data):
+    # Products
+    interactions = pd.Series(count_interactions(interaction_data), name='Interactions', dtype=float)
+    cart_actions = cart_data.groupby(['Item', 'Action'], observed=True).size().unstack(fill_value=0)
+    products_df = pd.concat([interactions, cart_actions.reindex(columns=['ADD', 'REMOVE'], fill_value=0)], axis=1).fillna(0)
+    products_df = products_df.rename_axis('Product').reset_index()
+
+    teleport_statistics, _ = teleport_attempt_statistics(teleport_data.assign(WasTP=parse_was_tp(teleport_data['WasTP'])))
+    summary_df = pd.DataFrame([{
+        **summary,
+        'Teleports': int(parse_was_tp(teleport_data['WasTP']).sum()),
+        'Teleport_Attempts': teleport_statistics['Attempts'],
+        'Attempts_per_Success': teleport_statistics['Attempts_per_Success'],
+        'Failed_Aim_Time': teleport_statistics['Failed_Aim_Time'],
+        'Interactions': interactions.sum(),
+        'Cart_Additions': int((cart_data['Action'] == 'ADD').sum()),
+        'Cart_Removals': int((cart_data['Action'] == 'REMOVE').sum()),
+    }])
+
+    return {'sessions': summary_df, 'zones': zones_df, 'products': products_df, 'aois': aois_df}
+
+def _analyze_session_logged(session_directory, movement_threshold, chunksize):
+    # Runs in a worker process, its stages are returned with the metrics
+    run_log = new_run_log(session_directory)
+    previous = activate(run_log)
+    try:
+        with stage(os.path.basename(session_directory)):
+            tables = analyze_session(session_directory, movement_threshold, chunksize)
+    finally:
+        activate(previous)
+    return tables, run_log['stages']
+
+def merge_session_metrics(session_metrics):
+    """
+    Merges the metric tables of several sessions into longitudinal tables, one row per session and key.
+
+    Parameters:
+    session_metrics (dict): Metric tables returned by analyze_session, by session directory.
+
+    Returns:
+    dict: One DataFrame per metric table, with 'Session' and 'Session_Start' columns, in chronological order.
+    """
+    tables = {}
+    for session_directory, metrics in session_metrics.items():
+        for table_name, table in metrics.items():
+            table = table.copy()
+            table.insert(0, 'Session_Start', session_start_time(session_directory))
+            table.insert(0, 'Session', os.path.basename(os.path.normpath(session_directory)))
+            tables.setdefault(table_name, []).append(table)
+
+    return {table_name: pd.concat(tables_list, ignore_index=True).sort_values(['Session_Start', 'Session'], kind='stable', ignore_index=True)
+            for table_name, tables_list in tables.items()}
+
+def analyze_user_history(user_directory, workers=None, output_directory=None, movement_threshold=0.01, chunksize=None, warehouse_path=None):
+    """
+    Analyzes every session of a user in parallel and merges their metrics into longitudinal tables.
+    A session that fails is reported and does not abort the rest of the batch.
+
+    Parameters:
+    user_directory (str): The directory of the user, containing one subdirectory per session.
+    workers (int, optional): Number of worker processes. Defaults to the number of CPUs.
+    output_directory (str, optional): Directory where the longitudinal tables are saved as CSV files, with the summed
+                                      position and gaze voxel histograms and the shelf gaze density grids of the sessions
+                                      and the run log with the time and memory of every stage of every session.
+    movement_threshold (float): Threshold distance to determine if movement occurred.
+    chunksize (int, optional): If given, the long streams of every session are read in chunks of this many rows.
+    warehouse_path (str, optional): If given, the metric tables of every session are stored in this metrics warehouse
+                                    (see warehouse.py), replacing the ones stored before for the same sessions.
+
+    Returns:
+    tuple: The longitudinal tables (dict of DataFrames) and the failed sessions (dict of session directory to error).
+    """
+    sessions = find_sessions(user_directory, exclude=output_directory)
+    session_metrics = {}
+    failures = {}
+    run_log = new_run_log(user_directory)
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(_analyze_session_logged, session, movement_threshold, chunksize): session for session in sessions}
+        for future in as_completed(futures):
+            session = futures[future]
+            try:
+                session_metrics[session], stages = future.result()
+                run_log['stages'].extend(stages)
+                print(f"Analyzed session {os.path.basename(session)}")
+            except Exception as error:
+                failures[session] = "".join(traceback.format_exception_only(type(error), error)).strip()
+                print(f"Session {os.path.basename(session)} failed: {failures[session]}")
+
+    # Keep the chronological order regardless of the completion order
+    session_metrics = {session: session_metrics[session] for session in sessions if session in session_metrics}
+    history = merge_session_metrics(session_metrics)
+
+    if warehouse_path is not None:
+        user = os.path.basename(os.path.normpath(user_directory))
+        connection = open_warehouse(warehouse_path)
+        try:
+            for session, tables in session_metrics.items():
+                store_session(connection, user, os.path.basename(os.path.normpath(session)), tables,
+                              session_start_time(session), session_layout(session))
+        finally:
+            connection.close()
+
+    if output_directory is not None:
+        os.makedirs(output_directory, exist_ok=True)
+        for table_name, table in history.items():
+            table.to_csv(os.path.join(output_directory, f"history_{table_name}.csv"), index=False)
+        # Always written, header-only on a clean run, so that no failure list of a previous run is left behind
+        pd.DataFrame(list(failures.items()), columns=['Session', 'Error']).to_csv(os.path.join(output_directory, "history_failures.csv"), index=False)
+        # The histograms of the sessions share their bounds, so the cached ones are just added
+        for kind in POINT_FILE_PREFIXES:
+            grid = sessions_grid(session_metrics, kind)
+            if grid is not None:
+                save_grid(grid, os.path.join(output_directory, f"history_{kind}_grid.npz"))
+        for weighting in SHELF_GAZE_FILES:
+            shelf_grids = sum_session_shelf_grids(session_metrics, weighting)
+            if shelf_grids:
+                save_shelf_grids(shelf_grids, os.path.join(output_directory, f"history_shelf_gaze_{weighting}.npz"))
+        write_run_log(run_log, os.path.join(output_directory, "history_run_log.json"))
+
+    print(f"{len(session_metrics)} of {len(sessions)} sessions analyzed, {len(failures)} failed.")
+    return history, failures
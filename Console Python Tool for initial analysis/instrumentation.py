@@ -0,0 +1,193 @@
+import json
+import numbers
+import os
+import platform
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+import pandas as pd
+
+try:
+    import resource
+    RESOURCE_AVAILABLE = True
+except ImportError:
+    # Windows, the peak memory is not recorded
+    RESOURCE_AVAILABLE = False
+
+# Run log the stages of this process are recorded in, None while instrumentation is off
+_active_log = None
+# Current stage and start of the current lap of each thread, so that stages can run in concurrent threads
+_thread_state = threading.local()
+
+def peak_rss_mb():
+    """
+    Returns the peak resident set size of the current process.
+
+    Returns:
+    float: Peak RSS in MB, or None if it cannot be measured on this platform.
+    """
+    if not RESOURCE_AVAILABLE:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes and macOS bytes
+    return round(peak / (1 << 20) if sys.platform == 'darwin' else peak / (1 << 10), 1)
+
+def new_run_log(name=None):
+    """
+    Creates an empty run log.
+
+    Parameters:
+    name (str, optional): Name of the run, e.g. the session directory.
+
+    Returns:
+    dict: The run log, with the environment and the list of recorded 'stages'.
+    """
+    return {
+        'run': name,
+        'started': datetime.now().isoformat(timespec='seconds'),
+        'environment': {'python': platform.python_version(), 'platform': platform.platform(), 'cpus': os.cpu_count()},
+        'stages': [],
+    }
+
+def activate(run_log):
+    """
+    Starts recording the stages of this process in a run log. Passing None turns instrumentation off.
+    The stages recorded afterwards by the calling thread are not nested in the stage it was running.
+
+    Parameters:
+    run_log (dict): The run log, created by new_run_log.
+
+    Returns:
+    dict: The run log that was active before.
+    """
+    global _active_log
+    previous, _active_log = _active_log, run_log
+    _thread_state.current = _thread_state.lap = None
+    return previous
+
+def active_log():
+    """
+    Returns the run log the stages are recorded in.
+
+    Returns:
+    dict: The active run log, or None if instrumentation is off.
+    """
+    return _active_log
+
+def _row_count(rows):
+    if rows is None or isinstance(rows, numbers.Integral):
+        return None if rows is None else int(rows)
+    return len(rows)
+
+@contextmanager
+def stage(name, rows=None):
+    """
+    Records the wall time, CPU time of the calling thread, peak RSS and row count of a block of code in the active run log.
+    Nothing is measured while instrumentation is off. The row count can also be set on the yielded record.
+
+    Parameters:
+    name (str): Name of the stage.
+    rows (int or sized, optional): Number of rows processed, or the data itself.
+
+    Yields:
+    dict: The record of the stage.
+    """
+    run_log = _active_log
+    if run_log is None:
+        yield {'stage': name, 'rows': rows}
+        return
+
+    parent = getattr(_thread_state, 'current', None)
+    record = {'stage': f"{parent['stage']}/{name}" if parent else name, 'rows': rows}
+    _thread_state.current = record
+    _thread_state.lap = (time.perf_counter(), time.thread_time())
+    wall, cpu = time.perf_counter(), time.thread_time()
+    try:
+        yield record
+    finally:
+        record.update({
+            'wall_seconds': round(time.perf_counter() - wall, 4),
+            'cpu_seconds': round(time.thread_time() - cpu, 4),
+            'peak_rss_mb': peak_rss_mb(),
+            'rows': _row_count(record['rows']),
+            'pid': os.getpid(),
+        })
+        run_log['stages'].append(record)
+        _thread_state.current = parent
+        _thread_state.lap = (time.perf_counter(), time.thread_time())
+
+def lap(name, rows=None):
+    """
+    Records the time since the previous lap, or since the start of the current stage, as a sub-stage.
+    It is meant for the figures and tables of the report builders, one call after each one is saved.
+
+    Parameters:
+    name (str): Name of the figure or table.
+    rows (int or sized, optional): Number of rows plotted.
+    """
+    run_log = _active_log
+    if run_log is None or getattr(_thread_state, 'lap', None) is None:
+        return
+    wall, cpu = _thread_state.lap
+    parent = getattr(_thread_state, 'current', None)
+    run_log['stages'].append({
+        'stage': f"{parent['stage']}/{name}" if parent else name,
+        'wall_seconds': round(time.perf_counter() - wall, 4),
+        'cpu_seconds': round(time.thread_time() - cpu, 4),
+        'peak_rss_mb': peak_rss_mb(),
+        'rows': _row_count(rows),
+        'pid': os.getpid(),
+    })
+    _thread_state.lap = (time.perf_counter(), time.thread_time())
+
+def add_stages(records, prefix=None):
+    """
+    Adds to the active run log the stages recorded by another process, e.g. a render worker.
+    They are named as sub-stages of the current stage.
+
+    Parameters:
+    records (list): The stage records.
+    prefix (str, optional): Prefix of their names, e.g. the report they belong to.
+    """
+    if _active_log is None:
+        return
+    parent = getattr(_thread_state, 'current', None)
+    names = [name for name in [parent['stage'] if parent else None, prefix] if name]
+    for record in records:
+        _active_log['stages'].append({**record, 'stage': "/".join(names + [record['stage']])})
+
+def summary_table(run_log):
+    """
+    Summarizes a run log as a table.
+
+    Parameters:
+    run_log (dict): The run log.
+
+    Returns:
+    pandas.DataFrame: One row per stage with its wall time, CPU time, peak RSS and rows.
+    """
+    columns = ['stage', 'wall_seconds', 'cpu_seconds', 'peak_rss_mb', 'rows']
+    table = pd.DataFrame(run_log['stages'], columns=columns + ['pid'])[columns]
+    table['rows'] = table['rows'].astype('Int64')
+    return table
+
+def write_run_log(run_log, path, print_summary=False):
+    """
+    Saves a run log as JSON.
+
+    Parameters:
+    run_log (dict): The run log.
+    path (str): The path of the JSON file.
+    print_summary (bool): Whether to also print the summary table.
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'w') as file:
+        json.dump(run_log, file, indent=2, default=str)
+    if print_summary:
+        print(summary_table(run_log).to_string(index=False))
+    print(f"Run log saved to {path}")
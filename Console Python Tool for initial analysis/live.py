@@ -0,0 +1,414 @@
+import argparse
+import io
+import json
+import os
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from vr_idt.vr_idt import classify_fixations
+
+from distances import continue_movement
+from Eye_Tracking_Analyzer import extract_fixation_events
+from fixations import COL_NAME_MAP, FIXATION_COLUMNS
+from schemas import read_stream_csv
+from streaming import (AOI_LABELS, EYE_TRACKING_FILE, HEAD_HANDS_FILE, TELEPORT_FILE, eye_tracking_metrics, head_hands_metrics,
+                       new_eye_tracking_state, new_head_hands_state, update_eye_tracking_metrics, update_head_hands_metrics)
+from zones import classify_zones, make_zone_bands, parse_was_tp
+
+CART_FILE = "ShoppingCartDataBigEnvironment.csv"
+
+# Seconds between two publications of the metrics
+PUBLISH_INTERVAL = 5.0
+# Seconds between two reads of the growing CSV files
+POLL_INTERVAL = 0.5
+# Maximum bytes read from a CSV file at once, so that catching up with a long session keeps memory bounded
+MAX_READ_BYTES = 8 << 20
+# Head and hands frames kept to correct the distance when a teleport row is read after its frame
+RECENT_FRAMES = 4096
+
+def new_tail(csv_path):
+    """
+    Creates the read position of a CSV file that is still being written.
+
+    Parameters:
+    csv_path (str): The path of the CSV file. It may not exist yet.
+
+    Returns:
+    dict: The tail state updated by read_new_rows.
+    """
+    return {'path': csv_path, 'offset': 0, 'header': None, 'behind': False}
+
+def read_new_rows(tail, max_bytes=MAX_READ_BYTES):
+    """
+    Reads the complete rows appended to a CSV file since the previous call. A row that is still being written
+    (without its line break) is left for the next call.
+
+    Parameters:
+    tail (dict): The tail state, created by new_tail.
+    max_bytes (int): Maximum number of bytes to read.
+
+    Returns:
+    pandas.DataFrame: The new rows typed with the schema of the stream, or None if there are none.
+    """
+    if not os.path.exists(tail['path']):
+        return None
+
+    with open(tail['path'], 'rb') as file:
+        file.seek(tail['offset'])
+        data = file.read(max_bytes)
+
+    # More rows are waiting if the read was cut by max_bytes
+    tail['behind'] = len(data) == max_bytes
+    complete = data.rfind(b'\n') + 1
+    if complete == 0:
+        return None
+    data = data[:complete]
+    tail['offset'] += complete
+
+    if tail['header'] is None:
+        header_end = data.find(b'\n') + 1
+        tail['header'], data = data[:header_end], data[header_end:]
+    if not data.strip():
+        return None
+
+    return read_stream_csv(io.BytesIO(tail['header'] + data), name=tail['path'])
+
+def new_fixations_state():
+    """
+    Creates the empty running state of the incremental fixation classification.
+
+    Returns:
+    dict: The state updated by update_fixations.
+    """
+    return {'pending': None, 'resume': 0, 'totals': None}
+
+def _resume_row(fixation_df, timestamps, first, min_duration):
+    """
+    Returns the row where I-DT must continue once more rows are recorded. I-DT slides a window start over the rows,
+    so continuing from a row it visits as a window start gives the same fixations as classifying the whole stream:
+    the start of a fixation that reaches the last row (the next rows may extend it), or else the first row after
+    the last fixation whose 'min_duration' window is not complete yet.
+    """
+    last = len(fixation_df) - 1
+    starts = np.flatnonzero(fixation_df['fixation_start'].to_numpy() == 1)
+    ends = np.flatnonzero(fixation_df['fixation_end'].to_numpy() == 1)
+    if len(ends) and ends[-1] == last:
+        return starts[-1]
+
+    # The windows of the rows between the last fixation and that row were complete and rejected
+    later = np.maximum.accumulate(timestamps[::-1])[::-1]
+    complete = np.append(later[1:] - timestamps[:-1] >= min_duration, False)
+    if not complete[:first].all():
+        return first
+    base = ends[-1] if len(ends) else first
+    return base + int(np.argmin(complete[base:]))
+
+def _classify_block(state, min_duration, max_angle, min_freq, col_name_map):
+    # vr_idt takes the first time as the period of the first row, so the row before the resume row is classified
+    # too: its period is then too long for any fixation and the resume row gets its true sampling frequency
+    context = 1 if state['resume'] > 0 else 0
+    block = state['pending'].iloc[state['resume'] - context:].reset_index(drop=True)
+    fixation_df = classify_fixations(block[list(col_name_map.values())], min_duration, max_angle, min_freq, **col_name_map)
+    return fixation_df[FIXATION_COLUMNS], context
+
+def update_fixations(state, chunk, min_duration, max_angle, min_freq, col_name_map=COL_NAME_MAP):
+    """
+    Classifies the fixations of the new rows of an eye-tracking stream with I-DT. I-DT continues from the last row
+    where its result may still change (an open fixation or the last 'min_duration' seconds), so the cost does not
+    grow with the length of the session and the fixations are the same as classifying the whole stream at once,
+    however the rows are split.
+
+    Parameters:
+    state (dict): The running state, created by new_fixations_state.
+    chunk (pandas.DataFrame): The new rows of the eye-tracking stream.
+    min_duration, max_angle, min_freq (float): I-DT parameters.
+    col_name_map (dict): Mapping between the vr_idt column names and the DataFrame columns.
+
+    Returns:
+    pandas.DataFrame: The fixation events settled with these rows, as returned by extract_fixation_events.
+    """
+    chunk = chunk.assign(fixation_start=0, fixation_end=0)
+    pending = chunk if state['pending'] is None else pd.concat([state['pending'], chunk])
+    state['pending'] = pending = pending.reset_index(drop=True)
+
+    # Nothing can be classified until the window of the resume row is complete
+    resume = state['resume']
+    times = pending[col_name_map['time']].to_numpy(dtype=float)
+    if len(times) == 0 or not (times[resume + 1:] - times[resume] >= min_duration).any():
+        return extract_fixation_events(pending.iloc[:0])
+
+    fixation_df, context = _classify_block(state, min_duration, max_angle, min_freq, col_name_map)
+    next_resume = resume - context + _resume_row(fixation_df, times[resume - context:], context, min_duration)
+    # A row can only be the context of the next block if its period is too long for a fixation
+    with np.errstate(divide='ignore'):
+        if next_resume > 0 and 1 / times[next_resume - 1] > min_freq:
+            next_resume = resume
+
+    # The flags of the rows before the resume row are final, and so is the end flag of the resume row
+    starts = pending['fixation_start'].to_numpy().copy()
+    ends = pending['fixation_end'].to_numpy().copy()
+    settled = next_resume - resume
+    starts[resume:next_resume] = fixation_df['fixation_start'].to_numpy()[context:context + settled]
+    ends[resume:next_resume + 1] |= fixation_df['fixation_end'].to_numpy()[context:context + settled + 1]
+    pending = pending.assign(fixation_start=starts, fixation_end=ends)
+
+    # A fixation that ends at the resume row is dropped if another one starts there, so it is kept open
+    events = extract_fixation_events(pending.iloc[:next_resume])
+    keep = max(next_resume - 1, 0)
+    if ends[next_resume]:
+        keep = min(keep, np.flatnonzero(starts[:next_resume])[-1])
+    state['pending'] = pending.iloc[keep:].reset_index(drop=True)
+    state['resume'] = next_resume - keep
+
+    _add_fixation_totals(state, events)
+    return events
+
+def flush_fixations(state, min_duration, max_angle, min_freq, col_name_map=COL_NAME_MAP):
+    """
+    Settles the rows left pending once the stream has ended, so that a fixation open at the last row is counted.
+
+    Parameters:
+    state (dict): The running state updated by update_fixations.
+    min_duration, max_angle, min_freq (float): I-DT parameters.
+    col_name_map (dict): Mapping between the vr_idt column names and the DataFrame columns.
+
+    Returns:
+    pandas.DataFrame: The fixation events of the pending rows, or None if no row was pending.
+    """
+    pending = state['pending']
+    if pending is None or len(pending) == 0:
+        return None
+
+    fixation_df, context = _classify_block(state, min_duration, max_angle, min_freq, col_name_map)
+    resume = state['resume']
+    starts = pending['fixation_start'].to_numpy().copy()
+    ends = pending['fixation_end'].to_numpy().copy()
+    starts[resume:] |= fixation_df['fixation_start'].to_numpy()[context:]
+    ends[resume:] |= fixation_df['fixation_end'].to_numpy()[context:]
+    events = extract_fixation_events(pending.assign(fixation_start=starts, fixation_end=ends))
+
+    state['pending'] = None
+    state['resume'] = 0
+    _add_fixation_totals(state, events)
+    return events
+
+def _add_fixation_totals(state, events):
+    if len(events):
+        totals = events.groupby(AOI_LABELS)['fixation_duration'].agg(['count', 'sum'])
+        state['totals'] = totals if state['totals'] is None else state['totals'].add(totals, fill_value=0)
+
+def fixation_metrics(state):
+    """
+    Computes the fixation metrics from the running state.
+
+    Parameters:
+    state (dict): The running state updated by update_fixations.
+
+    Returns:
+    pandas.DataFrame: Fixation count, total and mean fixation duration by shelf and AOI.
+    """
+    if state['totals'] is None:
+        return pd.DataFrame(columns=AOI_LABELS + ['Fixations', 'Fixation_Time', 'Mean_Fixation_Duration'])
+    totals = state['totals'].rename(columns={'count': 'Fixations', 'sum': 'Fixation_Time'})
+    totals['Fixations'] = totals['Fixations'].astype(int)
+    totals['Mean_Fixation_Duration'] = totals['Fixation_Time'] / totals['Fixations']
+    return totals.reset_index()
+
+def new_live_state(session_directory, min_duration=0.15, max_angle=1.5, min_freq=30, movement_threshold=0.01, bands=None):
+    """
+    Creates the running state of a session that is still being recorded.
+
+    Parameters:
+    session_directory (str): The directory where the session CSV files are being written.
+    min_duration, max_angle, min_freq (float): I-DT parameters.
+    movement_threshold (float): Threshold distance to determine if movement occurred.
+    bands (sequence, optional): Ordered (name, upper limit) pairs. Defaults to Shelf/Adjacent/Near/Far.
+
+    Returns:
+    dict: The state updated by poll_session.
+    """
+    return {
+        'tails': {name: new_tail(os.path.join(session_directory, name)) for name in [TELEPORT_FILE, HEAD_HANDS_FILE, EYE_TRACKING_FILE, CART_FILE]},
+        'parameters': {'min_duration': min_duration, 'max_angle': max_angle, 'min_freq': min_freq,
+                       'movement_threshold': movement_threshold, 'bands': bands or make_zone_bands()},
+        'teleport_frames': np.zeros(0), 'teleport_attempts': 0,
+        'movement': {}, 'head_hands': new_head_hands_state(), 'recent_distances': pd.Series(dtype=float),
+        'eye_tracking': new_eye_tracking_state(), 'fixations': new_fixations_state(),
+        'cart': None,
+    }
+
+def poll_session(state):
+    """
+    Processes the rows appended to the session CSV files since the previous poll.
+
+    Parameters:
+    state (dict): The running state, created by new_live_state.
+
+    Returns:
+    int: Number of new rows.
+    """
+    parameters = state['parameters']
+    tails = state['tails']
+    new_rows = 0
+
+    # Teleports first, the zones and the distance of the new head and hands rows depend on them
+    teleports = read_new_rows(tails[TELEPORT_FILE])
+    if teleports is not None:
+        teleport_frames = teleports.loc[parse_was_tp(teleports['WasTP']), 'Frame'].to_numpy()
+        state['teleport_frames'] = np.append(state['teleport_frames'], teleport_frames)
+        state['teleport_attempts'] += len(teleports)
+        new_rows += len(teleports)
+
+        # The teleport row may be written after its head and hands frame was processed
+        recent = state['recent_distances']
+        late = recent.index.isin(teleport_frames)
+        state['head_hands']['distance'] -= recent[late].sum()
+        state['recent_distances'] = recent[~late]
+
+    head_hands = read_new_rows(tails[HEAD_HANDS_FILE])
+    if head_hands is not None:
+        # Until the first teleport is recorded, every frame belongs to the 'Start' zone
+        first_tp_frame = state['teleport_frames'].min() if len(state['teleport_frames']) else np.inf
+        head_hands['Zone'] = classify_zones(head_hands['Distance'], head_hands['Frame'], first_tp_frame, parameters['bands'])
+        state['movement'] = continue_movement(head_hands, state['movement'], parameters['movement_threshold'])
+        update_head_hands_metrics(state['head_hands'], head_hands, state['teleport_frames'])
+        counted = ~head_hands['Frame'].isin(state['teleport_frames'])
+        recent = pd.Series(head_hands.loc[counted, 'Distance_Traveled'].to_numpy(), index=head_hands.loc[counted, 'Frame'].to_numpy())
+        state['recent_distances'] = pd.concat([state['recent_distances'], recent]).iloc[-RECENT_FRAMES:]
+        new_rows += len(head_hands)
+
+    eye_tracking = read_new_rows(tails[EYE_TRACKING_FILE])
+    if eye_tracking is not None:
+        update_eye_tracking_metrics(state['eye_tracking'], eye_tracking)
+        update_fixations(state['fixations'], eye_tracking, parameters['min_duration'], parameters['max_angle'], parameters['min_freq'])
+        new_rows += len(eye_tracking)
+
+    cart = read_new_rows(tails[CART_FILE])
+    if cart is not None:
+        actions = cart.groupby(['Item', 'Action'], observed=True).size()
+        state['cart'] = actions if state['cart'] is None else state['cart'].add(actions, fill_value=0)
+        new_rows += len(cart)
+
+    return new_rows
+
+def live_metrics(state):
+    """
+    Computes a snapshot of the metrics of the session processed so far.
+
+    Parameters:
+    state (dict): The running state updated by poll_session.
+
+    Returns:
+    dict: JSON serializable metrics: 'summary', 'zones', 'status', 'aois', 'fixations' and 'cart'.
+    """
+    head_hands = head_hands_metrics(state['head_hands'])
+    fixations = fixation_metrics(state['fixations'])
+    cart = state['cart'] if state['cart'] is not None else pd.Series(dtype=float, index=pd.MultiIndex.from_arrays([[], []], names=['Item', 'Action']))
+    cart = cart.unstack(fill_value=0).reindex(columns=['ADD', 'REMOVE'], fill_value=0).astype(int)
+
+    summary = dict(head_hands['summary'])
+    summary.update({
+        'Teleports': int(len(state['teleport_frames'])),
+        'Teleport_Attempts': int(state['teleport_attempts']),
+        'Eye_Tracking_Samples': int(state['eye_tracking']['samples']),
+        'Fixations': int(fixations['Fixations'].sum()),
+        'Fixation_Time': float(fixations['Fixation_Time'].sum()),
+        'Cart_Additions': int(cart['ADD'].sum()),
+        'Cart_Removals': int(cart['REMOVE'].sum()),
+    })
+
+    def records(df):
+        return json.loads(df.to_json(orient='records'))
+
+    return {
+        'updated': datetime.now().isoformat(timespec='seconds'),
+        'summary': summary,
+        'zones': records(head_hands['zones'].reset_index()),
+        'status': records(head_hands['status'].reset_index()),
+        'aois': records(eye_tracking_metrics(state['eye_tracking'])),
+        'fixations': records(fixations),
+        'cart': records(cart.rename_axis(columns=None).reset_index()),
+    }
+
+def write_metrics(metrics, output_path):
+    """
+    Writes the metrics as JSON, replacing the previous file at once so that readers never see a partial file.
+
+    Parameters:
+    metrics (dict): The metrics returned by live_metrics.
+    output_path (str): The JSON file.
+    """
+    temporary_path = output_path + ".tmp"
+    with open(temporary_path, 'w') as file:
+        json.dump(metrics, file, indent=2)
+    os.replace(temporary_path, output_path)
+
+def _print_summary(metrics):
+    summary = metrics['summary']
+    print(f"[{metrics['updated']}] {summary['Duration']:8.1f} s | {summary['Frames']} frames | "
+          f"stops {summary['Stop_Count']} moves {summary['Move_Count']} | {summary['Distance_Traveled']:.1f} m | "
+          f"teleports {summary['Teleports']} | fixations {summary['Fixations']} | cart +{summary['Cart_Additions']} -{summary['Cart_Removals']}")
+
+def monitor_session(session_directory, interval=PUBLISH_INTERVAL, output_path=None, idle_timeout=None, publish=None, **parameters):
+    """
+    Follows a session while it is being recorded: the growing CSV files are tailed, only the new rows are processed
+    and the metrics are published every 'interval' seconds. It stops on Ctrl+C or when no row has been appended
+    for 'idle_timeout' seconds.
+
+    Parameters:
+    session_directory (str): The directory where the session CSV files are being written.
+    interval (float): Seconds between two publications.
+    output_path (str, optional): JSON file rewritten with the metrics at every publication.
+    idle_timeout (float, optional): Seconds without new rows after which the session is considered finished.
+    publish (callable, optional): Called with the metrics at every publication. Defaults to printing a summary line.
+    parameters: I-DT, movement and zone parameters passed to new_live_state.
+
+    Returns:
+    dict: The last metrics published.
+    """
+    publish = publish or _print_summary
+    state = new_live_state(session_directory, **parameters)
+    last_publication = last_row = time.monotonic()
+    metrics = None
+
+    try:
+        while True:
+            if poll_session(state):
+                last_row = time.monotonic()
+            now = time.monotonic()
+
+            if now - last_publication >= interval or metrics is None:
+                metrics = live_metrics(state)
+                if output_path is not None:
+                    write_metrics(metrics, output_path)
+                publish(metrics)
+                last_publication = now
+
+            if idle_timeout is not None and now - last_row >= idle_timeout:
+                print(f"No new data for {idle_timeout} s, the session seems finished.")
+                break
+            # Keep reading without waiting while catching up with the rows already recorded
+            if not any(tail['behind'] for tail in state['tails'].values()):
+                time.sleep(POLL_INTERVAL)
+    except KeyboardInterrupt:
+        print("Live analysis stopped.")
+
+    poll_session(state)
+    parameters = state['parameters']
+    flush_fixations(state['fixations'], parameters['min_duration'], parameters['max_angle'], parameters['min_freq'])
+    metrics = live_metrics(state)
+    if output_path is not None:
+        write_metrics(metrics, output_path)
+    return metrics
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Follows a VR shopping session while it is being recorded and publishes its metrics.")
+    parser.add_argument("session_directory", help="Directory where the session CSV files are being written.")
+    parser.add_argument("--interval", type=float, default=PUBLISH_INTERVAL, help="Seconds between two publications of the metrics.")
+    parser.add_argument("--output", default=None, help="JSON file rewritten with the metrics at every publication.")
+    parser.add_argument("--idle-timeout", type=float, default=None, help="Stop after this many seconds without new rows.")
+    args = parser.parse_args()
+
+    monitor_session(args.session_directory, args.interval, args.output, args.idle_timeout)
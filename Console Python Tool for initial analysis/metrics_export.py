@@ -0,0 +1,112 @@
+import json
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+from csv_cache import PARQUET_AVAILABLE
+
+# Tables are written in a columnar format when pyarrow is installed, as CSV otherwise
+TABLE_FORMAT = "parquet" if PARQUET_AVAILABLE else "csv"
+
+def _file_name(path):
+    return re.sub(r'[^0-9A-Za-z_.-]+', '_', ".".join(path))
+
+def table_frame(table):
+    """
+    Converts a metric table into a flat DataFrame that can be written as a columnar file: the index
+    (e.g. the AOI or section labels) becomes columns and every column name becomes a string.
+
+    Parameters:
+    table (pandas.DataFrame or pandas.Series): The table.
+
+    Returns:
+    pandas.DataFrame: The flat table.
+    """
+    if isinstance(table, pd.Series):
+        table = table.to_frame(table.name if table.name is not None else 'value')
+    if not isinstance(table.index, pd.RangeIndex):
+        table = table.reset_index()
+    table = table.copy(deep=False)
+    table.columns = ["_".join(map(str, column)) if isinstance(column, tuple) else str(column) for column in table.columns]
+    return table
+
+def write_table(table, path_without_extension):
+    """
+    Writes a metric table in TABLE_FORMAT.
+
+    Parameters:
+    table (pandas.DataFrame or pandas.Series): The table.
+    path_without_extension (str): The path of the file, the extension is added.
+
+    Returns:
+    str: The path of the written file.
+    """
+    table = table_frame(table)
+    path = f"{path_without_extension}.{TABLE_FORMAT}"
+    if TABLE_FORMAT == "parquet":
+        # Categorical labels and columns mixing numbers and text (e.g. "mean ± std" cells) are written as strings
+        mixed = [column for column in table.select_dtypes(include=['category', 'object']).columns
+                 if isinstance(table[column].dtype, pd.CategoricalDtype) or pd.api.types.infer_dtype(table[column]) != 'string']
+        table.astype({column: str for column in mixed}).to_parquet(path, index=False)
+    else:
+        table.to_csv(path, index=False)
+    return path
+
+def _export(value, path, tables_directory, relative_directory):
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        file_path = write_table(value, os.path.join(tables_directory, _file_name(path)))
+        return {'table': os.path.join(relative_directory, os.path.basename(file_path)), 'rows': len(value)}
+    if isinstance(value, np.ndarray):
+        file_path = os.path.join(tables_directory, _file_name(path) + ".npy")
+        np.save(file_path, value)
+        return {'array': os.path.join(relative_directory, os.path.basename(file_path)), 'shape': list(value.shape)}
+    if isinstance(value, dict):
+        return {str(key): _export(item, path + [str(key)], tables_directory, relative_directory) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_export(item, path + [str(index)], tables_directory, relative_directory) for index, item in enumerate(value)]
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and not np.isfinite(value):
+        return None
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    return str(value)
+
+def export_metrics(metrics, json_path):
+    """
+    Writes the metrics computed for a report as structured output, without rendering anything: a JSON file with
+    the scalar metrics, and one file per table (TABLE_FORMAT) or array (.npy) in a folder next to it. The JSON
+    references each table by its relative path and number of rows.
+
+    Parameters:
+    metrics (dict): The metrics, e.g. returned by the compute_report_metrics function of an analyzer.
+    json_path (str): The path of the JSON file. The tables are written to a folder with the same name.
+
+    Returns:
+    dict: The JSON document.
+    """
+    tables_directory = os.path.splitext(json_path)[0]
+    os.makedirs(tables_directory, exist_ok=True)
+    document = _export(metrics, [], tables_directory, os.path.basename(tables_directory))
+
+    temporary_path = json_path + ".tmp"
+    with open(temporary_path, 'w') as file:
+        json.dump(document, file, indent=2)
+    os.replace(temporary_path, json_path)
+    return document
+
+def load_exported_table(json_path, reference):
+    """
+    Reads a table written by export_metrics.
+
+    Parameters:
+    json_path (str): The path of the JSON file.
+    reference (dict): The reference of the table in the JSON document.
+
+    Returns:
+    pandas.DataFrame: The table.
+    """
+    path = os.path.join(os.path.dirname(json_path), reference['table'])
+    return pd.read_parquet(path) if path.endswith(".parquet") else pd.read_csv(path)
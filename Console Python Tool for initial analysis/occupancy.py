@@ -0,0 +1,289 @@
+import glob
+import io
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from csv_cache import CACHE_DIRECTORY_NAME
+from instrumentation import lap
+
+# Point clouds written by Vector3SerializationHelper next to the CSV files of each session
+PLAYERS_DIRECTORY_NAME = "PLAYERS_JSONs"
+POINT_FILE_PREFIXES = {'position': "PositionPlayerData", 'gaze': "ETPlayerData"}
+
+# Fixed bounds of the store (meters) and voxel size, so that the grids of every session can be added
+STORE_BOUNDS = ((-8.0, 0.0, -4.0), (12.0, 3.0, 14.0))
+VOXEL_SIZE = 0.1
+
+# Axes of each projection: the two axes of the image and the axis summed over
+PROJECTIONS = {
+    'floor': ('X', 'Z', 1),
+    'front': ('X', 'Y', 2),
+    'side': ('Z', 'Y', 0),
+}
+AXES = {'X': 0, 'Y': 1, 'Z': 2}
+
+# Characters of the JSON syntax and keys, removing them leaves the comma separated coordinates
+_JSON_SYNTAX = b'[]{}":XYZ'
+
+def load_player_points(json_path):
+    """
+    Parses a PLAYERS_JSONs file, an array of {"X", "Y", "Z"} objects, into a contiguous float array
+    without building a dictionary per point. The coordinates are parsed by the C parser of pandas.
+
+    Parameters:
+    json_path (str): The path of the JSON file.
+
+    Returns:
+    numpy.ndarray: The points, shape (n, 3), as float32.
+    """
+    with open(json_path, 'rb') as file:
+        raw = file.read()
+
+    n_points = raw.count(b'{')
+    if n_points == 0:
+        return np.zeros((0, 3), dtype=np.float32)
+
+    values = None
+    # Newtonsoft writes the fields in declaration order, anything else is parsed as regular JSON
+    if raw.lstrip()[1:].lstrip().startswith(b'{"X":'):
+        try:
+            values = pd.read_csv(io.BytesIO(raw.translate(None, _JSON_SYNTAX)), header=None, lineterminator=',',
+                                 dtype='float64', engine='c')[0].to_numpy()
+        except ValueError:
+            values = None
+    if values is None or values.size != 3 * n_points:
+        values = np.array([[point['X'], point['Y'], point['Z']] for point in json.loads(raw)], dtype=float)
+    return values.reshape(-1, 3).astype(np.float32)
+
+def find_point_files(session_directory, kind='position'):
+    """
+    Lists the point files of a session.
+
+    Parameters:
+    session_directory (str): The path of the session directory.
+    kind (str): 'position' for the head positions or 'gaze' for the eye-tracking hit points.
+
+    Returns:
+    list: The paths of the JSON files, sorted by name (i.e. by recording date).
+    """
+    pattern = os.path.join(session_directory, PLAYERS_DIRECTORY_NAME, POINT_FILE_PREFIXES[kind] + "*.json")
+    return sorted(glob.glob(pattern))
+
+def new_grid(bounds=STORE_BOUNDS, voxel_size=VOXEL_SIZE):
+    """
+    Creates an empty 3D voxel histogram.
+
+    Parameters:
+    bounds (tuple): Minimum and maximum corners of the histogram, (x, y, z) in meters.
+    voxel_size (float): Edge of the voxels in meters.
+
+    Returns:
+    dict: 'origin', 'voxel_size', 'counts' (points per voxel, indexed by x, y, z) and 'outside' (points out of bounds).
+    """
+    origin = np.asarray(bounds[0], dtype=float)
+    shape = np.ceil((np.asarray(bounds[1], dtype=float) - origin) / voxel_size).astype(int)
+    return {'origin': origin, 'voxel_size': float(voxel_size), 'counts': np.zeros(shape, dtype=np.int64), 'outside': 0}
+
+def add_points(grid, points):
+    """
+    Bins points into a voxel histogram. Points out of its bounds are only counted in 'outside'.
+
+    Parameters:
+    grid (dict): The histogram, created by new_grid.
+    points (numpy.ndarray): The points, shape (n, 3).
+
+    Returns:
+    dict: The updated histogram.
+    """
+    counts = grid['counts']
+    indices = np.floor((np.asarray(points, dtype=float) - grid['origin']) / grid['voxel_size'])
+    inside = np.all((indices >= 0) & (indices < counts.shape), axis=1)
+    flat = np.ravel_multi_index(indices[inside].astype(np.intp).T, counts.shape)
+    counts += np.bincount(flat, minlength=counts.size).reshape(counts.shape)
+    grid['outside'] += int((~inside).sum())
+    return grid
+
+def merge_grids(grids):
+    """
+    Adds the voxel histograms of several sessions. They must share their bounds and voxel size.
+
+    Parameters:
+    grids (iterable): The histograms.
+
+    Returns:
+    dict: The sum of the histograms, or None if there were none.
+    """
+    total = None
+    for grid in grids:
+        if total is None:
+            total = {**grid, 'counts': grid['counts'].copy()}
+            continue
+        if grid['counts'].shape != total['counts'].shape or grid['voxel_size'] != total['voxel_size'] \
+                or not np.array_equal(grid['origin'], total['origin']):
+            raise ValueError("Only grids with the same bounds and voxel size can be added.")
+        total['counts'] += grid['counts']
+        total['outside'] += grid['outside']
+    return total
+
+def save_grid(grid, path):
+    """
+    Saves a voxel histogram to a compressed .npz file.
+
+    Parameters:
+    grid (dict): The histogram.
+    path (str): The path of the file.
+    """
+    np.savez_compressed(path, origin=grid['origin'], voxel_size=grid['voxel_size'], counts=grid['counts'], outside=grid['outside'])
+
+def load_grid(path):
+    """
+    Loads a voxel histogram saved by save_grid.
+
+    Parameters:
+    path (str): The path of the file.
+
+    Returns:
+    dict: The histogram.
+    """
+    with np.load(path) as data:
+        return {'origin': data['origin'], 'voxel_size': float(data['voxel_size']), 'counts': data['counts'], 'outside': int(data['outside'])}
+
+def session_grid(session_directory, kind='position', bounds=STORE_BOUNDS, voxel_size=VOXEL_SIZE, use_cache=True):
+    """
+    Builds the voxel histogram of the points of a session. The histogram is cached in the cache of the session
+    and only rebuilt when its JSON files or the resolution change.
+
+    Parameters:
+    session_directory (str): The path of the session directory.
+    kind (str): 'position' for the head positions or 'gaze' for the eye-tracking hit points.
+    bounds (tuple): Minimum and maximum corners of the histogram, (x, y, z) in meters.
+    voxel_size (float): Edge of the voxels in meters.
+    use_cache (bool): Whether to use the cache.
+
+    Returns:
+    dict: The histogram, or None if the session has no points of that kind.
+    """
+    paths = find_point_files(session_directory, kind)
+    if not paths:
+        return None
+
+    cache_directory = os.path.join(session_directory, CACHE_DIRECTORY_NAME)
+    grid_path = os.path.join(cache_directory, f"{kind}_grid.npz")
+    key_path = os.path.join(cache_directory, f"{kind}_grid.json")
+    key = {'bounds': [list(corner) for corner in bounds], 'voxel_size': voxel_size,
+           'files': [[os.path.basename(path), os.path.getsize(path), os.stat(path).st_mtime_ns] for path in paths]}
+
+    if use_cache and os.path.exists(grid_path):
+        try:
+            with open(key_path) as file:
+                if json.load(file) == key:
+                    return load_grid(grid_path)
+        except (OSError, ValueError):
+            pass
+
+    grid = new_grid(bounds, voxel_size)
+    for path in paths:
+        add_points(grid, load_player_points(path))
+
+    if use_cache:
+        try:
+            os.makedirs(cache_directory, exist_ok=True)
+            save_grid(grid, grid_path)
+            with open(key_path, 'w') as file:
+                json.dump(key, file)
+        except OSError as error:
+            print(f"Could not cache the {kind} grid of {session_directory}: {error}")
+    return grid
+
+def sessions_grid(session_directories, kind='position', bounds=STORE_BOUNDS, voxel_size=VOXEL_SIZE, use_cache=True):
+    """
+    Adds the cached voxel histograms of several sessions, e.g. every session of a user or of a study.
+
+    Parameters:
+    session_directories (iterable): The paths of the session directories.
+    kind (str): 'position' for the head positions or 'gaze' for the eye-tracking hit points.
+    bounds (tuple): Minimum and maximum corners of the histogram, (x, y, z) in meters.
+    voxel_size (float): Edge of the voxels in meters.
+    use_cache (bool): Whether to use the cache of each session.
+
+    Returns:
+    dict: The sum of the histograms, or None if no session has points of that kind.
+    """
+    return merge_grids(grid for grid in (session_grid(directory, kind, bounds, voxel_size, use_cache) for directory in session_directories)
+                       if grid is not None)
+
+def project_grid(grid, view='floor'):
+    """
+    Projects a voxel histogram onto a plane, adding the voxels along the third axis.
+
+    Parameters:
+    grid (dict): The histogram.
+    view (str): 'floor' (X-Z floor plan), 'front' (X-Y shelf faces) or 'side' (Z-Y shelf faces).
+
+    Returns:
+    tuple: The image (rows along the vertical axis) and its extent (left, right, bottom, top) in meters.
+    """
+    horizontal, vertical, summed_axis = PROJECTIONS[view]
+    image = grid['counts'].sum(axis=summed_axis)
+    # The rows of the image are the vertical axis
+    if AXES[horizontal] < AXES[vertical]:
+        image = image.T
+
+    lower = grid['origin']
+    upper = lower + np.asarray(grid['counts'].shape) * grid['voxel_size']
+    extent = (lower[AXES[horizontal]], upper[AXES[horizontal]], lower[AXES[vertical]], upper[AXES[vertical]])
+    return image, extent
+
+def compute_report_metrics(session_directory, bounds=STORE_BOUNDS, voxel_size=VOXEL_SIZE, use_cache=True):
+    """
+    Computes the projections of the position and gaze histograms plotted in the heatmap report.
+
+    Parameters:
+    session_directory (str): The path of the session directory.
+    bounds (tuple): Minimum and maximum corners of the histograms, (x, y, z) in meters.
+    voxel_size (float): Edge of the voxels in meters.
+    use_cache (bool): Whether to use the cache of the session.
+
+    Returns:
+    dict: The projections by kind ('position', 'gaze') and view, as (image, extent) pairs. Empty if the session has no points.
+    """
+    metrics = {}
+    for kind, views in [('position', ['floor']), ('gaze', ['floor', 'front', 'side'])]:
+        grid = session_grid(session_directory, kind, bounds, voxel_size, use_cache)
+        if grid is not None:
+            metrics[kind] = {view: project_grid(grid, view) for view in views}
+    return metrics
+
+def render_report(metrics, output_path):
+    """
+    Plots the projections computed by compute_report_metrics and saves them to a PDF.
+
+    Parameters:
+    metrics (dict): The projections returned by compute_report_metrics.
+    output_path (str): The file path to save the PDF report.
+    """
+    import matplotlib.pyplot as plt
+    from matplotlib.backends.backend_pdf import PdfPages
+    from matplotlib.colors import LogNorm
+    
+    titles = {'position': 'Head Position', 'gaze': 'Gaze Hit Points'}
+    view_titles = {'floor': 'Floor Plan', 'front': 'Shelf Faces (front view)', 'side': 'Shelf Faces (side view)'}
+
+    with PdfPages(output_path) as pdf:
+        for kind, projections in metrics.items():
+            for view, (image, extent) in projections.items():
+                horizontal, vertical, _ = PROJECTIONS[view]
+                fig, ax = plt.subplots(figsize=(10, 10))
+                if image.max() > 0:
+                    heatmap = ax.imshow(np.ma.masked_equal(image, 0), origin='lower', extent=extent, cmap='inferno',
+                                        norm=LogNorm(vmin=1, vmax=image.max()), aspect='equal', interpolation='nearest')
+                    fig.colorbar(heatmap, ax=ax, shrink=0.8, label='Samples')
+                ax.set_xlabel(f'{horizontal} (m)')
+                ax.set_ylabel(f'{vertical} (m)')
+                ax.set_title(f'{titles[kind]} - {view_titles[view]}')
+                pdf.savefig(fig)
+                plt.close(fig)
+                lap(ax.get_title(), int(image.sum()))
@@ -0,0 +1,507 @@
+import argparse
+import copy
+import hashlib
+import json
+import os
+import sys
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from functools import partial
+
+import numpy as np
+import pandas as pd
+
+import Eye_Tracking_Analyzer
+import ProductInteraction_Analyzer
+import Navigation_data_analyzer_v2
+import occupancy
+import shelf_gaze
+from VRShopping_Data_Analizer import VALID_SECTIONS, load_every_csv_in_directory_in_dictionary, sanitize_dataframe, segment_in_zones
+from csv_cache import CACHE_DIRECTORY_NAME
+from downsampling import DEFAULT_POINT_BUDGET
+from distances import compute_movement
+from fixations import classify_session_fixations
+from history import session_metric_tables, session_start_time
+from instrumentation import activate, new_run_log, stage, write_run_log
+from metrics_export import export_metrics
+from warehouse import open_warehouse, session_layout, store_session, stored_key
+
+# Every option of a run. A configuration file only needs the values that differ from these.
+DEFAULT_CONFIG = {
+    'sessions': [],
+    'output_directory': None,
+    'reports': ['eye_tracking', 'product_interaction', 'navigation', 'heatmaps'],
+    'zone_limits': {'shelf': 0.15, 'adjacent': 0.325, 'near': 0.55},
+    'movement_threshold': 0.01,
+    'fixations': {'min_duration': 0.15, 'max_angle': 1.5, 'min_freq': 30},
+    'plots': {'point_budget': DEFAULT_POINT_BUDGET, 'rasterize': None},
+    'metrics_only': False,
+    'save_csvs': False,
+    'use_cache': True,
+    'force': False,
+    'workers': None,
+    'run_log': True,
+    'warehouse': None,
+}
+
+# Directory of the reports of a session when no output directory is configured
+REPORTS_DIRECTORY_NAME = "reports"
+# Keys of the reports last built in an output directory, to skip the ones that are up to date
+MANIFEST_NAME = ".vrsi_pipeline.json"
+# Increase it whenever the metrics of a report change, so that every report is built again
+PIPELINE_VERSION = 1
+
+def _load(context):
+    return load_every_csv_in_directory_in_dictionary(context['session_directory'], context['config']['use_cache'])
+
+def _segment(context):
+    limits = context['config']['zone_limits']
+    return segment_in_zones(context['load'], shelf_limit=limits['shelf'], adjacent_limit=limits['adjacent'], near_limit=limits['near'])
+
+def _movement(context):
+    head_hands_data = compute_movement(context['segment'], context['config']['movement_threshold'])
+    if context['config']['save_csvs']:
+        head_hands_data.to_csv(os.path.join(context['output_directory'], "HeadHandsDataBigEnvironment_segmented.csv"), index=False)
+    return head_hands_data
+
+def _fixations(context):
+    parameters = context['config']['fixations']
+    dataframes_dict = context['load']
+    return classify_session_fixations({
+        "EyeTrackerData-ProductsBigEnvironment": dataframes_dict["EyeTrackerData-ProductsBigEnvironment.csv"],
+        "EyeTrackerData-AOIBigEnvironment": dataframes_dict["EyeTrackerData-AOIBigEnvironment.csv"]},
+        parameters['min_duration'], parameters['max_angle'], parameters['min_freq'], head_and_hands_df=context['movement'],
+        cache_directory=os.path.join(context['session_directory'], CACHE_DIRECTORY_NAME),
+        output_directory=context['output_directory'] if context['config']['save_csvs'] else None)
+
+def _eye_tracking_metrics(context):
+    return Eye_Tracking_Analyzer.compute_report_metrics(sanitize_dataframe(context['fixations']["EyeTrackerData-AOIBigEnvironment"]))
+
+def _product_interaction_metrics(context):
+    dataframes_dict = context['load']
+    return ProductInteraction_Analyzer.compute_report_metrics(dataframes_dict["ProductInteractionDataBigEnvironment.csv"],
+                                                              dataframes_dict["ShoppingCartDataBigEnvironment.csv"],
+                                                              dataframes_dict["ProductReleasesBigEnvironment.csv"])
+
+def _navigation_metrics(context):
+    return Navigation_data_analyzer_v2.compute_report_metrics(context['movement'], context['load']["TeleportDataBigEnvironment.csv"], VALID_SECTIONS)
+
+def _heatmap_metrics(context):
+    return occupancy.compute_report_metrics(context['session_directory'], use_cache=context['config']['use_cache'])
+
+def _shelf_gaze(context):
+    # Saved with the session, so that they can be added across sessions and users
+    eye_tracking_data = sanitize_dataframe(context['fixations']["EyeTrackerData-AOIBigEnvironment"])
+    grids = {}
+    for weighting in shelf_gaze.SHELF_GAZE_FILES:
+        grids[weighting] = shelf_gaze.shelf_gaze_grids(eye_tracking_data, weighting)
+        shelf_gaze.save_session_shelf_grids(context['session_directory'], grids[weighting], weighting)
+    return grids
+
+def _session_tables(context):
+    dataframes_dict = context['load']
+    return session_metric_tables(context['movement'], dataframes_dict["EyeTrackerData-AOIBigEnvironment.csv"], dataframes_dict["TeleportDataBigEnvironment.csv"],
+                                 dataframes_dict["ProductInteractionDataBigEnvironment.csv"], dataframes_dict["ShoppingCartDataBigEnvironment.csv"],
+                                 fixation_data=sanitize_dataframe(context['fixations']["EyeTrackerData-AOIBigEnvironment"]))
+
+# Stages of the analysis of a session: function and the stages whose results it reads
+STAGES = {
+    'load': (_load, []),
+    'segment': (_segment, ['load']),
+    'movement': (_movement, ['segment']),
+    'fixations': (_fixations, ['load', 'movement']),
+    'eye_tracking_metrics': (_eye_tracking_metrics, ['fixations']),
+    'product_interaction_metrics': (_product_interaction_metrics, ['load']),
+    'navigation_metrics': (_navigation_metrics, ['load', 'movement']),
+    'heatmap_metrics': (_heatmap_metrics, []),
+    'shelf_gaze': (_shelf_gaze, ['fixations']),
+    'session_tables': (_session_tables, ['load', 'movement', 'fixations']),
+}
+
+def _eye_tracking_parts(context):
+    return Eye_Tracking_Analyzer.report_parts(context['eye_tracking_metrics'], **context['config']['plots'])
+
+def _product_interaction_parts(context):
+    return [(ProductInteraction_Analyzer.render_report, context['product_interaction_metrics'])]
+
+def _navigation_parts(context):
+    return [(partial(Navigation_data_analyzer_v2.render_report, **context['config']['plots']), context['navigation_metrics'])]
+
+def _heatmap_parts(context):
+    # Sessions recorded without the PLAYERS_JSONs point clouds have no 3D heatmaps
+    parts = [(occupancy.render_report, context['heatmap_metrics'])] if context['heatmap_metrics'] else []
+    if context['shelf_gaze']['fixations']:
+        parts.append((shelf_gaze.render_shelf_grids, context['shelf_gaze']['fixations']))
+    return parts
+
+# Reports that can be built: PDF file, metrics file of the metrics-only mode, stages they are computed from,
+# configuration values they depend on and parts
+REPORTS = {
+    'eye_tracking': {'file': "VRSI_EyeTrackingAOIs_Report.pdf", 'metrics_file': "VRSI_EyeTracking_metrics.json",
+                     'stages': ['eye_tracking_metrics'], 'parameters': ['zone_limits', 'movement_threshold', 'fixations', 'plots'],
+                     'parts': _eye_tracking_parts},
+    'product_interaction': {'file': "VRSI_ProductInteraction_report.pdf", 'metrics_file': "VRSI_ProductInteraction_metrics.json",
+                            'stages': ['product_interaction_metrics'], 'parameters': [], 'parts': _product_interaction_parts},
+    'navigation': {'file': "VRSI_Navigation_Report.pdf", 'metrics_file': "VRSI_Navigation_metrics.json",
+                   'stages': ['navigation_metrics'], 'parameters': ['zone_limits', 'movement_threshold', 'plots'],
+                   'parts': _navigation_parts},
+    'heatmaps': {'file': "VRSI_Heatmaps_Report.pdf", 'metrics_file': "VRSI_Heatmaps_metrics.json",
+                 'stages': ['heatmap_metrics', 'shelf_gaze'], 'parameters': ['zone_limits', 'movement_threshold', 'fixations'],
+                 'parts': _heatmap_parts},
+}
+
+# Configuration values the tables stored in the metrics warehouse depend on
+WAREHOUSE_PARAMETERS = ['zone_limits', 'movement_threshold', 'fixations']
+
+def load_config(path=None, **overrides):
+    """
+    Builds the configuration of a run from the defaults, a JSON configuration file and explicit values.
+    Nested values (zone limits and fixation parameters) can be given partially.
+
+    Parameters:
+    path (str, optional): The path of the JSON configuration file.
+    overrides: Values that take precedence over the file. None values are ignored.
+
+    Returns:
+    dict: The configuration.
+    """
+    config = copy.deepcopy(DEFAULT_CONFIG)
+    values = {}
+    if path is not None:
+        with open(path) as file:
+            values = json.load(file)
+    values.update({key: value for key, value in overrides.items() if value is not None})
+
+    unknown = set(values) - set(DEFAULT_CONFIG)
+    if unknown:
+        raise ValueError(f"Unknown configuration options: {sorted(unknown)}.")
+    for key, value in values.items():
+        if isinstance(DEFAULT_CONFIG[key], dict):
+            unknown = set(value) - set(DEFAULT_CONFIG[key])
+            if unknown:
+                raise ValueError(f"Unknown '{key}' options: {sorted(unknown)}.")
+            config[key].update(value)
+        else:
+            config[key] = value
+
+    unknown = set(config['reports']) - set(REPORTS)
+    if unknown:
+        raise ValueError(f"Unknown reports: {sorted(unknown)}, expected some of {list(REPORTS)}.")
+    if isinstance(config['sessions'], str):
+        config['sessions'] = [config['sessions']]
+    return config
+
+def required_stages(targets):
+    """
+    Lists the stages needed to compute some stages, including every stage they depend on.
+
+    Parameters:
+    targets (iterable): Names of the stages.
+
+    Returns:
+    list: The names of the stages, each one after its dependencies.
+    """
+    ordered = []
+    def visit(name):
+        if name not in ordered:
+            for dependency in STAGES[name][1]:
+                visit(dependency)
+            ordered.append(name)
+    for name in targets:
+        visit(name)
+    return ordered
+
+def _result_rows(result):
+    # Rows of the tables and arrays of a stage result, also nested in dictionaries and tuples (e.g. the metrics), None if it has none
+    if isinstance(result, (pd.DataFrame, pd.Series, np.ndarray)):
+        return len(result) if result.ndim else None
+    if isinstance(result, dict):
+        result = list(result.values())
+    if isinstance(result, (list, tuple)):
+        counts = [rows for rows in map(_result_rows, result) if rows is not None]
+        return sum(counts) if counts else None
+    return None
+
+def _run_stage(name, context):
+    with stage(name) as record:
+        result = STAGES[name][0](context)
+        record['rows'] = _result_rows(result)
+    return result
+
+def run_stages(targets, context, workers=None):
+    """
+    Runs some stages and their dependencies. Every stage starts as soon as the stages it depends on are done,
+    so independent stages (e.g. the metrics of different reports) run concurrently in threads.
+    If a stage fails, no further stage is started and its error is raised.
+
+    Parameters:
+    targets (iterable): Names of the stages to compute.
+    context (dict): The session directory, output directory and configuration of the run. The result of every
+                    stage is added to it under the name of the stage.
+    workers (int, optional): Maximum number of stages running at the same time.
+
+    Returns:
+    dict: The context, with the results of the stages.
+    """
+    pending = [name for name in required_stages(targets) if name not in context]
+    if not pending:
+        return context
+
+    running = {}
+    with ThreadPoolExecutor(max_workers=workers or len(pending)) as executor:
+        while pending or running:
+            for name in [name for name in pending if all(dependency in context for dependency in STAGES[name][1])]:
+                pending.remove(name)
+                running[executor.submit(_run_stage, name, context)] = name
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    context[name] = future.result()
+                except Exception:
+                    # The stages already running are waited for by the executor, the pending ones never start
+                    pending.clear()
+                    raise
+    return context
+
+def session_fingerprint(session_directory):
+    """
+    Lists the input files of a session with their size and modification time.
+
+    Parameters:
+    session_directory (str): The path of the session directory.
+
+    Returns:
+    list: [relative path, size, modification time in ns] of every CSV and PLAYERS_JSONs file, sorted by path.
+    """
+    paths = [os.path.join(session_directory, name) for name in os.listdir(session_directory) if name.endswith(".csv")]
+    for kind in occupancy.POINT_FILE_PREFIXES:
+        paths.extend(occupancy.find_point_files(session_directory, kind))
+    return [[os.path.relpath(path, session_directory), os.path.getsize(path), os.stat(path).st_mtime_ns] for path in sorted(paths)]
+
+def report_key(report, config, fingerprint):
+    """
+    Computes the key of a report: a digest of the session inputs and of the configuration values it depends on.
+
+    Parameters:
+    report (str): Name of the report.
+    config (dict): The configuration of the run.
+    fingerprint (list): The input files of the session, returned by session_fingerprint.
+
+    Returns:
+    str: The hexadecimal digest.
+    """
+    return _digest(report, REPORTS[report]['parameters'], config, fingerprint)
+
+def warehouse_key(config, fingerprint):
+    """
+    Computes the key of the metric tables of a session stored in the metrics warehouse, like the key of a report.
+
+    Parameters:
+    config (dict): The configuration of the run.
+    fingerprint (list): The input files of the session, returned by session_fingerprint.
+
+    Returns:
+    str: The hexadecimal digest.
+    """
+    return _digest('warehouse', WAREHOUSE_PARAMETERS, config, fingerprint)
+
+def _digest(name, parameters, config, fingerprint):
+    key = {'version': PIPELINE_VERSION, 'report': name, 'inputs': fingerprint, 'parameters': {parameter: config[parameter] for parameter in parameters}}
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()
+
+def _read_manifest(path):
+    try:
+        with open(path) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+def session_output_directory(session_directory, config):
+    """
+    Returns the directory where the reports of a session are written: the 'reports' folder of the session, or the
+    configured output directory. If several sessions share an output directory, each one gets a subdirectory.
+
+    Parameters:
+    session_directory (str): The path of the session directory.
+    config (dict): The configuration of the run.
+
+    Returns:
+    str: The path of the output directory.
+    """
+    if config['output_directory'] is None:
+        return os.path.join(session_directory, REPORTS_DIRECTORY_NAME)
+    if len(config['sessions']) > 1:
+        return os.path.join(config['output_directory'], os.path.basename(os.path.normpath(session_directory)))
+    return config['output_directory']
+
+def run_session(session_directory, config):
+    """
+    Builds the configured reports of a session. Only the stages needed by the reports that are missing or out of date
+    (their inputs or parameters changed since they were built) are run, unless 'force' is set.
+    In the metrics-only mode the metrics of each report are exported as JSON and tables instead, and matplotlib,
+    reportlab and PyPDF2 are never imported. If a metrics warehouse is configured, the metric tables of the session
+    are stored in it too, unless it already has them for the same inputs and parameters.
+
+    Parameters:
+    session_directory (str): The path of the session directory.
+    config (dict): The configuration of the run, returned by load_config.
+
+    Returns:
+    dict: The names of the reports 'built', 'up_to_date' and 'failed' (report name to error), and whether the tables
+          were 'stored' in the warehouse. A report without any data (e.g. the heatmaps of a session without point
+          clouds) is not written and is in none of them.
+    """
+    if not os.path.isdir(session_directory):
+        raise FileNotFoundError(f"Session directory not found: {session_directory}")
+    output_directory = session_output_directory(session_directory, config)
+    os.makedirs(output_directory, exist_ok=True)
+    manifest_path = os.path.join(output_directory, MANIFEST_NAME)
+    manifest = _read_manifest(manifest_path)
+
+    fingerprint = session_fingerprint(session_directory)
+    keys = {report: report_key(report, config, fingerprint) for report in config['reports']}
+    files = {report: REPORTS[report]['metrics_file' if config['metrics_only'] else 'file'] for report in config['reports']}
+    stale = []
+    for report in config['reports']:
+        entry = manifest.get(files[report], {})
+        written = not entry.get('written', True) or os.path.exists(os.path.join(output_directory, files[report]))
+        if config['force'] or entry.get('key') != keys[report] or not written:
+            stale.append(report)
+    result = {'built': [], 'up_to_date': [report for report in config['reports'] if report not in stale], 'failed': {}, 'stored': False}
+
+    # Sessions are stored as <user>/<session>
+    user = os.path.basename(os.path.dirname(os.path.normpath(os.path.abspath(session_directory))))
+    session = os.path.basename(os.path.normpath(session_directory))
+    store = False
+    if config['warehouse'] is not None:
+        key = warehouse_key(config, fingerprint)
+        connection = open_warehouse(config['warehouse'])
+        try:
+            store = config['force'] or stored_key(connection, user, session) != key
+        finally:
+            connection.close()
+    if not stale and not store:
+        return result
+
+    run_log = new_run_log(session_directory) if config['run_log'] else None
+    previous = activate(run_log)
+    try:
+        context = {'session_directory': session_directory, 'output_directory': output_directory, 'config': config}
+        run_stages([name for report in stale for name in REPORTS[report]['stages']] + (['session_tables'] if store else []), context, config['workers'])
+
+        if store:
+            with stage('store_session'):
+                connection = open_warehouse(config['warehouse'])
+                try:
+                    store_session(connection, user, session, context['session_tables'], session_start_time(session_directory),
+                                  session_layout(session_directory), key)
+                finally:
+                    connection.close()
+            result['stored'] = True
+
+        outputs = {}
+        for report in stale:
+            if config['metrics_only']:
+                outputs[report] = {name: context[name] for name in REPORTS[report]['stages']}
+                continue
+            parts = REPORTS[report]['parts'](context)
+            if parts:
+                outputs[report] = parts
+            else:
+                manifest[files[report]] = {'key': keys[report], 'written': False}
+        paths = {os.path.join(output_directory, files[report]): report for report in outputs}
+
+        failures = {}
+        if config['metrics_only']:
+            with stage('export_metrics'):
+                for path, report in paths.items():
+                    export_metrics(outputs[report], path)
+        elif paths:
+            from rendering import render_reports  # Imported here, the metrics-only mode never loads the PDF libraries
+            with stage('render_reports'):
+                failures = render_reports({path: outputs[report] for path, report in paths.items()}, config['workers'])
+    finally:
+        activate(previous)
+        if run_log is not None:
+            write_run_log(run_log, os.path.join(output_directory, "VRSI_run_log.json"))
+
+    for path, report in paths.items():
+        if path in failures:
+            result['failed'][report] = failures[path]
+            manifest.pop(files[report], None)
+        else:
+            result['built'].append(report)
+            manifest[files[report]] = {'key': keys[report], 'written': True}
+    with open(manifest_path, 'w') as file:
+        json.dump(manifest, file, indent=2)
+    return result
+
+def run_pipeline(config):
+    """
+    Builds the configured reports of every configured session, without any prompt.
+    A session that fails is reported and does not abort the rest of the run.
+
+    Parameters:
+    config (dict): The configuration of the run, returned by load_config.
+
+    Returns:
+    tuple: The result of every session (dict of session directory to the result of run_session) and the failed
+           sessions (dict of session directory to error).
+    """
+    results = {}
+    failures = {}
+    for session_directory in config['sessions']:
+        name = os.path.basename(os.path.normpath(session_directory))
+        try:
+            results[session_directory] = run_session(session_directory, config)
+        except Exception as error:
+            failures[session_directory] = "".join(traceback.format_exception_only(type(error), error)).strip()
+            print(f"Session {name} failed: {failures[session_directory]}")
+            continue
+        for report, error in results[session_directory]['failed'].items():
+            failures.setdefault(session_directory, f"Report {report} failed: {error}")
+        print(f"{name}: {len(results[session_directory]['built'])} reports built, "
+              f"{len(results[session_directory]['up_to_date'])} up to date, {len(results[session_directory]['failed'])} failed.")
+    return results, failures
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Builds the reports of VR shopping sessions without any prompt.")
+    parser.add_argument("sessions", nargs="*", help="Session directories, added to the ones of the configuration file.")
+    parser.add_argument("--config", default=None, help="JSON configuration file (see DEFAULT_CONFIG for the options).")
+    parser.add_argument("--output-directory", default=None, help="Directory of the reports. Defaults to the 'reports' folder of each session.")
+    parser.add_argument("--reports", nargs="+", choices=list(REPORTS), default=None, help="Reports to build.")
+    parser.add_argument("--shelf-limit", type=float, default=None, help="Distance limit of the Shelf zone in meters.")
+    parser.add_argument("--adjacent-limit", type=float, default=None, help="Distance limit of the Adjacent zone in meters.")
+    parser.add_argument("--near-limit", type=float, default=None, help="Distance limit of the Near zone in meters.")
+    parser.add_argument("--movement-threshold", type=float, default=None, help="Distance in meters below which the player is stopped.")
+    parser.add_argument("--min-duration", type=float, default=None, help="I-DT minimum fixation duration in seconds.")
+    parser.add_argument("--max-angle", type=float, default=None, help="I-DT maximum dispersion angle in degrees.")
+    parser.add_argument("--min-freq", type=float, default=None, help="I-DT minimum sampling frequency in Hz.")
+    parser.add_argument("--point-budget", type=int, default=None, help="Maximum number of points of each time-series plot, 0 to plot every frame.")
+    parser.add_argument("--rasterize", action="store_true", default=None, help="Rasterize the dense layers of the time-series plots.")
+    parser.add_argument("--workers", type=int, default=None, help="Maximum number of concurrent stages and render processes.")
+    parser.add_argument("--metrics-only", action="store_true", default=None, help="Export the metrics as JSON and tables instead of PDF reports.")
+    parser.add_argument("--save-csvs", action="store_true", default=None, help="Also save the segmented and fixation CSV files.")
+    parser.add_argument("--no-cache", dest="use_cache", action="store_false", default=None, help="Parse every file again.")
+    parser.add_argument("--warehouse", default=None, help="SQLite metrics warehouse where the metric tables of every session are stored.")
+    parser.add_argument("--force", action="store_true", default=None, help="Build the reports even if they are up to date.")
+    args = parser.parse_args()
+
+    config = load_config(args.config, output_directory=args.output_directory, reports=args.reports,
+                         movement_threshold=args.movement_threshold, workers=args.workers, metrics_only=args.metrics_only, save_csvs=args.save_csvs,
+                         use_cache=args.use_cache, force=args.force, warehouse=args.warehouse)
+    config['sessions'] = config['sessions'] + args.sessions
+    config['zone_limits'].update({name: value for name, value in [('shelf', args.shelf_limit), ('adjacent', args.adjacent_limit),
+                                                                  ('near', args.near_limit)] if value is not None})
+    config['fixations'].update({name: value for name, value in [('min_duration', args.min_duration), ('max_angle', args.max_angle),
+                                                                ('min_freq', args.min_freq)] if value is not None})
+    if args.point_budget is not None:
+        config['plots']['point_budget'] = args.point_budget or None
+    if args.rasterize:
+        config['plots']['rasterize'] = True
+    if not config['sessions']:
+        parser.error("no session directory given, neither in the arguments nor in the configuration file")
+
+    _, failures = run_pipeline(config)
+    sys.exit(1 if failures else 0)
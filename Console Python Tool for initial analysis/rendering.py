@@ -0,0 +1,127 @@
+import io
+import os
+import traceback
+import uuid
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from instrumentation import activate, active_log, add_stages, new_run_log, stage
+
+# Non-interactive matplotlib backend used by the render workers
+HEADLESS_BACKEND = "Agg"
+
+def use_headless_backend():
+    """
+    Selects the non-interactive matplotlib backend. It is the initializer of the render worker processes,
+    which must never open a window.
+    """
+    import matplotlib
+    matplotlib.use(HEADLESS_BACKEND)
+
+def render_to_bytes(render_function, metrics):
+    """
+    Renders a part of a report in memory.
+
+    Parameters:
+    render_function (function): Called as function(metrics, pdf_file), with a binary file object.
+    metrics (dict): The metrics of the part.
+
+    Returns:
+    bytes: The PDF document.
+    """
+    with io.BytesIO() as pdf_file:
+        render_function(metrics, pdf_file)
+        return pdf_file.getvalue()
+
+def _render_part(render_function, metrics, instrumented=False):
+    # The stages of the worker are sent back to the run log of the main process with the document
+    run_log = new_run_log() if instrumented else None
+    previous = activate(run_log)
+    try:
+        with stage(getattr(render_function, 'func', render_function).__name__):
+            document = render_to_bytes(render_function, metrics)
+    finally:
+        activate(previous)
+    return document, run_log['stages'] if instrumented else []
+
+def _as_stream(part):
+    return io.BytesIO(part) if isinstance(part, (bytes, bytearray)) else part
+
+def write_pdf(parts, destination):
+    """
+    Writes several PDF documents as a single document. A path is written atomically: the document is written
+    to a temporary file next to it, with a unique name, and then renamed, so a reader never sees a partial
+    report and concurrent runs never share intermediate files.
+
+    Parameters:
+    parts (list): The documents in page order, as bytes, paths or binary file objects.
+    destination (str or file object): The path of the final PDF, or a writable binary file object.
+    """
+    if not isinstance(destination, (str, os.PathLike)):
+        if len(parts) == 1 and isinstance(parts[0], (bytes, bytearray)):
+            destination.write(parts[0])
+            return
+        import PyPDF2
+        merger = PyPDF2.PdfMerger()
+        for part in parts:
+            merger.append(_as_stream(part))
+        merger.write(destination)
+        merger.close()
+        return
+
+    output_directory = os.path.dirname(destination)
+    if output_directory:
+        os.makedirs(output_directory, exist_ok=True)
+    temporary_path = f"{destination}.{uuid.uuid4().hex}.tmp"
+    try:
+        with open(temporary_path, 'wb') as file:
+            write_pdf(parts, file)
+        os.replace(temporary_path, destination)
+    except BaseException:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+        raise
+
+def render_reports(reports, workers=None):
+    """
+    Renders several PDF reports in a pool of worker processes with a headless backend. Every part of every report
+    is an independent render job that receives precomputed metric tables. The parts are rendered in memory and
+    sent back as bytes, and the final PDFs are only written once every job has finished, without intermediate files.
+    A report with a failed part is reported and not written, the rest of the reports are.
+    If instrumentation is active, the time and memory of every part and of the figures inside it are recorded.
+
+    Parameters:
+    reports (dict): The parts of each report by output path, as a list of (render function, metrics) pairs in page order.
+                    Each function is called as function(metrics, pdf_file) and must be defined at module level
+                    (or be a functools.partial of one, to pass rendering options).
+    workers (int, optional): Number of worker processes. Defaults to one per job, up to the number of CPUs.
+
+    Returns:
+    dict: The failed reports, output path to error.
+    """
+    failures = {}
+    documents = {}
+    jobs = sum(len(parts) for parts in reports.values())
+    with ProcessPoolExecutor(max_workers=workers or min(max(jobs, 1), os.cpu_count() or 1), initializer=use_headless_backend) as executor:
+        futures = {}
+        for output_path, parts in reports.items():
+            documents[output_path] = [None] * len(parts)
+            for part_index, (render_function, metrics) in enumerate(parts):
+                futures[executor.submit(_render_part, render_function, metrics, active_log() is not None)] = (output_path, part_index)
+
+        for future in as_completed(futures):
+            output_path, part_index = futures[future]
+            try:
+                documents[output_path][part_index], stages = future.result()
+                add_stages(stages, prefix=os.path.basename(output_path))
+            except Exception as error:
+                failures[output_path] = "".join(traceback.format_exception_only(type(error), error)).strip()
+                print(f"Rendering of {output_path} failed: {failures[output_path]}")
+
+    # Write the final documents once every job has finished
+    for output_path, parts in documents.items():
+        if output_path not in failures:
+            with stage(f"write {os.path.basename(output_path)}"):
+                write_pdf(parts, output_path)
+            print(f"Report saved to {output_path}")
+
+    return failures
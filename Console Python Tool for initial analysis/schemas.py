@@ -0,0 +1,135 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+# Column types of the VRSI streams. Frames are integers, times are kept in float64 (float32 would lose
+# the milliseconds after a few hours), positions, rotations and velocities are float32 and labels are categorical.
+FRAME = 'int32'
+TIME = 'float64'
+COORDINATE = 'float32'
+LABEL = 'category'
+FLAG = 'bool'
+
+def _vector(name, dtype=COORDINATE):
+    return {f"{name}_{axis}": dtype for axis in ['x', 'y', 'z']}
+
+def _vectors(*names):
+    columns = {}
+    for name in names:
+        columns.update(_vector(name))
+    return columns
+
+_EYE_TRACKING_SCHEMA = {
+    'Frame': FRAME, 'Timestamp': TIME, 'Product/AOI': LABEL, 'Section/Shelf': LABEL,
+    **_vectors('EyeLeftPosition', 'EyeLeftRotation', 'EyeRightPosition', 'EyeRightRotation', 'HMD', 'RCHit'),
+}
+
+_HAND_STATES = {'RightHand_State': LABEL, 'LeftHand_State': LABEL}
+
+# Declared schema of every stream recorded by the Unity data managers, by file name
+SCHEMAS = {
+    "EyeTrackerData-AOIBigEnvironment.csv": _EYE_TRACKING_SCHEMA,
+    "EyeTrackerData-ProductsBigEnvironment.csv": _EYE_TRACKING_SCHEMA,
+    "HeadHandsDataBigEnvironment.csv": {
+        'Frame': FRAME, 'Timestamp': TIME,
+        **_vectors('HMD', 'HMD_rot', 'HandR', 'HandR_rot', 'HandL', 'HandL_rot', 'Velocity_HandR', 'Velocity_HandL'),
+        'Distance': COORDINATE, 'Zone': LABEL,
+    },
+    "ProductInteractionDataBigEnvironment.csv": {
+        'Frame': FRAME, 'Timestamp': TIME, 'Object': LABEL, 'Section': LABEL, 'State': LABEL,
+        **_vectors('Position', 'Rotation', 'Scale'), **_HAND_STATES,
+    },
+    "ProductReleasesBigEnvironment.csv": {
+        'Frame': FRAME, 'Timestamp': TIME, 'Object': LABEL, 'DurationUntilRelease': TIME, **_HAND_STATES,
+    },
+    "ShelvesDataBigEnvironment.csv": {
+        'Frame': FRAME, 'Timestamp': TIME, 'Shelf': LABEL, 'AOI': LABEL,
+        **_vectors('HandR', 'HandR_rot', 'HandL', 'HandL_rot', 'Velocity_HandR', 'Velocity_HandL'),
+    },
+    "ShoppingCartDataBigEnvironment.csv": {'Frame': FRAME, 'Timestamp': TIME, 'Item': LABEL, 'Action': LABEL},
+    "TeleportDataBigEnvironment.csv": {
+        'Frame': FRAME, 'Timestamp': TIME, 'TPHotspot': LABEL, 'HMD_x': COORDINATE, 'HMD_z': COORDINATE,
+        'Duration': TIME, 'WasTP': FLAG, 'ZOI': LABEL, 'Distance': COORDINATE, **_HAND_STATES,
+    },
+    "TurningsBigEnvironment.csv": {'Frame': FRAME, 'Timestamp': TIME, **_HAND_STATES},
+}
+
+def schema_for(csv_path):
+    """
+    Returns the declared schema of a session CSV file.
+
+    Parameters:
+    csv_path (str): The path or the name of the CSV file.
+
+    Returns:
+    dict: Column types by column name, or None if the file is not a known stream.
+    """
+    return SCHEMAS.get(os.path.basename(csv_path))
+
+def parse_dtypes(schema):
+    """
+    Returns the types pd.read_csv can apply while parsing. Frames are parsed as floats, as some streams
+    write them with decimals ("674.0000"), and converted by apply_schema.
+
+    Parameters:
+    schema (dict): Column types by column name.
+
+    Returns:
+    dict: Column types for the 'dtype' argument of pd.read_csv.
+    """
+    return {column: 'float64' if dtype == FRAME else dtype for column, dtype in schema.items() if dtype != FLAG}
+
+def apply_schema(df, schema):
+    """
+    Converts the columns of a parsed stream to the types of its schema. Columns missing from the schema keep
+    the type pandas inferred, and columns of the schema missing from the data are ignored.
+
+    Parameters:
+    df (pandas.DataFrame): The parsed stream, with stripped column names.
+    schema (dict): Column types by column name.
+
+    Returns:
+    pandas.DataFrame: The DataFrame with the declared types.
+    """
+    for column, dtype in schema.items():
+        if column not in df.columns:
+            continue
+        values = df[column]
+        if dtype == FLAG and values.dtype != bool:
+            values = values.astype(str).str.strip().str.lower() == 'true'
+        elif dtype == LABEL:
+            if values.dtype != 'category':
+                values = values.astype(LABEL)
+            categories = values.cat.categories
+            if categories.dtype == object and (categories.str.strip() != categories).any():
+                values = values.astype(str).str.strip().astype(LABEL)
+        elif dtype == FRAME and values.dtype != np.int32:
+            values = values.astype(np.int64).astype(FRAME)
+        elif values.dtype != dtype:
+            values = values.astype(dtype)
+        df[column] = values
+    return df
+
+def read_stream_csv(source, name=None, **read_csv_kwargs):
+    """
+    Parses a session CSV file with its declared schema. The leading spaces after the separators are skipped
+    while parsing, so the cells do not need to be stripped afterwards.
+
+    Parameters:
+    source (str or file-like): The CSV file.
+    name (str, optional): The file name used to find the schema. Defaults to the name of 'source'.
+    read_csv_kwargs: Other arguments of pd.read_csv, e.g. 'chunksize'.
+
+    Returns:
+    pandas.DataFrame: The typed DataFrame, or a reader of typed chunks if 'chunksize' is given.
+    """
+    schema = schema_for(name or source) or {}
+    data = pd.read_csv(source, skipinitialspace=True, dtype=parse_dtypes(schema), **read_csv_kwargs)
+    if 'chunksize' in read_csv_kwargs or 'iterator' in read_csv_kwargs:
+        return (_typed(chunk, schema) for chunk in data)
+    return _typed(data, schema)
+
+def _typed(df, schema):
+    df.columns = df.columns.str.strip()
+    return apply_schema(df, schema)
@@ -0,0 +1,226 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from csv_cache import CACHE_DIRECTORY_NAME
+from instrumentation import lap
+from Eye_Tracking_Analyzer import extract_fixation_events
+
+# Cells of every density grid (meters). The grids are aligned to a lattice of this size, so they can always be added.
+CELL_SIZE = 0.05
+# The horizontal extent of a grid is rounded to multiples of FACE_STEP, so that sessions usually share their extents
+FACE_STEP = 0.5
+SHELF_HEIGHT = 2.5
+
+# Horizontal axis of the two candidate face planes of a shelf (the vertical axis is always Y)
+FACE_AXES = {'x': 0, 'z': 2}
+HIT_COLUMNS = ['RCHit_x', 'RCHit_y', 'RCHit_z']
+
+# Files where the grids of a session are saved, inside its cache directory, by weighting
+SHELF_GAZE_FILES = {'samples': "shelf_gaze_samples.npz", 'fixations': "shelf_gaze_fixations.npz"}
+
+def _bin_face(horizontal, vertical, weights):
+    start = np.floor(horizontal.min() / FACE_STEP) * FACE_STEP
+    end = np.floor(horizontal.max() / FACE_STEP) * FACE_STEP + FACE_STEP
+    n_rows = int(round(SHELF_HEIGHT / CELL_SIZE))
+    n_columns = int(round((end - start) / CELL_SIZE))
+
+    rows = np.floor(vertical / CELL_SIZE).astype(np.intp)
+    columns = np.floor((horizontal - start) / CELL_SIZE).astype(np.intp)
+    inside = (rows >= 0) & (rows < n_rows) & (columns >= 0) & (columns < n_columns)
+    counts = np.bincount(rows[inside] * n_columns + columns[inside], weights=weights[inside], minlength=n_rows * n_columns)
+    return {'start': float(start), 'counts': counts.reshape(n_rows, n_columns)}
+
+def _add_faces(face, other):
+    # Offsets in cells on the shared lattice
+    start = min(face['start'], other['start'])
+    n_columns = max(int(round((grid['start'] - start) / CELL_SIZE)) + grid['counts'].shape[1] for grid in [face, other])
+    counts = np.zeros((face['counts'].shape[0], n_columns))
+    for grid in [face, other]:
+        offset = int(round((grid['start'] - start) / CELL_SIZE))
+        counts[:, offset:offset + grid['counts'].shape[1]] += grid['counts']
+    return {'start': start, 'counts': counts}
+
+def shelf_gaze_grids(eye_tracking_data, weighting='samples'):
+    """
+    Projects the gaze hits of every shelf onto its face plane and accumulates them into 2D density grids.
+    The face of a shelf may be parallel to the X or to the Z axis, so both projections are kept; select_face
+    picks the one the shelf is facing.
+
+    Parameters:
+    eye_tracking_data (pandas.DataFrame): The eye-tracking data with the 'Section/Shelf' and 'RCHit_x/y/z' columns,
+                                          and the fixation columns for the 'fixations' weighting.
+    weighting (str): 'samples' to count every gaze sample, or 'fixations' to add the centroid of every fixation
+                     weighted by its duration.
+
+    Returns:
+    dict: The grids by shelf, each one a dictionary of faces by horizontal axis ('x', 'z') with the 'start' of the
+          face along that axis and the 'counts', rows from the floor up to SHELF_HEIGHT and columns of CELL_SIZE.
+    """
+    if weighting == 'fixations':
+        events = extract_fixation_events(eye_tracking_data)
+        shelves = events['Section/Shelf']
+        hits = events[['Centroid_x', 'Centroid_y', 'Centroid_z']].to_numpy(dtype=float)
+        weights = events['fixation_duration'].to_numpy(dtype=float)
+    elif weighting == 'samples':
+        shelves = eye_tracking_data['Section/Shelf']
+        hits = eye_tracking_data[HIT_COLUMNS].to_numpy(dtype=float)
+        weights = np.ones(len(hits))
+    else:
+        raise ValueError(f"Unknown weighting '{weighting}', expected one of {list(SHELF_GAZE_FILES)}.")
+
+    codes, names = pd.factorize(shelves)
+    valid = (codes >= 0) & np.isfinite(hits).all(axis=1)
+    codes, hits, weights = codes[valid], hits[valid], weights[valid]
+
+    # Sort the hits by shelf once, every shelf is then a contiguous block
+    order = np.argsort(codes, kind='stable')
+    bounds = np.searchsorted(codes[order], np.arange(len(names) + 1))
+    grids = {}
+    for code, shelf in enumerate(names):
+        block = order[bounds[code]:bounds[code + 1]]
+        if len(block):
+            grids[str(shelf)] = {axis: _bin_face(hits[block, column], hits[block, 1], weights[block]) for axis, column in FACE_AXES.items()}
+    return grids
+
+def merge_shelf_grids(grids_list):
+    """
+    Adds the shelf density grids of several chunks, sessions or users. The grids are aligned on the same lattice,
+    so grids with different extents are padded before adding them.
+
+    Parameters:
+    grids_list (iterable): Grids returned by shelf_gaze_grids or load_shelf_grids. None values are skipped.
+
+    Returns:
+    dict: The summed grids by shelf.
+    """
+    total = {}
+    for grids in grids_list:
+        for shelf, faces in (grids or {}).items():
+            if shelf not in total:
+                total[shelf] = {axis: {'start': face['start'], 'counts': face['counts'].astype(float)} for axis, face in faces.items()}
+            else:
+                total[shelf] = {axis: _add_faces(total[shelf][axis], face) for axis, face in faces.items()}
+    return total
+
+def select_face(faces):
+    """
+    Selects the face plane a shelf is facing: the projection whose hits are spread along the widest horizontal range.
+
+    Parameters:
+    faces (dict): The faces of a shelf grid, by horizontal axis.
+
+    Returns:
+    tuple: The horizontal axis and the face.
+    """
+    def spread(face):
+        occupied = np.flatnonzero(face['counts'].sum(axis=0))
+        return occupied[-1] - occupied[0] if len(occupied) else -1
+    axis = max(faces, key=lambda axis: spread(faces[axis]))
+    return axis, faces[axis]
+
+def save_shelf_grids(grids, path):
+    """
+    Saves shelf density grids to a compressed .npz file.
+
+    Parameters:
+    grids (dict): The grids by shelf.
+    path (str): The path of the file.
+    """
+    index, arrays = [], {}
+    for shelf, faces in grids.items():
+        for axis, face in faces.items():
+            index.append([shelf, axis, face['start']])
+            arrays[f"counts_{len(index) - 1}"] = face['counts']
+    np.savez_compressed(path, cell_size=CELL_SIZE, index=json.dumps(index), **arrays)
+
+def load_shelf_grids(path):
+    """
+    Loads shelf density grids saved by save_shelf_grids.
+
+    Parameters:
+    path (str): The path of the file.
+
+    Returns:
+    dict: The grids by shelf.
+    """
+    grids = {}
+    with np.load(path) as data:
+        if float(data['cell_size']) != CELL_SIZE:
+            raise ValueError(f"{path} was saved with cells of {float(data['cell_size'])} m instead of {CELL_SIZE} m.")
+        for position, (shelf, axis, start) in enumerate(json.loads(str(data['index']))):
+            grids.setdefault(shelf, {})[axis] = {'start': start, 'counts': data[f"counts_{position}"]}
+    return grids
+
+def session_shelf_grids_path(session_directory, weighting='samples'):
+    """
+    Returns the path where the shelf density grids of a session are saved.
+
+    Parameters:
+    session_directory (str): The path of the session directory.
+    weighting (str): 'samples' or 'fixations'.
+
+    Returns:
+    str: The path of the .npz file in the cache directory of the session.
+    """
+    return os.path.join(session_directory, CACHE_DIRECTORY_NAME, SHELF_GAZE_FILES[weighting])
+
+def save_session_shelf_grids(session_directory, grids, weighting='samples'):
+    """
+    Saves the shelf density grids of a session in its cache directory, so that they can be added across sessions
+    without reading the gaze data again.
+
+    Parameters:
+    session_directory (str): The path of the session directory.
+    grids (dict): The grids by shelf.
+    weighting (str): 'samples' or 'fixations'.
+    """
+    path = session_shelf_grids_path(session_directory, weighting)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        save_shelf_grids(grids, path)
+    except OSError as error:
+        print(f"Could not save the shelf gaze grids of {session_directory}: {error}")
+
+def sum_session_shelf_grids(session_directories, weighting='samples'):
+    """
+    Adds the saved shelf density grids of several sessions. Sessions without saved grids are skipped.
+
+    Parameters:
+    session_directories (iterable): The paths of the session directories.
+    weighting (str): 'samples' or 'fixations'.
+
+    Returns:
+    dict: The summed grids by shelf, empty if no session has saved grids.
+    """
+    paths = [session_shelf_grids_path(directory, weighting) for directory in session_directories]
+    return merge_shelf_grids(load_shelf_grids(path) for path in paths if os.path.exists(path))
+
+def render_shelf_grids(grids, output_path):
+    """
+    Plots the density grid of every shelf on its face plane and saves them to a PDF.
+
+    Parameters:
+    grids (dict): The grids by shelf.
+    output_path (str): The file path to save the PDF report.
+    """
+    import matplotlib.pyplot as plt
+    from matplotlib.backends.backend_pdf import PdfPages
+    
+    with PdfPages(output_path) as pdf:
+        for shelf in sorted(grids):
+            axis, face = select_face(grids[shelf])
+            counts = face['counts']
+            extent = (face['start'], face['start'] + counts.shape[1] * CELL_SIZE, 0, counts.shape[0] * CELL_SIZE)
+
+            fig, ax = plt.subplots(figsize=(12, 6))
+            heatmap = ax.imshow(np.ma.masked_equal(counts, 0), origin='lower', extent=extent, cmap='inferno', aspect='equal', interpolation='nearest')
+            fig.colorbar(heatmap, ax=ax, shrink=0.8, label='Gaze density')
+            ax.set_xlabel(f'{axis.upper()} (m)')
+            ax.set_ylabel('Y (m)')
+            ax.set_title(f'Gaze density on {shelf}')
+            pdf.savefig(fig)
+            plt.close(fig)
+            lap(ax.get_title())
@@ -0,0 +1,268 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from csv_cache import read_csv_cached
+from distances import compute_movement_in_chunks
+from schemas import read_stream_csv
+from shelf_gaze import merge_shelf_grids, shelf_gaze_grids
+from visits import run_lengths
+from zones import classify_zones, first_teleport_frame, make_zone_bands, parse_was_tp
+
+# Rows per chunk. Peak memory depends on it, not on the length of the recording.
+CHUNK_SIZE = 50000
+
+HEAD_HANDS_FILE = "HeadHandsDataBigEnvironment.csv"
+EYE_TRACKING_FILE = "EyeTrackerData-AOIBigEnvironment.csv"
+TELEPORT_FILE = "TeleportDataBigEnvironment.csv"
+
+AOI_LABELS = ['Section/Shelf', 'Product/AOI']
+HAND_VELOCITY_COLUMNS = {'HandR': ['Velocity_HandR_x', 'Velocity_HandR_y', 'Velocity_HandR_z'],
+                         'HandL': ['Velocity_HandL_x', 'Velocity_HandL_y', 'Velocity_HandL_z']}
+
+def read_csv_in_chunks(csv_path, chunksize=CHUNK_SIZE):
+    """
+    Reads a session CSV file in chunks of consecutive rows, typed with the schema of its stream.
+
+    Parameters:
+    csv_path (str): The path of the CSV file.
+    chunksize (int): Number of rows per chunk.
+
+    Yields:
+    pandas.DataFrame: Each typed chunk.
+    """
+    yield from read_stream_csv(csv_path, chunksize=chunksize)
+
+def _time_deltas(timestamps, carry):
+    previous_timestamp = carry.get('timestamp')
+    first = timestamps[:1] if previous_timestamp is None else [previous_timestamp]
+    return np.diff(timestamps, prepend=first)
+
+def _add_moments(moments, name, values):
+    count, total, squares = moments.get(name, (0, 0.0, 0.0))
+    moments[name] = (count + len(values), total + values.sum(), squares + (values**2).sum())
+
+def _mean_std(count, total, squares):
+    if count == 0:
+        return np.nan, np.nan
+    mean = total / count
+    if count == 1:
+        return float(mean), np.nan
+    return float(mean), float(np.sqrt(max(squares - count * mean**2, 0) / (count - 1)))
+
+def _accumulate_by_label(state, labels, sums=None):
+    """
+    Adds the samples, visits and per row values of a chunk to the running totals by label of 'state'.
+    A visit that continues from the previous chunk is not counted again.
+    """
+    runs = run_lengths(labels)
+    if len(runs.codes) == 0:
+        return
+
+    n_labels = len(runs.labels)
+    row_codes = np.repeat(runs.codes, runs.ends - runs.starts + 1)
+    present = row_codes >= 0
+    run_codes = runs.codes[runs.codes >= 0]
+
+    columns = {'Samples': np.bincount(row_codes[present], minlength=n_labels).astype(float),
+               'Visits': np.bincount(run_codes, minlength=n_labels).astype(float)}
+    if runs.codes[0] >= 0 and state.get('last_label') == runs.labels[runs.codes[0]]:
+        columns['Visits'][runs.codes[0]] -= 1
+    for name, values in (sums or {}).items():
+        columns[name] = np.bincount(row_codes[present], weights=np.asarray(values, dtype=float)[present], minlength=n_labels)
+
+    totals = pd.DataFrame(columns, index=runs.labels)
+    state['totals'] = totals if state.get('totals') is None else state['totals'].add(totals, fill_value=0)
+    state['last_label'] = runs.labels[runs.codes[-1]] if runs.codes[-1] >= 0 else None
+
+def _label_totals(state, columns):
+    totals = state.get('totals')
+    if totals is None:
+        return pd.DataFrame(columns=columns)
+    totals = totals.copy()
+    totals[['Samples', 'Visits']] = totals[['Samples', 'Visits']].astype(int)
+    return totals
+
+def new_head_hands_state():
+    """
+    Creates the empty running state of the head and hands metrics.
+
+    Returns:
+    dict: The state updated by update_head_hands_metrics.
+    """
+    return {'frames': 0, 'first_timestamp': None, 'carry': {}, 'zones': {}, 'status': {}, 'distance': 0.0, 'hands': {}}
+
+def update_head_hands_metrics(state, chunk, teleport_frames=()):
+    """
+    Adds a chunk of segmented head and hands data, with the 'Zone' and 'Status' columns, to the running metrics,
+    and the horizontal 'Distance_Traveled' of each frame to the chunk. The last position, timestamp, zone and status are carried over to the next chunk, so that
+    the metrics do not depend on where the recording is split.
+
+    Parameters:
+    state (dict): The running state, created by new_head_hands_state.
+    chunk (pandas.DataFrame): The next consecutive rows of the recording.
+    teleport_frames (array-like): Frames of the successful teleports, excluded from the distance traveled.
+
+    Returns:
+    dict: The updated state.
+    """
+    if len(chunk) == 0:
+        return state
+
+    carry = state['carry']
+    timestamps = chunk['Timestamp'].to_numpy(dtype=float)
+    time_deltas = _time_deltas(timestamps, carry)
+
+    # Horizontal displacement and velocity, as the navigation report measures them
+    positions = chunk[['HMD_x', 'HMD_z']].to_numpy(dtype=float)
+    previous_position = positions[:1] if carry.get('position') is None else carry['position'].reshape(1, -1)
+    displacements = np.sqrt((np.diff(positions, axis=0, prepend=previous_position)**2).sum(axis=1))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        velocities = np.where(time_deltas != 0, displacements / time_deltas, 0.0)
+
+    is_teleport = chunk['Frame'].isin(teleport_frames).to_numpy()
+    state['distance'] += displacements[~is_teleport].sum()
+    chunk['Distance_Traveled'] = displacements
+
+    _accumulate_by_label(state['zones'], chunk['Zone'].astype(str),
+                         {'Time': time_deltas, 'Velocity_Sum': velocities, 'Velocity_Squares': velocities**2})
+    _accumulate_by_label(state['status'], chunk['Status'], {'Time': time_deltas})
+
+    for hand, columns in HAND_VELOCITY_COLUMNS.items():
+        magnitudes = np.sqrt((chunk[columns].to_numpy(dtype=float)**2).sum(axis=1))
+        _add_moments(state['hands'], hand, magnitudes)
+
+    if state['first_timestamp'] is None:
+        state['first_timestamp'] = timestamps[0]
+    state['frames'] += len(chunk)
+    state['carry'] = {'timestamp': timestamps[-1], 'position': positions[-1]}
+    return state
+
+def head_hands_metrics(state):
+    """
+    Computes the head and hands metrics from the running state.
+
+    Parameters:
+    state (dict): The running state updated by update_head_hands_metrics.
+
+    Returns:
+    dict: 'summary' (frames, duration, stops, moves, distance and hand velocities), 'zones' (samples, time, visits
+          and horizontal velocity by zone) and 'status' (samples, time and runs of 'Stop' and 'Move').
+    """
+    zones = _label_totals(state['zones'], ['Samples', 'Visits', 'Time', 'Velocity_Sum', 'Velocity_Squares'])
+    velocity = [_mean_std(count, total, squares) for count, total, squares
+                in zip(zones['Samples'], zones['Velocity_Sum'], zones['Velocity_Squares'])]
+    zones['Mean_Velocity'] = [mean for mean, _ in velocity]
+    zones['Std_Velocity'] = [std for _, std in velocity]
+    zones = zones.drop(columns=['Velocity_Sum', 'Velocity_Squares']).rename_axis('Zone')
+
+    status = _label_totals(state['status'], ['Samples', 'Visits', 'Time']).rename_axis('Status')
+    move_samples = status['Samples'].get('Move', 0)
+
+    summary = {
+        'Frames': state['frames'],
+        'Duration': float(state['carry']['timestamp'] - state['first_timestamp']) if state['frames'] else 0.0,
+        'Stop_Count': int(status['Visits'].get('Stop', 0)),
+        'Move_Count': int(status['Visits'].get('Move', 0)),
+        'Move_Percentage': float(move_samples / state['frames'] * 100) if state['frames'] else np.nan,
+        'Distance_Traveled': float(state['distance']),
+    }
+    for hand in HAND_VELOCITY_COLUMNS:
+        summary[f'Mean_Velocity_{hand}'], summary[f'Std_Velocity_{hand}'] = _mean_std(*state['hands'].get(hand, (0, 0.0, 0.0)))
+
+    return {'summary': summary, 'zones': zones, 'status': status}
+
+def new_eye_tracking_state():
+    """
+    Creates the empty running state of the eye-tracking metrics.
+
+    Returns:
+    dict: The state updated by update_eye_tracking_metrics.
+    """
+    return {'samples': 0, 'carry': {}, 'aois': {}}
+
+def update_eye_tracking_metrics(state, chunk):
+    """
+    Adds a chunk of eye-tracking data to the running samples, observation time and visits by shelf and AOI.
+
+    Parameters:
+    state (dict): The running state, created by new_eye_tracking_state.
+    chunk (pandas.DataFrame): The next consecutive rows of the eye-tracking stream.
+
+    Returns:
+    dict: The updated state.
+    """
+    if len(chunk) == 0:
+        return state
+
+    timestamps = chunk['Timestamp'].to_numpy(dtype=float)
+    _accumulate_by_label(state['aois'], chunk[AOI_LABELS], {'Observation_Time': _time_deltas(timestamps, state['carry'])})
+    state['samples'] += len(chunk)
+    state['carry'] = {'timestamp': timestamps[-1]}
+    return state
+
+def eye_tracking_metrics(state):
+    """
+    Computes the eye-tracking metrics from the running state.
+
+    Parameters:
+    state (dict): The running state updated by update_eye_tracking_metrics.
+
+    Returns:
+    pandas.DataFrame: Samples, observation time and visits by shelf and AOI.
+    """
+    return _label_totals(state['aois'], ['Samples', 'Visits', 'Observation_Time']).reset_index()
+
+def segment_chunks(chunks, teleport_data, bands=None):
+    """
+    Labels the zone of interest of every chunk of head and hands data.
+
+    Parameters:
+    chunks (iterable): Consecutive chunks of the head and hands data.
+    teleport_data (pandas.DataFrame): The teleport data, for the 'Start' zone.
+    bands (sequence, optional): Ordered (name, upper limit) pairs. Defaults to Shelf/Adjacent/Near/Far.
+
+    Yields:
+    pandas.DataFrame: Each chunk with a categorical 'Zone' column.
+    """
+    bands = bands or make_zone_bands()
+    first_tp_frame = first_teleport_frame(teleport_data)
+    for chunk in chunks:
+        chunk['Zone'] = classify_zones(chunk['Distance'], chunk['Frame'], first_tp_frame, bands)
+        yield chunk
+
+def stream_session_metrics(session_directory, chunksize=CHUNK_SIZE, movement_threshold=0.01, bands=None):
+    """
+    Computes the zone, movement, distance, velocity and visit metrics of a session reading the head and hands
+    and eye-tracking streams in chunks, so that peak memory is bounded by the chunk size instead of the
+    length of the recording. The small teleport file is read whole.
+
+    Parameters:
+    session_directory (str): The path of the session directory.
+    chunksize (int): Number of rows per chunk.
+    movement_threshold (float): Threshold distance to determine if movement occurred.
+    bands (sequence, optional): Ordered (name, upper limit) pairs. Defaults to Shelf/Adjacent/Near/Far.
+
+    Returns:
+    dict: The head and hands metrics of head_hands_metrics plus 'aois', the eye-tracking metrics, and 'shelf_gaze',
+          the gaze density grids of every shelf.
+    """
+    teleport_data = read_csv_cached(os.path.join(session_directory, TELEPORT_FILE))
+    teleport_frames = teleport_data.loc[parse_was_tp(teleport_data['WasTP']), 'Frame'].to_numpy()
+
+    head_hands_state = new_head_hands_state()
+    chunks = read_csv_in_chunks(os.path.join(session_directory, HEAD_HANDS_FILE), chunksize)
+    for chunk in compute_movement_in_chunks(segment_chunks(chunks, teleport_data, bands), movement_threshold):
+        update_head_hands_metrics(head_hands_state, chunk, teleport_frames)
+
+    eye_tracking_state = new_eye_tracking_state()
+    shelf_grids = {}
+    for chunk in read_csv_in_chunks(os.path.join(session_directory, EYE_TRACKING_FILE), chunksize):
+        update_eye_tracking_metrics(eye_tracking_state, chunk)
+        shelf_grids = merge_shelf_grids([shelf_grids, shelf_gaze_grids(chunk)])
+
+    metrics = head_hands_metrics(head_hands_state)
+    metrics['aois'] = eye_tracking_metrics(eye_tracking_state)
+    metrics['shelf_gaze'] = shelf_grids
+    return metrics
@@ -0,0 +1,339 @@
+import json
+import os
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from history import SESSION_PREFIX, SESSION_TIME_FORMAT
+from ProductInteraction_Analyzer import extract_interaction_episodes
+
+# Store layout of the synthetic sessions: shelf -> (section, x, z of the shelf front)
+SHELVES = {
+    "ShelfToys": ("Toys", 5.4, 7.0),
+    "ShelfFashion1": ("Fashion", 6.0, 4.2),
+    "ShelfFashion2": ("Fashion", 6.0, 1.8),
+    "ShelfDecoration1": ("Decoration", -5.6, 7.6),
+    "ShelfDecoration2": ("Decoration", -5.6, 4.8),
+    "ShelfTechnology": ("Technology", -5.6, 1.8),
+    "ShelfFood": ("Food", 2.0, 0.2),
+}
+PRODUCTS = {
+    "Toys": ["balon", "octopus_teddy", "baby_yoda", "Muneco_Pixar", "Dragon"],
+    "Fashion": ["Bolso", "Bolso_cuero", "Mochila"],
+    "Decoration": ["Vase_golden_low", "quemador", "trofeo"],
+    "Technology": ["cascos", "Microfono"],
+    "Food": ["Platano"],
+}
+AOI_HEIGHTS = {"Top": 1.75, "Mid": 1.25, "Bottom": 0.7}
+AOI_PROBABILITIES = (0.7, 0.2, 0.1)
+# Interactable states of the row where a selected product is released
+RELEASE_STATES = ["Hover", "Normal", "Disabled"]
+FAR_HOTSPOTS = [f"TP_Mid_{number}" for number in range(1, 9)]
+START_POSITION = (4.483, 9.55)
+HAND_COLUMNS = [f"{hand}_{axis}" for hand in ["HandR", "HandL"] for axis in ["x", "y", "z", "rot_x", "rot_y", "rot_z"]] + \
+               [f"Velocity_{hand}_{axis}" for hand in ["HandR", "HandL"] for axis in ["x", "y", "z"]]
+
+# Size of the session in sampleData/com.AIR.VRSI, the 1x scale of the benchmarks
+SAMPLE_DURATION = 207.0
+SAMPLE_RATE = 36.0
+
+EYE_TRACKING_COLUMNS = ["Frame", "Timestamp", "Product/AOI", "Section/Shelf",
+                        "EyeLeftPosition_x", "EyeLeftPosition_y", "EyeLeftPosition_z", "EyeLeftRotation_x", "EyeLeftRotation_y", "EyeLeftRotation_z",
+                        "EyeRightPosition_x", "EyeRightPosition_y", "EyeRightPosition_z", "EyeRightRotation_x", "EyeRightRotation_y", "EyeRightRotation_z",
+                        "HMD_x", "HMD_y", "HMD_z", "RCHit_x", "RCHit_y", "RCHit_z"]
+
+def write_session_csv(df, path):
+    """
+    Writes a DataFrame with the format of the Unity CSV writers: ', ' separators and 4 decimals.
+
+    Parameters:
+    df (pandas.DataFrame): The data to write.
+    path (str): The path of the CSV file.
+    """
+    text = df.to_csv(index=False, float_format='%.4f', lineterminator='\n')
+    with open(path, 'w') as file:
+        file.write(text.replace(',', ', '))
+
+def _write_vector_list(points, path):
+    with open(path, 'w') as file:
+        json.dump([{"X": x, "Y": y, "Z": z} for x, y, z in np.round(points, 6).tolist()], file)
+
+def _hotspot(shelf, rng):
+    section = SHELVES[shelf][0]
+    number = rng.integers(1, 4)
+    return f"TP_{section}{'' if number == 1 else number}_Adjacent"
+
+def _simulate_stays(duration, rng):
+    """
+    Splits the session in stays: the first one at the start position, then one per successful teleport.
+    """
+    starts = [0.0]
+    while True:
+        stay = max(3.0, rng.exponential(20.0)) if len(starts) > 1 else rng.uniform(10.0, 18.0)
+        if starts[-1] + stay >= duration:
+            break
+        starts.append(starts[-1] + stay)
+    starts = np.asarray(starts)
+
+    shelf_names = list(SHELVES)
+    shelves = [None] + [shelf_names[index] for index in rng.integers(0, len(shelf_names), len(starts) - 1)]
+    far = np.concatenate([[True], rng.random(len(starts) - 1) < 0.15])
+
+    x = np.empty(len(starts))
+    z = np.empty(len(starts))
+    x[0], z[0] = START_POSITION
+    for index in range(1, len(starts)):
+        _, shelf_x, shelf_z = SHELVES[shelves[index]]
+        # The player stands in front of the shelf, farther away for the Far hotspots
+        offset = rng.uniform(2.0, 4.0) if far[index] else rng.uniform(0.6, 1.0)
+        x[index] = shelf_x - np.sign(shelf_x) * offset
+        z[index] = shelf_z + rng.uniform(-0.5, 0.5)
+
+    return pd.DataFrame({'Start': starts, 'Shelf': shelves, 'Far': far, 'x': x, 'z': z})
+
+def generate_session(output_directory, duration=SAMPLE_DURATION, sample_rate=SAMPLE_RATE, seed=None, start_time=None):
+    """
+    Generates a synthetic session with the nine CSV files and the PLAYERS_JSONs of the Unity application:
+    teleports between shelves (and failed attempts), gaze on the AOIs and products of the shelf in front,
+    grabs with their releases and shopping cart actions.
+
+    Parameters:
+    output_directory (str): The session directory. It is created if it does not exist.
+    duration (float): Duration of the session in seconds.
+    sample_rate (float): Frames per second of the head and hands data.
+    seed (int, optional): Seed of the random generator, for reproducible sessions.
+    start_time (datetime, optional): Start time used to name the PLAYERS_JSONs files.
+
+    Returns:
+    dict: Number of rows by file name.
+    """
+    rng = np.random.default_rng(seed)
+    os.makedirs(os.path.join(output_directory, "PLAYERS_JSONs"), exist_ok=True)
+
+    # Frames
+    n_frames = max(int(duration * sample_rate), 2)
+    frames = np.arange(1, n_frames + 1)
+    timestamps = np.concatenate([[0.0], np.cumsum(rng.uniform(0.9, 1.1, n_frames - 1) / sample_rate)])
+    timestamps *= (duration / timestamps[-1])
+
+    # Stays and head position
+    stays = _simulate_stays(duration, rng)
+    stay = np.searchsorted(stays['Start'].to_numpy(), timestamps, side='right') - 1
+    stay_start = np.searchsorted(timestamps, stays['Start'].to_numpy())
+    walk = np.cumsum(rng.normal(0, 0.004, (n_frames, 2)), axis=0)
+    walk -= walk[stay_start[stay]]
+    hmd_x = stays['x'].to_numpy()[stay] + walk[:, 0]
+    hmd_z = stays['z'].to_numpy()[stay] + walk[:, 1]
+    hmd_y = np.where(timestamps < 1.0, 0.0, 1.7 + rng.normal(0, 0.01, n_frames))
+    heading = np.degrees(np.arctan2(-hmd_x, 1.0)) % 360
+
+    far = stays['Far'].to_numpy()[stay]
+    distance = np.where(far, rng.uniform(1.5, 4.4, len(stays))[stay], rng.uniform(0.1, 0.6, len(stays))[stay])
+    distance = np.clip(distance + np.abs(walk[:, 0]) + rng.normal(0, 0.02, n_frames), 0, None)
+    distance[stay == 0] = 0.0
+
+    hands = np.array([-0.33, 1.12, -0.6, -0.3, 0.85, -0.58])
+    hand_positions = hands + np.cumsum(rng.normal(0, 0.002, (n_frames, 6)), axis=0) * 0.1 + rng.normal(0, 0.01, (n_frames, 6))
+    hand_velocities = np.vstack([np.zeros((1, 6)), np.diff(hand_positions, axis=0) / np.diff(timestamps)[:, None]])
+    rotations = rng.uniform(0, 360, (n_frames, 9))
+
+    head_hands = pd.DataFrame({'Frame': frames, 'Timestamp': timestamps, 'HMD_x': hmd_x, 'HMD_y': hmd_y, 'HMD_z': hmd_z,
+                               'HMD_rot_x': rotations[:, 0], 'HMD_rot_y': heading, 'HMD_rot_z': rotations[:, 1]})
+    for hand_index, hand in enumerate(['HandR', 'HandL']):
+        for axis_index, axis in enumerate(['x', 'y', 'z']):
+            head_hands[f'{hand}_{axis}'] = hand_positions[:, hand_index * 3 + axis_index]
+        for axis_index, axis in enumerate(['x', 'y', 'z']):
+            head_hands[f'{hand}_rot_{axis}'] = rotations[:, 2 + hand_index * 3 + axis_index]
+    for hand_index, hand in enumerate(['HandR', 'HandL']):
+        for axis_index, axis in enumerate(['x', 'y', 'z']):
+            head_hands[f'Velocity_{hand}_{axis}'] = hand_velocities[:, hand_index * 3 + axis_index]
+    head_hands['Distance'] = distance
+
+    # Teleports: one successful teleport per stay and some failed attempts in between
+    teleport_rows = []
+    for index in range(1, len(stays)):
+        frame_index = stay_start[index]
+        shelf = stays.at[index, 'Shelf']
+        hotspot = FAR_HOTSPOTS[rng.integers(len(FAR_HOTSPOTS))] if stays.at[index, 'Far'] else _hotspot(shelf, rng)
+        moved = np.hypot(stays.at[index, 'x'] - stays.at[index - 1, 'x'], stays.at[index, 'z'] - stays.at[index - 1, 'z'])
+        teleport_rows.append((frame_index, hotspot, rng.uniform(0.1, 0.9), True, moved, 'Select'))
+        end_index = stay_start[index + 1] if index + 1 < len(stays) else n_frames
+        for attempt_index in np.sort(rng.integers(frame_index, end_index, rng.poisson(1.5))):
+            attempt_shelf = list(SHELVES)[rng.integers(len(SHELVES))]
+            teleport_rows.append((attempt_index, _hotspot(attempt_shelf, rng), rng.uniform(0.02, 0.4), False, 0.0, 'Hover'))
+    teleport_rows.sort(key=lambda row: row[0])
+    teleport_index = np.asarray([row[0] for row in teleport_rows], dtype=int)
+    teleports = pd.DataFrame({
+        'Frame': frames[teleport_index], 'Timestamp': timestamps[teleport_index],
+        'TPHotspot': [row[1] for row in teleport_rows],
+        'HMD_x': hmd_x[teleport_index], 'HMD_z': hmd_z[teleport_index],
+        'Duration': [row[2] for row in teleport_rows],
+        'WasTP': ['True' if row[3] else 'False' for row in teleport_rows],
+        'ZOI': ['Far' if row[1].startswith('TP_Mid') else 'Adjacent' for row in teleport_rows],
+        'Distance': [row[4] for row in teleport_rows],
+        'RightHand_State': [row[5] for row in teleport_rows],
+        'LeftHand_State': 'Disabled'})
+
+    # Gaze: segments of stable gaze on a point of an AOI, on the shelf in front or on a random one from far away
+    shelf_names = list(SHELVES)
+    # Fixations last 0.1-1 s, most of them around 0.3 s
+    gaze_starts = np.concatenate([[0.0], np.cumsum(np.clip(rng.gamma(4.0, 0.08, int(duration / 0.1) + 10), 0.1, 1.0))])
+    gaze_starts = gaze_starts[gaze_starts < duration]
+    segment = np.searchsorted(gaze_starts, timestamps, side='right') - 1
+    n_segments = len(gaze_starts)
+    segment_aoi = rng.choice(len(AOI_HEIGHTS), n_segments, p=AOI_PROBABILITIES)
+    random_shelf = rng.integers(0, len(shelf_names), n_segments)
+    stay_shelf = np.asarray([shelf_names.index(shelf) if shelf is not None else -1 for shelf in stays['Shelf']])
+    shelf_index = np.where(far | (stay == 0), random_shelf[segment], stay_shelf[stay])
+    shelf_x = np.asarray([SHELVES[name][1] for name in shelf_names])[shelf_index]
+    shelf_z = np.asarray([SHELVES[name][2] for name in shelf_names])[shelf_index]
+    aoi = np.asarray(list(AOI_HEIGHTS))[segment_aoi[segment]]
+    hit_x = shelf_x + rng.normal(0, 0.003, n_frames)
+    hit_y = np.asarray(list(AOI_HEIGHTS.values()))[segment_aoi[segment]] + rng.uniform(-0.2, 0.2, n_segments)[segment] + rng.normal(0, 0.003, n_frames)
+    hit_z = shelf_z + rng.uniform(-1.0, 1.0, n_segments)[segment] + rng.normal(0, 0.003, n_frames)
+    direction = np.stack([hit_x - hmd_x, hit_y - hmd_y, hit_z - hmd_z], axis=1)
+    direction /= np.linalg.norm(direction, axis=1, keepdims=True)
+
+    eye_tracking = pd.DataFrame({'Frame': frames, 'Timestamp': timestamps,
+                                 'Product/AOI': aoi, 'Section/Shelf': np.asarray(shelf_names)[shelf_index]})
+    for eye, offset in [('EyeLeft', 0.03), ('EyeRight', -0.1)]:
+        eye_tracking[f'{eye}Position_x'] = hmd_x + offset
+        eye_tracking[f'{eye}Position_y'] = hmd_y + 0.005
+        eye_tracking[f'{eye}Position_z'] = hmd_z - 0.01
+        for axis_index, axis in enumerate(['x', 'y', 'z']):
+            eye_tracking[f'{eye}Rotation_{axis}'] = direction[:, axis_index]
+    for axis, values in [('x', hmd_x), ('y', hmd_y), ('z', hmd_z)]:
+        eye_tracking[f'HMD_{axis}'] = values
+    for axis, values in [('x', hit_x), ('y', hit_y), ('z', hit_z)]:
+        eye_tracking[f'RCHit_{axis}'] = values
+    eye_tracking = eye_tracking[EYE_TRACKING_COLUMNS]
+
+    # The AOI stream starts once the eye tracker is calibrated and misses the frames looking elsewhere
+    looking = (timestamps >= 3.0) & (rng.random(n_segments) > 0.03)[segment]
+    eye_tracking_aoi = eye_tracking[looking]
+
+    # Products are only hit by some of the gaze segments
+    on_product = looking & (rng.random(n_segments) < 0.35)[segment]
+    sections = np.asarray([SHELVES[name][0] for name in shelf_names])[shelf_index]
+    product_choice = rng.integers(0, 1 << 30, n_segments)[segment]
+    products = np.asarray([PRODUCTS[section][choice % len(PRODUCTS[section])] for section, choice in zip(sections[on_product], product_choice[on_product])], dtype=object)
+    eye_tracking_products = eye_tracking[on_product].copy()
+    eye_tracking_products['Product/AOI'] = products
+    eye_tracking_products['Section/Shelf'] = sections[on_product]
+
+    # Grabs near the shelves, with their releases and the shopping cart actions
+    interaction_parts, release_rows, shelf_parts, cart_rows = [], [], [], []
+    stay_ends = np.append(stays['Start'].to_numpy()[1:], duration)
+    for index in range(1, len(stays)):
+        if stays.at[index, 'Far']:
+            continue
+        shelf = stays.at[index, 'Shelf']
+        section, shelf_x0, shelf_z0 = SHELVES[shelf]
+        slots = rng.poisson((stay_ends[index] - stays.at[index, 'Start']) / 25.0)
+        slot_length = (stay_ends[index] - stays.at[index, 'Start']) / max(slots, 1)
+        for slot in range(slots):
+            grab_start = stays.at[index, 'Start'] + slot * slot_length + rng.uniform(0.1, 0.3) * slot_length
+            grab_end = min(grab_start + rng.uniform(1.0, 6.0), stays.at[index, 'Start'] + (slot + 1) * slot_length)
+            rows = np.flatnonzero((timestamps >= grab_start) & (timestamps <= grab_end))[::2]
+            if len(rows) < 2:
+                continue
+            mirror = rng.random() < 0.15
+            product = PRODUCTS[section][rng.integers(len(PRODUCTS[section]))]
+            right_hand = rng.random() < 0.85
+            # As in the recordings, the product is selected until the last row, where it is released
+            select_state = np.full(len(rows), 'Select', dtype=object)
+            select_state[-1] = rng.choice(RELEASE_STATES, p=(0.55, 0.35, 0.1))
+            if not mirror:
+                path = np.cumsum(rng.normal(0, 0.005, (len(rows), 3)), axis=0)
+                interaction_parts.append(pd.DataFrame({
+                    'Frame': frames[rows].astype(float), 'Timestamp': timestamps[rows], 'Object': product, 'Section': section,
+                    'State': select_state,
+                    'Position_x': shelf_x0 - np.sign(shelf_x0) * 0.3 + path[:, 0], 'Position_y': 1.4 + path[:, 1], 'Position_z': shelf_z0 + path[:, 2],
+                    'Rotation_x': rng.uniform(0, 360, len(rows)), 'Rotation_y': rng.uniform(0, 360, len(rows)), 'Rotation_z': rng.uniform(0, 360, len(rows)),
+                    'Scale_x': 0.1823, 'Scale_y': 0.1823, 'Scale_z': 0.1823,
+                    'RightHand_State': np.where(right_hand, select_state, 'Normal'),
+                    'LeftHand_State': np.where(right_hand, 'Normal', select_state)}))
+            release_index = rows[-1]
+            release_rows.append((frames[release_index], timestamps[release_index], 'HandGrabInteractable_mirror' if mirror else product,
+                                 timestamps[rows[-1]] - timestamps[rows[0]], 'Hover' if right_hand else 'Normal', 'Normal' if right_hand else 'Hover'))
+            shelf_rows = np.flatnonzero((timestamps >= grab_start) & (timestamps <= grab_end))
+            hands_in_shelf = head_hands.iloc[shelf_rows][HAND_COLUMNS].reset_index(drop=True)
+            hands_in_shelf.insert(0, 'AOI', rng.choice(list(AOI_HEIGHTS), len(shelf_rows), p=(0.5, 0.2, 0.3)))
+            hands_in_shelf.insert(0, 'Shelf', f"{shelf} (UnityEngine.Transform)")
+            hands_in_shelf.insert(0, 'Timestamp', timestamps[shelf_rows])
+            hands_in_shelf.insert(0, 'Frame', frames[shelf_rows])
+            shelf_parts.append(hands_in_shelf)
+
+            # Some grabbed products are added to the cart and some of them removed later
+            if not mirror and rng.random() < 0.4:
+                add_time = grab_end + rng.uniform(1.0, 5.0)
+                cart_rows.append((add_time, product, 'ADD'))
+                if rng.random() < 0.3:
+                    cart_rows.append((add_time + rng.uniform(5.0, 60.0), product, 'REMOVE'))
+
+    interaction_columns = ['Frame', 'Timestamp', 'Object', 'Section', 'State', 'Position_x', 'Position_y', 'Position_z',
+                           'Rotation_x', 'Rotation_y', 'Rotation_z', 'Scale_x', 'Scale_y', 'Scale_z', 'RightHand_State', 'LeftHand_State']
+    interactions = pd.concat(interaction_parts, ignore_index=True) if interaction_parts else pd.DataFrame(columns=interaction_columns)
+    # Every grab must be an interaction of the product interaction report
+    n_episodes = len(extract_interaction_episodes(interactions))
+    if n_episodes != len(interaction_parts):
+        raise ValueError(f"The {len(interaction_parts)} synthetic grabs yield {n_episodes} interactions")
+    releases = pd.DataFrame(release_rows, columns=['Frame', 'Timestamp', 'Object', 'DurationUntilRelease', 'RightHand_State', 'LeftHand_State'])
+    shelves_columns = ['Frame', 'Timestamp', 'Shelf', 'AOI'] + HAND_COLUMNS
+    shelves_data = pd.concat(shelf_parts, ignore_index=True) if shelf_parts else pd.DataFrame(columns=shelves_columns)
+
+    cart_rows.sort()
+    cart_times = np.asarray([row[0] for row in cart_rows], dtype=float)
+    cart = pd.DataFrame({'Frame': np.minimum(np.searchsorted(timestamps, cart_times), n_frames - 1) + 1, 'Timestamp': cart_times,
+                         'Item': [row[1] for row in cart_rows], 'Action': [row[2] for row in cart_rows]})
+
+    turning_index = np.sort(rng.integers(0, n_frames, rng.poisson(duration / 60.0)))
+    turnings = pd.DataFrame({'Frame': frames[turning_index], 'Timestamp': timestamps[turning_index],
+                             'RightHand_State': 'Select', 'LeftHand_State': 'Disabled'})
+
+    files = {
+        "EyeTrackerData-AOIBigEnvironment.csv": eye_tracking_aoi,
+        "EyeTrackerData-ProductsBigEnvironment.csv": eye_tracking_products,
+        "HeadHandsDataBigEnvironment.csv": head_hands,
+        "ProductInteractionDataBigEnvironment.csv": interactions,
+        "ProductReleasesBigEnvironment.csv": releases,
+        "ShelvesDataBigEnvironment.csv": shelves_data,
+        "ShoppingCartDataBigEnvironment.csv": cart,
+        "TeleportDataBigEnvironment.csv": teleports,
+        "TurningsBigEnvironment.csv": turnings,
+    }
+    for file_name, df in files.items():
+        write_session_csv(df, os.path.join(output_directory, file_name))
+
+    # PLAYERS_JSONs: head positions and gaze hit points, as serialized by the Unity managers
+    suffix = (start_time or datetime.now()).strftime("%Y-%m-%d-%H-%M-%S")
+    _write_vector_list(np.column_stack([hmd_x, hmd_y, hmd_z]), os.path.join(output_directory, "PLAYERS_JSONs", f"PositionPlayerData{suffix}.json"))
+    _write_vector_list(eye_tracking_aoi[['RCHit_x', 'RCHit_y', 'RCHit_z']].to_numpy(), os.path.join(output_directory, "PLAYERS_JSONs", f"ETPlayerData{suffix}.json"))
+
+    return {file_name: len(df) for file_name, df in files.items()}
+
+def generate_user_history(user_directory, sessions=3, duration=SAMPLE_DURATION, sample_rate=SAMPLE_RATE, seed=None, first_start=None):
+    """
+    Generates several synthetic sessions of a user, named as the Unity DirectoryManager does.
+
+    Parameters:
+    user_directory (str): The user directory where the session directories are created.
+    sessions (int): Number of sessions.
+    duration (float): Duration of each session in seconds.
+    sample_rate (float): Frames per second of the head and hands data.
+    seed (int, optional): Seed of the random generator, each session gets a different one derived from it.
+    first_start (datetime, optional): Start time of the first session. The next ones start one day later each.
+
+    Returns:
+    list: Paths of the session directories.
+    """
+    first_start = first_start or datetime(2024, 6, 11, 12, 0, 0)
+    seeds = np.random.SeedSequence(seed).spawn(sessions)
+    paths = []
+    for index in range(sessions):
+        start_time = first_start + timedelta(days=index)
+        path = os.path.join(user_directory, SESSION_PREFIX + start_time.strftime(SESSION_TIME_FORMAT))
+        generate_session(path, duration, sample_rate, seed=np.random.default_rng(seeds[index]).integers(1 << 31), start_time=start_time)
+        paths.append(path)
+    return paths
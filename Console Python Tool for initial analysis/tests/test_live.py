@@ -0,0 +1,40 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+from vr_idt.vr_idt import classify_fixations
+
+from Eye_Tracking_Analyzer import extract_fixation_events
+from fixations import COL_NAME_MAP, FIXATION_COLUMNS
+from live import flush_fixations, new_fixations_state, update_fixations
+from schemas import read_stream_csv
+
+SAMPLE_EYE_TRACKING = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "sample_data", "EyeTrackerData-AOIBigEnvironment.csv")
+PARAMETERS = (0.15, 1.5, 30)
+
+@pytest.fixture(scope="module")
+def eye_tracking():
+    return read_stream_csv(SAMPLE_EYE_TRACKING)
+
+@pytest.fixture(scope="module")
+def batch_events(eye_tracking):
+    fixation_df = classify_fixations(eye_tracking[list(COL_NAME_MAP.values())], *PARAMETERS, **COL_NAME_MAP)
+    return extract_fixation_events(eye_tracking.join(fixation_df[FIXATION_COLUMNS]))
+
+@pytest.mark.parametrize("chunk_rows", [1, 5, 17, 100])
+def test_chunked_fixations_equal_batch(eye_tracking, batch_events, chunk_rows):
+    state = new_fixations_state()
+    events = [update_fixations(state, eye_tracking.iloc[start:start + chunk_rows], *PARAMETERS)
+              for start in range(0, len(eye_tracking), chunk_rows)]
+    events.append(flush_fixations(state, *PARAMETERS))
+    events = pd.concat([chunk_events for chunk_events in events if chunk_events is not None], ignore_index=True)
+
+    assert len(events) == len(batch_events)
+    exact = ['Start_Frame', 'End_Frame', 'Start_Time', 'End_Time', 'fixation_duration']
+    assert (events[exact].to_numpy() == batch_events[exact].to_numpy()).all()
+    for column in ['Section/Shelf', 'Product/AOI']:
+        assert events[column].astype(str).tolist() == batch_events[column].astype(str).tolist()
+    # The centroids are cumulative sums over fewer rows, equal up to rounding
+    centroids = [f'Centroid_{axis}' for axis in ['x', 'y', 'z']]
+    assert np.allclose(events[centroids].to_numpy(dtype=float), batch_events[centroids].to_numpy(dtype=float))
@@ -0,0 +1,163 @@
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+# Run-length encoding of a label column: every run (visit) is a block of consecutive rows with the same label.
+# starts/ends: positional index of the first and last row of each run (inclusive).
+# codes: label code of each run, -1 for missing labels. labels: the label of each code.
+# durations: time between the first and the last row of each run.
+# dwell: sum of the time deltas of the rows of each run, including the delta from the previous run,
+#        as df['Timestamp'].diff().fillna(0) summed per visit does.
+Runs = namedtuple('Runs', ['starts', 'ends', 'codes', 'labels', 'durations', 'dwell'])
+
+def factorize_labels(labels):
+    """
+    Encodes a label column (or several, as a combined key) as integer codes.
+
+    Parameters:
+    labels (pandas.Series or pandas.DataFrame): The label column, or the columns that make up the label.
+
+    Returns:
+    tuple: The code of each row (-1 for missing labels) and the labels as a pandas Index (a MultiIndex for several columns).
+    """
+    if isinstance(labels, pd.Series):
+        codes, uniques = pd.factorize(labels, sort=True)
+        # Plain labels, a categorical index would bring back the categories never observed
+        return codes, pd.Index(np.asarray(uniques), name=labels.name)
+
+    factorized = [pd.factorize(labels[column], sort=True) for column in labels.columns]
+    combined = np.zeros(len(labels), dtype=np.int64)
+    missing = np.zeros(len(labels), dtype=bool)
+    for column_codes, column_uniques in factorized:
+        combined = combined * len(column_uniques) + column_codes
+        missing |= column_codes < 0
+    combined = np.where(missing, -1, combined)
+
+    present = np.unique(combined[~missing])
+    codes = np.full(len(labels), -1, dtype=np.int64)
+    codes[~missing] = np.searchsorted(present, combined[~missing])
+
+    # Decompose the combined codes back into the code of each column
+    arrays = []
+    remainder = present
+    for column_codes, column_uniques in reversed(factorized):
+        arrays.append(np.asarray(column_uniques)[remainder % len(column_uniques)])
+        remainder = remainder // len(column_uniques)
+    return codes, pd.MultiIndex.from_arrays(arrays[::-1], names=list(labels.columns))
+
+def run_lengths(labels, times=None):
+    """
+    Splits a label column into runs of consecutive rows with the same label (visits).
+
+    Parameters:
+    labels (pandas.Series or pandas.DataFrame): The label column, or the columns that make up the label.
+    times (array-like, optional): Timestamp of each row. If not given, durations are measured in rows.
+
+    Returns:
+    Runs: The run-length encoding of the labels.
+    """
+    row_codes, uniques = factorize_labels(labels)
+    return runs_from_codes(row_codes, uniques, times)
+
+def runs_from_codes(row_codes, uniques, times=None):
+    """
+    Splits a label column that is already encoded as integer codes into runs of consecutive rows with the same code.
+
+    Parameters:
+    row_codes (numpy.ndarray): The code of each row, -1 for missing labels.
+    uniques (pandas.Index): The label of each code.
+    times (array-like, optional): Timestamp of each row. If not given, durations are measured in rows.
+
+    Returns:
+    Runs: The run-length encoding of the labels.
+    """
+    n_rows = len(row_codes)
+
+    if n_rows == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return Runs(empty, empty, empty, uniques, np.zeros(0), np.zeros(0))
+
+    starts = np.flatnonzero(np.diff(row_codes, prepend=row_codes[0] - 1) != 0)
+    ends = np.append(starts[1:] - 1, n_rows - 1)
+
+    if times is None:
+        times = np.arange(n_rows, dtype=float)
+        durations = (ends - starts + 1).astype(float)
+    else:
+        times = np.asarray(times, dtype=float)
+        durations = times[ends] - times[starts]
+    dwell = times[ends] - times[np.maximum(starts - 1, 0)]
+
+    return Runs(starts, ends, row_codes[starts], uniques, durations, dwell)
+
+def _per_label(runs, weights=None):
+    present = runs.codes >= 0
+    return np.bincount(runs.codes[present], weights=None if weights is None else weights[present], minlength=len(runs.labels))
+
+def count_runs(runs):
+    """
+    Counts the runs (visits) of each label.
+
+    Parameters:
+    runs (Runs): The run-length encoding of a label column.
+
+    Returns:
+    pandas.Series: Number of runs by label, only for the labels with at least one run.
+    """
+    counts = pd.Series(_per_label(runs), index=runs.labels, name='Count')
+    return counts[counts > 0]
+
+def total_per_label(runs, values='dwell'):
+    """
+    Sums a run measure ('dwell' or 'durations') by label.
+
+    Parameters:
+    runs (Runs): The run-length encoding of a label column.
+    values (str): The measure to sum.
+
+    Returns:
+    pandas.Series: Total by label, only for the labels with at least one run.
+    """
+    counts = _per_label(runs)
+    totals = pd.Series(_per_label(runs, getattr(runs, values)), index=runs.labels, name='Total')
+    return totals[counts > 0]
+
+def mean_per_label(runs, values='durations'):
+    """
+    Averages a run measure ('dwell' or 'durations') by label.
+
+    Parameters:
+    runs (Runs): The run-length encoding of a label column.
+    values (str): The measure to average.
+
+    Returns:
+    pandas.Series: Mean by label, only for the labels with at least one run.
+    """
+    counts = _per_label(runs)
+    present = counts > 0
+    means = _per_label(runs, getattr(runs, values))[present] / counts[present]
+    return pd.Series(means, index=runs.labels[present], name='Mean')
+
+def summarize_runs(runs, values='durations', percentiles=(50, 90)):
+    """
+    Aggregates the runs by label: count, total, mean and percentiles of a run measure.
+
+    Parameters:
+    runs (Runs): The run-length encoding of a label column.
+    values (str): The measure to aggregate ('dwell' or 'durations').
+    percentiles (sequence): Percentiles to compute.
+
+    Returns:
+    pandas.DataFrame: One row per label with 'Count', 'Total', 'Mean' and 'P<percentile>' columns.
+    """
+    summary = pd.concat([count_runs(runs), total_per_label(runs, values), mean_per_label(runs, values)], axis=1)
+
+    present = runs.codes >= 0
+    measures = pd.Series(getattr(runs, values)[present])
+    grouped = measures.groupby(runs.codes[present])
+    for percentile in percentiles:
+        quantiles = grouped.quantile(percentile / 100)
+        summary[f'P{percentile}'] = quantiles.to_numpy()
+
+    return summary
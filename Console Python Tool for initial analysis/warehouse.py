@@ -0,0 +1,327 @@
+import glob
+import os
+import sqlite3
+from datetime import datetime
+
+import pandas as pd
+
+# Increase it whenever the schema changes, a warehouse with another version is not opened
+SCHEMA_VERSION = 1
+
+# One row per session, and its per zone, per product and per AOI tables. The child tables are clustered by session
+# (primary key), the indexes serve the per-user, per-layout, per-product and per-AOI queries across sessions.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id INTEGER PRIMARY KEY,
+    user TEXT NOT NULL,
+    session TEXT NOT NULL,
+    session_start TEXT,
+    layout TEXT,
+    key TEXT,
+    stored_at TEXT NOT NULL,
+    duration REAL,
+    stop_count INTEGER,
+    move_count INTEGER,
+    move_percentage REAL,
+    teleports INTEGER,
+    teleport_attempts INTEGER,
+    attempts_per_success REAL,
+    failed_aim_time REAL,
+    interactions INTEGER,
+    cart_additions INTEGER,
+    cart_removals INTEGER,
+    UNIQUE (user, session)
+);
+CREATE INDEX IF NOT EXISTS sessions_by_user ON sessions (user, session_start);
+CREATE INDEX IF NOT EXISTS sessions_by_layout ON sessions (layout, session_start);
+
+CREATE TABLE IF NOT EXISTS zones (
+    session_id INTEGER NOT NULL REFERENCES sessions ON DELETE CASCADE,
+    zone TEXT NOT NULL,
+    time REAL,
+    visits INTEGER,
+    PRIMARY KEY (session_id, zone)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS zones_by_zone ON zones (zone, session_id);
+
+CREATE TABLE IF NOT EXISTS products (
+    session_id INTEGER NOT NULL REFERENCES sessions ON DELETE CASCADE,
+    product TEXT NOT NULL,
+    interactions INTEGER,
+    cart_additions INTEGER,
+    cart_removals INTEGER,
+    PRIMARY KEY (session_id, product)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS products_by_product ON products (product, session_id);
+
+CREATE TABLE IF NOT EXISTS aois (
+    session_id INTEGER NOT NULL REFERENCES sessions ON DELETE CASCADE,
+    section TEXT NOT NULL,
+    aoi TEXT NOT NULL,
+    samples INTEGER,
+    observation_time REAL,
+    fixations INTEGER,
+    fixation_time REAL,
+    PRIMARY KEY (session_id, section, aoi)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS aois_by_aoi ON aois (aoi, section, session_id);
+"""
+
+# Columns of the metric tables of history.session_metric_tables stored in each warehouse table.
+# Columns missing from a table (e.g. the fixations when they were not computed) keep the values stored before, or are NULL.
+SESSION_COLUMNS = {
+    'Duration': 'duration', 'Stop_Count': 'stop_count', 'Move_Count': 'move_count', 'Move_Percentage': 'move_percentage',
+    'Teleports': 'teleports', 'Teleport_Attempts': 'teleport_attempts', 'Attempts_per_Success': 'attempts_per_success',
+    'Failed_Aim_Time': 'failed_aim_time', 'Interactions': 'interactions', 'Cart_Additions': 'cart_additions',
+    'Cart_Removals': 'cart_removals',
+}
+TABLE_COLUMNS = {
+    'zones': {'Zone': 'zone', 'Time': 'time', 'Visits': 'visits'},
+    'products': {'Product': 'product', 'Interactions': 'interactions', 'ADD': 'cart_additions', 'REMOVE': 'cart_removals'},
+    'aois': {'Section/Shelf': 'section', 'Product/AOI': 'aoi', 'Samples': 'samples', 'Observation_Time': 'observation_time',
+             'Fixations': 'fixations', 'Fixation_Time': 'fixation_time'},
+}
+
+# Keys and metrics of each table for the cohort aggregates
+COHORT_TABLES = {
+    'sessions': ([], list(SESSION_COLUMNS.values())),
+    'zones': (['zone'], ['time', 'visits']),
+    'products': (['product'], ['interactions', 'cart_additions', 'cart_removals']),
+    'aois': (['section', 'aoi'], ['samples', 'observation_time', 'fixations', 'fixation_time']),
+}
+SESSION_KEYS = ['user', 'layout']
+
+# Files of a session are named <stream><layout>.csv, e.g. HeadHandsDataBigEnvironment.csv
+LAYOUT_FILE_PREFIX = "HeadHandsData"
+
+def open_warehouse(path):
+    """
+    Opens the metrics warehouse, an SQLite database, creating it if it does not exist. Several processes can write
+    to it at the same time, each write waits for the previous one.
+
+    Parameters:
+    path (str): The path of the database file.
+
+    Returns:
+    sqlite3.Connection: The connection. Close it when done.
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    connection = sqlite3.connect(path, timeout=60)
+    try:
+        version = connection.execute("PRAGMA user_version").fetchone()[0]
+        if version not in (0, SCHEMA_VERSION):
+            raise ValueError(f"{path} has schema version {version}, expected {SCHEMA_VERSION}.")
+        connection.execute("PRAGMA foreign_keys = ON")
+        connection.execute("PRAGMA journal_mode = WAL")
+        with connection:
+            connection.executescript(SCHEMA)
+            connection.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    except Exception:
+        connection.close()
+        raise
+    return connection
+
+def session_layout(session_directory):
+    """
+    Returns the store layout of a session, the environment suffix of its CSV files (e.g. 'BigEnvironment').
+
+    Parameters:
+    session_directory (str): The path of the session directory.
+
+    Returns:
+    str: The layout, or None if the session has no head and hands file.
+    """
+    paths = glob.glob(os.path.join(glob.escape(session_directory), LAYOUT_FILE_PREFIX + "*.csv"))
+    names = sorted(os.path.basename(path)[len(LAYOUT_FILE_PREFIX):-len(".csv")] for path in paths)
+    return names[0] if names and names[0] else None
+
+def _value(value):
+    if value is None or (isinstance(value, float) and value != value):
+        return None
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+def _rows(table, columns):
+    # Series.tolist converts the numpy scalars to Python values, which sqlite3 can bind
+    values = [table[column].tolist() if column in table else [None] * len(table) for column in columns]
+    return [tuple(_value(value) for value in row) for row in zip(*values)]
+
+def stored_key(connection, user, session):
+    """
+    Returns the key a session was stored with.
+
+    Parameters:
+    connection (sqlite3.Connection): The warehouse.
+    user (str): The user.
+    session (str): The session name.
+
+    Returns:
+    str: The key, or None if the session is not stored or was stored without a key.
+    """
+    row = connection.execute("SELECT key FROM sessions WHERE user = ? AND session = ?", (user, session)).fetchone()
+    return row[0] if row else None
+
+def _stored_rows(connection, table_name, session_id, keys, columns):
+    # Values of some columns of the rows stored for a session, by the values of their keys
+    rows = connection.execute(f"SELECT {', '.join(keys + columns)} FROM {table_name} WHERE session_id = ?", (session_id,)).fetchall()
+    return {row[:len(keys)]: row[len(keys):] for row in rows}
+
+def store_session(connection, user, session, tables, session_start=None, layout=None, key=None):
+    """
+    Stores the metric tables of a session in the warehouse, in a single transaction. A session already stored
+    (same user and session name) is replaced, so storing a session again never duplicates its rows.
+    The metrics missing from the tables (e.g. the fixations, which the history analysis does not compute) keep the
+    values stored before for the same session, zone, product or AOI, and then the session also keeps its key if none is given.
+
+    Parameters:
+    connection (sqlite3.Connection): The warehouse.
+    user (str): The user.
+    session (str): The session name, e.g. SESSION_2024-06-11_12-35-58.
+    tables (dict): The tables returned by history.session_metric_tables.
+    session_start (datetime, optional): The start time of the session.
+    layout (str, optional): The store layout of the session.
+    key (str, optional): A digest of the inputs and parameters the tables were computed from.
+
+    Returns:
+    int: The id of the session in the warehouse.
+    """
+    summary = tables['sessions'].iloc[:1]
+    with connection:
+        cursor = connection.execute("SELECT * FROM sessions WHERE user = ? AND session = ?", (user, session))
+        stored = cursor.fetchone()
+        stored = dict(zip([column[0] for column in cursor.description], stored)) if stored else None
+        kept = {}
+        if stored is not None:
+            for table_name, table_columns in TABLE_COLUMNS.items():
+                table = tables.get(table_name)
+                missing = [column for name, column in table_columns.items() if table is not None and name not in table]
+                if missing:
+                    keys = COHORT_TABLES[table_name][0]
+                    kept[table_name] = (missing, _stored_rows(connection, table_name, stored['session_id'], keys, missing))
+            if key is None and (kept or any(name not in summary for name in SESSION_COLUMNS)):
+                key = stored['key']
+        connection.execute("DELETE FROM sessions WHERE user = ? AND session = ?", (user, session))
+
+        columns = ['user', 'session', 'session_start', 'layout', 'key', 'stored_at'] + list(SESSION_COLUMNS.values())
+        metrics = _rows(summary, list(SESSION_COLUMNS))[0]
+        if stored is not None:
+            metrics = tuple(stored[column] if name not in summary else value for (name, column), value in zip(SESSION_COLUMNS.items(), metrics))
+        values = (user, session, _value(session_start), layout, key, datetime.now().isoformat(timespec='seconds')) + metrics
+        session_id = connection.execute(f"INSERT INTO sessions ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})", values).lastrowid
+
+        for table_name, table_columns in TABLE_COLUMNS.items():
+            table = tables.get(table_name)
+            if table is None or table.empty:
+                continue
+            columns = ['session_id'] + list(table_columns.values())
+            rows = _rows(table, list(table_columns))
+            if table_name in kept:
+                missing, stored_rows = kept[table_name]
+                key_positions = [columns.index(column) - 1 for column in COHORT_TABLES[table_name][0]]
+                positions = [columns.index(column) - 1 for column in missing]
+                rows = [_fill(row, positions, stored_rows.get(tuple(row[position] for position in key_positions))) for row in rows]
+            connection.executemany(f"INSERT INTO {table_name} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                                   [(session_id,) + row for row in rows])
+    return session_id
+
+def _fill(row, positions, values):
+    if values is None:
+        return row
+    row = list(row)
+    for position, value in zip(positions, values):
+        row[position] = value
+    return tuple(row)
+
+def _session_filters(users=None, layouts=None, start=None, end=None):
+    conditions, parameters = [], []
+    for column, values in [('user', users), ('layout', layouts)]:
+        if values is not None:
+            values = [values] if isinstance(values, str) else list(values)
+            conditions.append(f"s.{column} IN ({', '.join('?' * len(values))})")
+            parameters.extend(values)
+    if start is not None:
+        conditions.append("s.session_start >= ?")
+        parameters.append(_value(start))
+    if end is not None:
+        conditions.append("s.session_start < ?")
+        parameters.append(_value(end))
+    return (" WHERE " + " AND ".join(conditions)) if conditions else "", parameters
+
+def query(connection, sql, parameters=()):
+    """
+    Runs an SQL query on the warehouse.
+
+    Parameters:
+    connection (sqlite3.Connection): The warehouse.
+    sql (str): The query, with ? placeholders.
+    parameters (sequence): The values of the placeholders.
+
+    Returns:
+    pandas.DataFrame: The result.
+    """
+    return pd.read_sql_query(sql, connection, params=list(parameters))
+
+def session_table(connection, users=None, layouts=None, start=None, end=None):
+    """
+    Lists the stored sessions with their summary metrics, in chronological order.
+
+    Parameters:
+    connection (sqlite3.Connection): The warehouse.
+    users (str or list, optional): Only the sessions of these users.
+    layouts (str or list, optional): Only the sessions in these store layouts.
+    start (datetime, optional): Only the sessions started at or after this time.
+    end (datetime, optional): Only the sessions started before this time.
+
+    Returns:
+    pandas.DataFrame: One row per session.
+    """
+    where, parameters = _session_filters(users, layouts, start, end)
+    return query(connection, f"SELECT s.* FROM sessions s{where} ORDER BY s.session_start, s.user, s.session", parameters)
+
+def cohort_aggregates(connection, table, by=None, users=None, layouts=None, start=None, end=None):
+    """
+    Aggregates a metric table over a cohort of sessions: for every group, the number of sessions, and the total
+    and the mean per session of every metric. The mean is over the sessions where the group appears (e.g. the
+    sessions where the product was interacted with) and the metric was computed. The products also get their cart 'conversion', additions
+    per interaction.
+
+    Parameters:
+    connection (sqlite3.Connection): The warehouse.
+    table (str): 'sessions', 'zones', 'products' or 'aois'.
+    by (list, optional): Columns to group by: the keys of the table ('zone', 'product', 'section', 'aoi') and
+                         'user' or 'layout'. Defaults to the keys of the table, or 'user' for the sessions.
+    users (str or list, optional): Only the sessions of these users.
+    layouts (str or list, optional): Only the sessions in these store layouts.
+    start (datetime, optional): Only the sessions started at or after this time.
+    end (datetime, optional): Only the sessions started before this time.
+
+    Returns:
+    pandas.DataFrame: One row per group, with 'sessions', '<metric>_total' and '<metric>_mean' columns.
+    """
+    if table not in COHORT_TABLES:
+        raise ValueError(f"Unknown table '{table}', expected one of {list(COHORT_TABLES)}.")
+    keys, metrics = COHORT_TABLES[table]
+    by = list(by) if by is not None else (keys or ['user'])
+    unknown = set(by) - set(keys) - set(SESSION_KEYS)
+    if unknown:
+        raise ValueError(f"Cannot group the {table} by {sorted(unknown)}, expected some of {keys + SESSION_KEYS}.")
+
+    # Every column name comes from COHORT_TABLES or SESSION_KEYS, the values are bound
+    prefix = 's' if table == 'sessions' else 't'
+    groups = [f"s.{column}" if column in SESSION_KEYS else f"t.{column}" for column in by]
+    selected = groups + ["COUNT(DISTINCT s.session_id) AS sessions"]
+    for metric in metrics:
+        # The sessions where a metric was not computed (NULL, e.g. the fixations) do not count in its mean, and a group
+        # may have several rows per session (e.g. the AOIs by user)
+        selected += [f"SUM({prefix}.{metric}) AS {metric}_total",
+                     f"CAST(SUM({prefix}.{metric}) AS REAL) / NULLIF(COUNT(DISTINCT CASE WHEN {prefix}.{metric} IS NOT NULL THEN s.session_id END), 0) AS {metric}_mean"]
+    if table == 'products':
+        selected.append("CAST(SUM(t.cart_additions) AS REAL) / NULLIF(SUM(t.interactions), 0) AS conversion")
+
+    source = "sessions s" if table == 'sessions' else f"{table} t JOIN sessions s ON s.session_id = t.session_id"
+    where, parameters = _session_filters(users, layouts, start, end)
+    group_by = f" GROUP BY {', '.join(groups)} ORDER BY {', '.join(groups)}" if groups else ""
+    return query(connection, f"SELECT {', '.join(selected)} FROM {source}{where}{group_by}", parameters)
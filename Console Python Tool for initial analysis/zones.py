@@ -0,0 +1,101 @@
+import numpy as np
+import pandas as pd
+
+# Default zones of interest (ZOIs), ordered from the closest to the farthest from the shelves.
+# Each band is (name, upper distance limit in meters); the last band has no upper limit.
+DEFAULT_ZONE_BANDS = (("Shelf", 0.15), ("Adjacent", 0.325), ("Near", 0.55), ("Far", np.inf))
+
+START_ZONE = "Start"
+
+def make_zone_bands(shelf_limit=0.15, adjacent_limit=0.325, near_limit=0.55):
+    """
+    Builds the default Shelf/Adjacent/Near/Far bands from the three classic distance limits.
+
+    Parameters:
+    shelf_limit (float): Upper distance limit of the Shelf zone.
+    adjacent_limit (float): Upper distance limit of the Adjacent zone.
+    near_limit (float): Upper distance limit of the Near zone.
+
+    Returns:
+    tuple: Ordered (name, upper limit) pairs.
+    """
+    return (("Shelf", shelf_limit), ("Adjacent", adjacent_limit), ("Near", near_limit), ("Far", np.inf))
+
+def validate_zone_bands(bands):
+    """
+    Checks that the bands are named, strictly increasing and that the last one is unbounded.
+
+    Parameters:
+    bands (sequence): Ordered (name, upper limit) pairs.
+
+    Returns:
+    tuple: The band names and the upper limits as a float array.
+    """
+    names = [str(name) for name, _ in bands]
+    limits = np.asarray([limit for _, limit in bands], dtype=float)
+
+    if len(names) == 0:
+        raise ValueError("At least one zone band is required.")
+    if len(set(names)) != len(names) or START_ZONE in names:
+        raise ValueError(f"Zone band names must be unique and different from '{START_ZONE}': {names}")
+    if np.any(np.diff(limits) <= 0):
+        raise ValueError(f"Zone band limits must be strictly increasing: {list(limits)}")
+    if not np.isinf(limits[-1]):
+        # Everything beyond the last limit still needs a zone
+        raise ValueError("The last zone band must have an infinite upper limit.")
+
+    return names, limits
+
+def parse_was_tp(was_tp):
+    """
+    Converts the WasTP column to booleans, whether it was read as bool or as ' True'/' False' strings.
+
+    Parameters:
+    was_tp (pandas.Series): The WasTP column of the teleport data.
+
+    Returns:
+    pandas.Series: Boolean series.
+    """
+    if was_tp.dtype == bool:
+        return was_tp
+    return was_tp.astype(str).str.strip().str.lower() == 'true'
+
+def first_teleport_frame(teleport_data):
+    """
+    Returns the frame of the first successful teleport, or NaN if the user never teleported.
+
+    Parameters:
+    teleport_data (pandas.DataFrame): The DataFrame containing teleport data.
+
+    Returns:
+    float: Frame of the first successful teleport.
+    """
+    return teleport_data.loc[parse_was_tp(teleport_data['WasTP']), 'Frame'].min()
+
+def classify_zones(distance, frame=None, first_tp_frame=np.nan, bands=DEFAULT_ZONE_BANDS):
+    """
+    Labels every sample with the zone of interest given by its distance to the closest shelf.
+    A sample falls in the first band whose upper limit is greater or equal than its distance.
+    Samples recorded before the first successful teleport are labeled as 'Start'.
+
+    Parameters:
+    distance (array-like): Distance of the player to the closest shelf for each sample.
+    frame (array-like, optional): Frame of each sample, needed for the 'Start' rule.
+    first_tp_frame (float, optional): Frame of the first successful teleport.
+    bands (sequence, optional): Ordered (name, upper limit) pairs. Defaults to Shelf/Adjacent/Near/Far.
+
+    Returns:
+    pandas.Categorical: Zone of each sample, with 'Start' followed by the band names as categories.
+    """
+    names, limits = validate_zone_bands(bands)
+    distance = np.asarray(distance, dtype=float)
+
+    # searchsorted(side='left') returns the first band whose limit is >= distance
+    codes = np.searchsorted(limits, distance, side='left') + 1
+    # Missing distances fall in the farthest band, as the original row by row comparison did
+    codes[np.isnan(distance)] = len(names)
+
+    if frame is not None and not pd.isna(first_tp_frame):
+        codes[np.asarray(frame) < first_tp_frame] = 0
+
+    return pd.Categorical.from_codes(codes, categories=[START_ZONE] + names)